@@ -0,0 +1,219 @@
+'''
+Benchmarks the report pipeline on a synthetic dataset (see synthetic_data.py), so that changes to
+the metrics and charts can be measured without access to a real instance.
+
+Each step runs in a fresh process, so that its peak memory use (RSS) is measured on its own.
+Results are saved as JSON; passing a previous results file with --compare reports the steps that
+have become slower, and exits with an error if any of them slowed down past the threshold.
+
+Example:
+    python3 benchmark.py --posts 100000
+    python3 benchmark.py --posts 100000 --compare benchmark/benchmark_results.json
+'''
+
+# Standard Python libraries
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak memory use isn't measured
+    resource = None
+
+# Local libraries
+import reports
+from collector import DATA_DIR
+from knowledge_reuse_metrics import create_kr_metrics
+from sme_index import create_sme_index
+from synthetic_data import generate_data
+from tag_metrics import create_tag_metrics
+from user_metrics import create_user_metrics
+
+BENCHMARK_DIR = 'benchmark'
+RESULTS_FILE = 'benchmark_results.json'
+REGRESSION_THRESHOLD = 0.2  # steps that are more than 20% slower are reported as regressions
+METRIC_STEPS = ['create_tag_metrics', 'create_user_metrics', 'create_kr_metrics']
+CHART_STEPS = ['create_tag_cloud', 'create_tag_bubble_chart', 'create_tag_sme_chart',
+               'create_tag_watcher_chart', 'create_department_charts']
+
+
+def main():
+
+    args = get_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(message)s')
+
+    # The reports read from (and write to) directories relative to the working directory
+    if not os.path.exists(args.directory):
+        os.makedirs(args.directory)
+    os.chdir(args.directory)
+    if args.regenerate or not os.path.exists(os.path.join(DATA_DIR, 'questions.json')):
+        generate_data(DATA_DIR, args.posts, seed=args.seed)
+    else:
+        logging.info(f'Using the existing data in "{args.directory}/{DATA_DIR}"; pass '
+                     '--regenerate to create a new dataset')
+
+    results = run_benchmarks(args.end_to_end)
+    for step, result in results.items():
+        peak_rss = f"{result['peak_rss_mb']} MB" if result['peak_rss_mb'] is not None else 'n/a'
+        logging.info(f"{step:<28} {result['seconds']:>9.2f} s {peak_rss:>12} peak RSS")
+
+    with open(RESULTS_FILE, 'w') as f:
+        json.dump({'data_size': get_data_size(), 'results': results}, f, indent=4)
+    logging.info(f'Results saved to "{args.directory}/{RESULTS_FILE}"')
+
+    if args.compare:
+        compare_results(results, args.compare, args.threshold)
+
+
+def get_args():
+
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the metrics and charts of the report pipeline on a synthetic '
+        'dataset.')
+    parser.add_argument('--posts', type=int, default=10000,
+                        help='Total number of questions, answers, and articles to generate. '
+                        'Default is 10000.')
+    parser.add_argument('--directory', default=BENCHMARK_DIR,
+                        help='Directory for the synthetic data, reports, and results. Default '
+                        f'is "{BENCHMARK_DIR}".')
+    parser.add_argument('--regenerate', action='store_true',
+                        help='Generate a new dataset even if the directory already has one.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed for the synthetic data. Default is 0.')
+    parser.add_argument('--end-to-end', action='store_true',
+                        help='Also benchmark the full `create_reports` pipeline.')
+    parser.add_argument('--compare',
+                        help='Results file of a previous run to compare against. Relative '
+                        'paths are relative to the current directory.')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='Slowdown (as a fraction) reported as a regression. Default is '
+                        f'{REGRESSION_THRESHOLD}.')
+
+    args = parser.parse_args()
+    if args.compare:  # resolve before changing to the benchmark directory
+        args.compare = os.path.abspath(args.compare)
+
+    return args
+
+
+def run_benchmarks(end_to_end=False):
+
+    results = {}
+    metrics = {}
+    for step in METRIC_STEPS:
+        metrics[step], results[step] = run_step(step)
+
+    # Charts are created from the metrics of the previous steps
+    for step in CHART_STEPS:
+        if step == 'create_department_charts':
+            inputs = metrics['create_user_metrics']
+        else:
+            inputs = metrics['create_tag_metrics']
+        _, results[step] = run_step(step, inputs)
+
+    if end_to_end:
+        _, results['create_reports'] = run_step('create_reports')
+
+    return results
+
+
+def run_step(step, inputs=None):
+
+    logging.info(f'Running {step}...')
+    # Processes are spawned rather than forked, so that a step doesn't inherit the memory (or the
+    # imported state) of the benchmark process
+    with ProcessPoolExecutor(max_workers=1,
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        output, seconds, peak_rss_mb = executor.submit(time_step, step, inputs).result()
+
+    return output, {'seconds': round(seconds, 3), 'peak_rss_mb': peak_rss_mb}
+
+
+def time_step(step, inputs=None):
+    # Runs in its own process. Questions and articles are streamed from the JSON files, the
+    # same way `create_reports` reads them.
+
+    reports.AUTO_OPEN_CHARTS = False
+    if not os.path.exists(reports.REPORT_DIR):
+        os.makedirs(reports.REPORT_DIR)
+
+    if step in METRIC_STEPS:
+        tags = reports.read_json('tags', DATA_DIR)
+        users = reports.read_json('users', DATA_DIR)
+        communities = reports.read_json('communities', DATA_DIR)
+        questions = reports.stream_json('questions', DATA_DIR, reports.BODY_FIELDS)
+        articles = reports.stream_json('articles', DATA_DIR, reports.BODY_FIELDS)
+
+    start = time.perf_counter()
+    if step == 'create_tag_metrics':
+        output = create_tag_metrics(questions, articles, tags, communities,
+                                    create_sme_index(tags))
+    elif step == 'create_user_metrics':
+        output = create_user_metrics(users, questions, articles, tags, create_sme_index(tags),
+                                     reports.stream_json('reputation_history', DATA_DIR))
+    elif step == 'create_kr_metrics':
+        output = create_kr_metrics(questions, articles)
+    elif step == 'create_reports':
+        output = reports.create_reports()
+    else:
+        output = getattr(reports, step)(inputs)
+    seconds = time.perf_counter() - start
+
+    return output, seconds, get_peak_rss_mb()
+
+
+def get_peak_rss_mb():
+
+    if resource is None:
+        return None
+
+    # ru_maxrss is in kilobytes on Linux, but in bytes on MacOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss /= 1024
+
+    return round(peak_rss / 1024, 1)
+
+
+def get_data_size():
+
+    # Size of the dataset (in bytes), so results are only compared between the same datasets
+    return sum(os.path.getsize(os.path.join(DATA_DIR, f'{name}.json'))
+               for name in ('questions', 'articles', 'users', 'tags'))
+
+
+def compare_results(results, previous_results_file, threshold):
+
+    with open(previous_results_file, 'r') as f:
+        previous = json.load(f)
+
+    regressions = []
+    for step, result in results.items():
+        previous_result = previous['results'].get(step)
+        if not previous_result or not previous_result['seconds']:
+            continue
+
+        change = result['seconds'] / previous_result['seconds'] - 1
+        logging.info(f"{step:<28} {change:>+8.0%} time compared to the previous results")
+        if change > threshold:
+            regressions.append(step)
+
+    if previous.get('data_size') != get_data_size():
+        logging.warning('The previous results were measured on a different dataset, so they '
+                        'may not be comparable')
+
+    if regressions:
+        logging.error(f"{len(regressions)} step(s) are more than {threshold:.0%} slower than "
+                      f"the previous results: {', '.join(regressions)}")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,168 @@
+# Standard Python libraries
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+
+class Checkpoint(object):
+    def __init__(self, directory, resume=False, options=None):
+        """
+        Tracks the progress of a collection run on disk, so that a run that fails part of the
+        way through can be resumed instead of starting over.
+
+        Progress is recorded at two levels:
+        * Stages (e.g. questions, tags, users): the data of each completed stage is saved, and
+            the run manifest (manifest.json) records which stages are complete
+        * Pages and items within a stage: each page received from a paginated API v2.3 endpoint,
+            and the SMEs of each tag, are saved as soon as they're received. A stage's pages
+            are deleted once the stage's data is saved.
+
+        Args:
+            directory (str): directory where checkpoint data is stored
+            resume (bool): if True, continue from the checkpoint data of a previous run;
+                otherwise, any previous checkpoint data is discarded
+            options (dict): collection options of the run; checkpoint data from a run with
+                different options is not resumed
+        """
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self.lock = threading.Lock()
+        self.local = threading.local()  # the stage running in the current thread
+        self.stage_page_keys = {}  # stage -> keys of the pages saved while it ran
+        options = options or {}
+
+        manifest = self.read_file(self.manifest_path) if resume else None
+        if manifest and manifest.get('options') != options:
+            logging.warning("Collection options differ from the run being resumed. "
+                            "Starting a new run instead.")
+            manifest = None
+
+        if manifest:
+            logging.info(f"Resuming collection run started at {manifest['started']}. "
+                         f"Completed stages: {', '.join(manifest['completed_stages']) or 'none'}")
+        else:
+            self.clear()
+            manifest = {
+                'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'options': options,
+                'completed_stages': []
+            }
+        self.manifest = manifest
+        os.makedirs(self.directory, exist_ok=True)
+        self.write_file(self.manifest_path, self.manifest)
+
+    def is_complete(self, stage):
+
+        return stage in self.manifest['completed_stages']
+
+    def load_stage(self, stage):
+
+        logging.info(f"Stage '{stage}' was completed in a previous run; loading saved data")
+        return self.read_file(self.stage_path(stage))
+
+    def start_stage(self, stage):
+
+        # Pages requested from this thread from now on belong to the stage
+        self.local.stage = stage
+
+    def complete_stage(self, stage, data):
+
+        self.write_file(self.stage_path(stage), data)
+        with self.lock:
+            self.manifest['completed_stages'].append(stage)
+            self.write_file(self.manifest_path, self.manifest)
+            page_keys = self.stage_page_keys.pop(stage, set())
+
+        # The stage's data includes the items of its pages, so the pages are no longer needed;
+        # otherwise, every question would be stored on disk once more while the run continues
+        for key in page_keys:
+            shutil.rmtree(os.path.join(self.directory, 'pages', key), ignore_errors=True)
+
+    def stage_path(self, stage):
+
+        return os.path.join(self.directory, f'{stage}.json')
+
+    def page_key(self, endpoint_url, params):
+
+        # Pages are grouped by request: the same endpoint with the same parameters (other than
+        # the page number) is the same dataset
+        request = json.dumps([endpoint_url, {key: value for key, value in params.items()
+                                             if key != 'page'}], sort_keys=True)
+        key = hashlib.sha1(request.encode()).hexdigest()
+
+        stage = getattr(self.local, 'stage', None)
+        if stage is not None:
+            with self.lock:
+                self.stage_page_keys.setdefault(stage, set()).add(key)
+
+        return key
+
+    def save_page(self, key, page, response_data):
+
+        page_dir = os.path.join(self.directory, 'pages', key)
+        os.makedirs(page_dir, exist_ok=True)
+        self.write_file(os.path.join(page_dir, f'{page}.json'), {
+            'items': response_data.get('items', []),
+            'has_more': response_data.get('has_more', False)
+        })
+
+    def load_pages(self, key):
+
+        page_dir = os.path.join(self.directory, 'pages', key)
+        if not os.path.exists(page_dir):
+            return {}
+
+        pages = {}
+        for file_name in os.listdir(page_dir):
+            if file_name.endswith('.json'):
+                pages[int(file_name[:-len('.json')])] = self.read_file(
+                    os.path.join(page_dir, file_name))
+        if pages:
+            logging.info(f"Loaded {len(pages)} pages saved by a previous run")
+
+        return pages
+
+    def save_item(self, group, item_id, data):
+
+        item_dir = os.path.join(self.directory, group)
+        os.makedirs(item_dir, exist_ok=True)
+        self.write_file(os.path.join(item_dir, f'{item_id}.json'), data)
+
+    def load_item(self, group, item_id):
+
+        return self.read_file(os.path.join(self.directory, group, f'{item_id}.json'))
+
+    def item_ids(self, group):
+
+        # IDs are returned as strings, as they're read from the file names
+        item_dir = os.path.join(self.directory, group)
+        if not os.path.exists(item_dir):
+            return set()
+
+        return {file_name[:-len('.json')] for file_name in os.listdir(item_dir)
+                if file_name.endswith('.json')}
+
+    def clear(self):
+
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+
+    def write_file(self, file_path, data):
+
+        # Write to a temporary file first, so an interrupted write can't leave a partial file
+        temp_path = f'{file_path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, file_path)
+
+    def read_file(self, file_path):
+
+        try:
+            with open(file_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
@@ -1,19 +1,93 @@
 # Native Python Libraries
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+import json
+import logging
 import os
+import textwrap
+import time
 
 # Open Source Libraries
 from so4t_api import StackClient
 
 # Local Libraries
 # from api_config import BASE_URL, API_KEY, API_TOKEN, PROXY_URL
+from checkpoint import Checkpoint
+from columnar import export_to_parquet
 from so4t_api_v2 import V2Client
+from sqlite_store import upsert_api_data
+from throttle import Throttle, ThrottledAdapter
 
 DATA_DIR = 'data'
+STATE_FILE = 'collection_state.json'  # high-water marks for incremental collection
+CHECKPOINT_DIR = os.path.join(DATA_DIR, 'checkpoints')  # progress of the current run
+API_CALLS_PER_SECOND = 20  # shared across all workers and both API clients
+API_MAX_RETRIES = 3  # for transient failures (connection errors, HTTP 429/5xx, throttling)
+STAGE_WORKERS = 4  # collection stages (e.g. questions, tags, users) that can run at once
+
+# Fields requested by the metrics-only collection profile: only what's needed to calculate tag,
+# user, and knowledge reuse metrics (no post bodies or markdown). These are used with a filter
+# base of 'none', so the response wrapper fields must be included as well.
+# Filter documentation: https://api.stackexchange.com/docs/filters
+WRAPPER_FILTER_ATTRIBUTES = [
+    ".backoff",
+    ".error_id",
+    ".error_message",
+    ".error_name",
+    ".has_more",
+    ".items",
+    ".quota_max",
+    ".quota_remaining",
+]
+OWNER_FILTER_ATTRIBUTES = [
+    "shallow_user.display_name",
+    "shallow_user.user_id",
+]
+QUESTION_METRICS_FILTER_ATTRIBUTES = WRAPPER_FILTER_ATTRIBUTES + OWNER_FILTER_ATTRIBUTES + [
+    "answer.answer_id",
+    "answer.comments",
+    "answer.creation_date",
+    "answer.down_vote_count",
+    "answer.is_accepted",
+    "answer.owner",
+    "answer.question_id",
+    "answer.up_vote_count",
+    "comment.comment_id",
+    "comment.creation_date",
+    "comment.owner",
+    "comment.post_id",
+    "question.answer_count",
+    "question.answers",
+    "question.comment_count",
+    "question.comments",
+    "question.creation_date",
+    "question.down_vote_count",
+    "question.last_activity_date",
+    "question.link",
+    "question.owner",
+    "question.question_id",
+    "question.tags",
+    "question.up_vote_count",
+    "question.view_count",
+]
+ARTICLE_METRICS_FILTER_ATTRIBUTES = WRAPPER_FILTER_ATTRIBUTES + OWNER_FILTER_ATTRIBUTES + [
+    "article.article_id",
+    "article.comment_count",
+    "article.creation_date",
+    "article.last_activity_date",
+    "article.link",
+    "article.owner",
+    "article.score",
+    "article.tags",
+    "article.view_count",
+]
 load_dotenv()  # load environment variables from file (if any)
 
 
-def collector():
+def collector(page_workers=1, sme_workers=1, lookup_workers=1, incremental=False,
+              metrics_only=False, sqlite=False, from_date=None, to_date=None, resume=False,
+              stage_workers=STAGE_WORKERS):
 
     try:
         url = os.environ['SO_URL']
@@ -33,36 +107,224 @@ def collector():
             key = input('Enter your API key: ')
         proxy_url = input('Enter the proxy URL (leave blank if not needed): ')
 
-    # Instantiate API and database (DB) clients
-    v2client = V2Client(url, token=token, key=key,
-                        proxy=proxy_url)
+    # For incremental runs, only questions and articles with activity since the last run are
+    # requested; they're merged into the data from previous runs further below
+    if incremental:
+        previous_data, high_water_marks = get_previous_collection()
+    else:
+        previous_data, high_water_marks = {}, {}
+
+    # Progress is saved to disk as data is received; with `resume`, a run picks up where an
+    # interrupted run with the same options stopped
+    checkpoint = Checkpoint(CHECKPOINT_DIR, resume, options={
+        'high_water_marks': high_water_marks,
+        'metrics_only': metrics_only,
+        'from_date': from_date,
+        'to_date': to_date
+    })
+
+    # Instantiate API and database (DB) clients. Both clients send their calls through a single
+    # throttle, so their combined request rate stays within the budget and a backoff request
+    # received by either of them pauses both. Connection pools are sized for every stage that
+    # can be running at once.
+    throttle = Throttle(API_CALLS_PER_SECOND, max_retries=API_MAX_RETRIES)
+    v2client = V2Client(url, token=token, key=key, proxy=proxy_url,
+                        pool_size=max(10, page_workers * stage_workers), page_workers=page_workers,
+                        checkpoint=checkpoint, throttle=throttle)
     v3client = StackClient(url, token=token, proxy=proxy_url)
-
-    # Get API data from v2 and v3 clients
-    # and store them in them in new, temporary collections in the database
-    api_data = {
-        "questions": get_questions_answers_comments(v2client),  # also gets answers/comments
-        "articles": get_articles(v2client),
-        "tags": get_tags(v3client),  # also gets tag SMEs
-        "users": get_users(v2client, v3client),
-        "user_groups": get_user_groups(v3client),
-        "communities": get_communities(v3client),
-        "collections": get_collections(v3client),
+    v3_pool_size = sme_workers + lookup_workers + stage_workers
+    v3client.s.mount('https://', ThrottledAdapter(throttle, pool_connections=v3_pool_size,
+                                                  pool_maxsize=v3_pool_size))
+
+    # Get API data from v2 and v3 clients. Each stage is the name of its dataset, the function
+    # that collects it, its arguments, and the stages whose data it needs (added to the end of
+    # its arguments).
+    stages = {
+        "questions": (  # also gets answers/comments
+            get_questions_answers_comments, (v2client, high_water_marks.get('questions'),
+                                             metrics_only, from_date, to_date), []),
+        "articles": (get_articles, (v2client, high_water_marks.get('articles'), metrics_only,
+                                    from_date, to_date), []),
+        "tags": (get_tags, (v3client, sme_workers, checkpoint), []),  # also gets tag SMEs
+        "users": (get_users, (v2client, v3client, lookup_workers, checkpoint), []),
+        "user_groups": (get_user_groups, (v3client,), []),
+        "communities": (get_communities, (v3client,), []),
+        "collections": (get_collections, (v3client,), []),
+        "reputation_history": (get_reputation_history, (v2client, checkpoint), ['users']),
     }
-    api_data['reputation_history'] = get_reputation_history(v2client, api_data['users']),
+    api_data = asyncio.run(run_stages(checkpoint, stages, stage_workers))
+
+    # Reputation history can be very large, so it isn't held in memory: each batch is saved to
+    # the checkpoint as it's received, and it's streamed from there when it's stored
+    del api_data['reputation_history']
+
+    # Only new or updated items need to be upserted into the SQLite database, so this is done
+    # before they're merged with the data from previous runs. Datasets that weren't collected
+    # incrementally are complete, so anything else in the database has been deleted.
+    if sqlite:
+        complete_datasets = ['users'] + [name for name in ['questions', 'articles']
+                                         if not high_water_marks.get(name)]
+        upsert_api_data(dict(api_data, reputation_history=stream_reputation_history(
+            checkpoint, api_data['users'])), DATA_DIR, complete_datasets, from_date, to_date)
+
+    for name, id_field in [('questions', 'question_id'), ('articles', 'article_id')]:
+        if previous_data.get(name):
+            api_data[name] = merge_items(previous_data[name], api_data[name], id_field)
 
     # Store the API data in JSON files
     for name, data in api_data.items():
         v3client.export_to_json(name, data, DATA_DIR)
+    export_items_to_json('reputation_history',
+                         stream_reputation_history(checkpoint, api_data['users']), DATA_DIR)
+
+    # Also store questions, answers, comments, and articles as flat columnar tables,
+    # which are much faster to load when creating reports
+    export_to_parquet(api_data, DATA_DIR)
+
+    save_high_water_marks(api_data, from_date, to_date)
+
+    # The run is complete, so its checkpoint data is no longer needed
+    checkpoint.clear()
+
+    v2client.log_pool_stats()
+
+
+async def run_stages(checkpoint, stages, stage_workers):
+
+    # Stages run at the same time (once any stages they depend on have finished), up to
+    # `stage_workers` at once; the API clients are blocking, so each stage runs in a worker
+    # thread. Wall-clock time then approaches that of the slowest stage, rather
+    # than the sum of all of them, while the shared throttle keeps the overall request rate
+    # within the budget.
+    semaphore = asyncio.Semaphore(stage_workers)
+    tasks = {}
+    failed = []
+
+    async def run(stage, function, args, dependencies):
+        for dependency in dependencies:
+            args += (await tasks[dependency],)
+
+        async with semaphore:
+            if failed:  # once a stage has failed, no new stages are started
+                return None
+            start_time = time.perf_counter()
+            try:
+                data = await asyncio.to_thread(run_stage, checkpoint, stage, function, *args)
+            except Exception:
+                logging.error(f"Collection stage '{stage}' failed")
+                failed.append(stage)
+                raise
+            logging.info(f"Collection stage '{stage}' finished in "
+                         f"{time.perf_counter() - start_time:.1f} seconds")
+
+        return data
+
+    for stage, (function, args, dependencies) in stages.items():
+        tasks[stage] = asyncio.create_task(run(stage, function, args, dependencies))
+
+    # Results are returned in the order the stages are listed, regardless of when they finish.
+    # If a stage fails, stages that haven't started are skipped, and stages that are already
+    # running are allowed to finish (and are saved to the checkpoint) before the error is raised.
+    try:
+        results = await asyncio.gather(*tasks.values())
+    except Exception:
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+
+    return dict(zip(tasks.keys(), results))
+
+
+def run_stage(checkpoint, stage, function, *args):
+
+    # Stages completed by a previous run (when resuming) are loaded from disk instead
+    if checkpoint.is_complete(stage):
+        return checkpoint.load_stage(stage)
+
+    checkpoint.start_stage(stage)
+    data = function(*args)
+    checkpoint.complete_stage(stage, data)
+
+    return data
+
+
+def get_previous_collection():
+
+    # The high-water mark of a dataset is the most recent `last_activity_date` seen in it.
+    # A dataset is only collected incrementally if both its data file and its high-water mark
+    # are available; otherwise, it's collected in full.
+    # Note: edits, answers, and accepted answers update `last_activity_date`, but votes and page
+    # views do not, so periodic full collections are still needed to refresh those counts.
+    state = read_data_file(STATE_FILE) or {}
+
+    previous_data = {}
+    high_water_marks = {}
+    for name in ['questions', 'articles']:
+        data = read_data_file(f'{name}.json')
+        if data is not None and state.get(name):
+            previous_data[name] = data
+            high_water_marks[name] = state[name]
+            logging.info(f"Collecting {name} with activity since {state[name]}")
+        else:
+            logging.info(f"No previous collection found for {name}; collecting all {name}")
+
+    return previous_data, high_water_marks
+
+
+def merge_items(previous_items, new_items, id_field):
+
+    # Items are keyed by ID; updated items replace their previous version in place and new
+    # items are added to the end
+    merged_items = {item[id_field]: item for item in previous_items}
+    for item in new_items:
+        merged_items[item[id_field]] = item
+
+    logging.info(f"Merged {len(new_items)} new or updated items into {len(previous_items)} "
+                 f"existing items ({len(merged_items)} total)")
+
+    return list(merged_items.values())
+
 
+def save_high_water_marks(api_data, from_date=None, to_date=None):
 
-def get_questions_answers_comments(v2client):
+    # When a date range was specified, the data files only hold the questions and articles of that
+    # range, so there's nothing to build on: no high-water marks are saved (and any from previous
+    # runs are discarded), which makes the next incremental run collect everything
+    state = {}
+    if from_date or to_date:
+        logging.info("Questions and articles were collected for a date range; the next "
+                     "incremental run will collect them in full")
+    else:
+        for name in ['questions', 'articles']:
+            activity_dates = [item['last_activity_date'] for item in api_data[name]
+                              if item.get('last_activity_date')]
+            if activity_dates:
+                state[name] = max(activity_dates)
+
+    file_path = os.path.join(DATA_DIR, STATE_FILE)
+    with open(file_path, 'w') as f:
+        json.dump(state, f, indent=4)
+
+
+def read_data_file(file_name):
+
+    file_path = os.path.join(DATA_DIR, file_name)
+    try:
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def get_questions_answers_comments(v2client, min_activity_date=None, metrics_only=False,
+                                   from_date=None, to_date=None):
 
     # The API filter used for the /questions endpoint makes it so that the API returns
     # all answers and comments for each question. This is more efficient than making
     # separate API calls for answers and comments.
     # Filter documentation: https://api.stackexchange.com/docs/filters
-    if v2client.soe:  # Stack Overflow Enterprise requires the generation of a custom filter
+    if metrics_only:  # skip bodies and other fields that aren't used by any metric
+        filter_string = v2client.create_filter(QUESTION_METRICS_FILTER_ATTRIBUTES, base='none')
+    elif v2client.soe:  # Stack Overflow Enterprise requires the generation of a custom filter
         filter_attributes = [
             "answer.body",
             "answer.body_markdown",
@@ -91,14 +353,17 @@ def get_questions_answers_comments(v2client):
         filter_string = v2client.create_filter(filter_attributes)
     else:  # Stack Overflow Business or Basic
         filter_string = '!X9DEEiFwy0OeSWoJzb.QMqab2wPSk.X2opZDa2L'
-    questions = v2client.get_all_questions(filter_string)
+    questions = v2client.get_all_questions(filter_string, min_activity_date, from_date, to_date)
 
     return questions
 
 
-def get_articles(v2client):
+def get_articles(v2client, min_activity_date=None, metrics_only=False, from_date=None,
+                 to_date=None):
 
-    if v2client.soe:
+    if metrics_only:  # skip bodies and other fields that aren't used by any metric
+        filter_string = v2client.create_filter(ARTICLE_METRICS_FILTER_ATTRIBUTES, base='none')
+    elif v2client.soe:
         filter_attributes = [
             "article.body",
             "article.body_markdown",
@@ -113,31 +378,60 @@ def get_articles(v2client):
     else:  # Stack Overflow Business or Basic
         filter_string = '!*Mg4Pjg9LXr9d_(v'
 
-    articles = v2client.get_all_articles(filter_string)
+    articles = v2client.get_all_articles(filter_string, min_activity_date, from_date, to_date)
 
     return articles
 
 
-def get_tags(v3client):
+def get_tags(v3client, sme_workers=1, checkpoint=None):
 
     # While API v2 is more robust for collecting tag data, it does not return the tag ID field,
     # which is needed to get the SMEs for each tag. Therefore, API v3 is used to get the tag ID
     tags = v3client.get_tags()
 
     # Get subject matter experts (SMEs) for each tag. This API call is only available in v3.
-    # There's no way to get SME configurations in bulk, so this call must be made for each tag,
-    # making it a bit slower to get through.
-    # FUTURE WORK: implementing some form of concurrency would speed this up.
+    # There's no way to get SME configurations in bulk, so this call must be made for each tag.
+    # To speed this up, the calls are spread across a pool of workers; the API client's throttle
+    # is shared by all of them, so adding workers does not increase the request rate beyond the
+    # budget.
+    sme_tags = [tag for tag in tags if tag['subjectMatterExpertCount'] > 0]
+    logging.info(f"Getting SMEs for {len(sme_tags)} tags using {sme_workers} workers...")
+
+    with ThreadPoolExecutor(max_workers=sme_workers) as executor:
+        tag_smes = executor.map(
+            lambda tag: get_tag_smes(v3client, tag['id'], checkpoint), sme_tags)
+        for tag, smes in zip(sme_tags, tag_smes):
+            tag['smes'] = smes
+
     for tag in tags:
-        if tag['subjectMatterExpertCount'] > 0:
-            tag['smes'] = v3client.get_tag_smes(tag['id'])
-        else:
+        if tag['subjectMatterExpertCount'] == 0:
             tag['smes'] = {'users': [], 'userGroups': []}
 
     return tags
 
 
-def get_users(v2client, v3client):
+def get_tag_smes(v3client, tag_id, checkpoint=None):
+
+    # SMEs of each tag are saved as they're received, so they don't need to be requested again
+    # if the run is interrupted and resumed
+    if checkpoint:
+        smes = checkpoint.load_item('tag_smes', tag_id)
+        if smes is not None:
+            return smes
+
+    # Transient failures are retried by the API client's throttled session
+    try:
+        smes = v3client.get_tag_smes(tag_id)
+    except Exception as e:
+        logging.error(f"Unable to get SMEs for tag ID {tag_id}: {e}")
+        raise
+    if checkpoint:
+        checkpoint.save_item('tag_smes', tag_id, smes)
+
+    return smes
+
+
+def get_users(v2client, v3client, lookup_workers=1, checkpoint=None):
 
     # Filter documentation: https://api.stackexchange.com/docs/filters
     if 'soedemo' in v2client.api_url:  # for internal testing
@@ -160,45 +454,115 @@ def get_users(v2client, v3client):
 
     v3_users = v3client.get_users()
 
-    # Add additional user data from API v3 to user data from API v2
+    # Add additional user data from API v3 to user data from API v2, joining them on user ID
     # API v3 fields to add: 'email', 'jobTitle', 'department', 'externalId, 'role'
+    start_time = time.perf_counter()
+    v3_users_by_id = {v3_user['id']: v3_user for v3_user in v3_users}
+    missing_users = []
     for user in v2_users:
-        for v3_user in v3_users:
-            if user['user_id'] == v3_user['id']:
-                user['email'] = v3_user['email']
-                user['title'] = v3_user['jobTitle']
-                user['department'] = v3_user['department']
-                user['external_id'] = v3_user['externalId']
-                if v3_user['role'] == 'Moderator':
-                    user['moderator'] = True
-                else:
-                    user['moderator'] = False
-                break
-        try:
-            user['moderator']
-        except KeyError:  # if user is not found in v3 data, it means they're a deactivated user
-            # API v3 data can be obtained for deactivated users; it requires a separate API call
-            v3_user = v3client.get_user_by_id(user['user_id'])
-            user['email'] = v3_user['email']
-            user['title'] = v3_user['jobTitle']
-            user['department'] = v3_user['department']
-            user['external_id'] = v3_user['externalId']
-            user['is_deactivated'] = True
-
-            if v3_user['role'] == 'Moderator':
-                user['moderator'] = True
-            else:
-                user['moderator'] = False
+        v3_user = v3_users_by_id.get(user['user_id'])
+        if v3_user:
+            add_v3_user_fields(user, v3_user)
+        else:
+            missing_users.append(user)
+    logging.info(f"Joined {len(v2_users)} API v2 users with {len(v3_users)} API v3 users in "
+                 f"{time.perf_counter() - start_time:.2f} seconds")
+
+    # If a user is not found in v3 data, it means they're a deactivated user
+    # API v3 data can be obtained for deactivated users; it requires a separate API call for
+    # each user, so these calls are spread across a pool of workers
+    if missing_users:
+        start_time = time.perf_counter()
+        logging.info(f"Getting API v3 data for {len(missing_users)} deactivated users using "
+                     f"{lookup_workers} workers...")
+        with ThreadPoolExecutor(max_workers=lookup_workers) as executor:
+            v3_missing_users = executor.map(
+                lambda user: get_deactivated_user(v3client, user['user_id'], checkpoint),
+                missing_users)
+            for user, v3_user in zip(missing_users, v3_missing_users):
+                add_v3_user_fields(user, v3_user, deactivated=True)
+        logging.info(f"Got API v3 data for {len(missing_users)} deactivated users in "
+                     f"{time.perf_counter() - start_time:.1f} seconds")
 
     return v2_users
 
 
-def get_reputation_history(v2client, users):
+def get_deactivated_user(v3client, user_id, checkpoint=None):
+
+    # Deactivated users are saved as they're received, so they don't need to be requested again
+    # if the run is interrupted and resumed
+    if checkpoint:
+        v3_user = checkpoint.load_item('deactivated_users', user_id)
+        if v3_user is not None:
+            return v3_user
+
+    v3_user = v3client.get_user_by_id(user_id)
+    if checkpoint:
+        checkpoint.save_item('deactivated_users', user_id, v3_user)
+
+    return v3_user
+
+
+def add_v3_user_fields(user, v3_user, deactivated=False):
+
+    user['email'] = v3_user['email']
+    user['title'] = v3_user['jobTitle']
+    user['department'] = v3_user['department']
+    user['external_id'] = v3_user['externalId']
+    if deactivated:
+        user['is_deactivated'] = True
+    if v3_user['role'] == 'Moderator':
+        user['moderator'] = True
+    else:
+        user['moderator'] = False
+
+
+def get_reputation_history(v2client, checkpoint, users):
+
+    # Each batch is saved under the ID of its first user. Users in batches saved by a previous
+    # (interrupted) run are skipped.
+    saved_user_ids = set()
+    for batch in saved_reputation_batches(checkpoint, users):
+        saved_user_ids.update(batch['user_ids'])
+    user_ids = [user['user_id'] for user in users if user['user_id'] not in saved_user_ids]
+
+    item_count = 0
+    for batch, items in v2client.get_reputation_history_batches(user_ids):
+        checkpoint.save_item('reputation_history', batch[0], {'user_ids': batch, 'items': items})
+        item_count += len(items)
+    logging.info(f"Received {item_count} reputation history events for {len(user_ids)} users")
+
+
+def stream_reputation_history(checkpoint, users):
+
+    for batch in saved_reputation_batches(checkpoint, users):
+        yield from batch['items']
+
+
+def saved_reputation_batches(checkpoint, users):
+
+    # Batches are saved under the ID of their first user. The saved IDs are listed once, so
+    # only the batch files are read (rather than looking for a file for every user), one at a
+    # time and in the order of the users.
+    batch_ids = checkpoint.item_ids('reputation_history')
+    for user in users:
+        if str(user['user_id']) in batch_ids:
+            yield checkpoint.load_item('reputation_history', user['user_id'])
+
 
-    user_ids = [user['user_id'] for user in users]
-    reputation_history = v2client.get_reputation_history(user_ids)
+def export_items_to_json(name, items, directory):
 
-    return reputation_history
+    # Writes the same JSON as `export_to_json`, one item at a time, so that the items never
+    # need to be held in memory at once
+    file_path = os.path.join(directory, f'{name}.json')
+    item_count = 0
+    with open(file_path, 'w') as f:
+        f.write('[')
+        for item in items:
+            f.write(',\n' if item_count else '\n')
+            f.write(textwrap.indent(json.dumps(item, indent=4), '    '))
+            item_count += 1
+        f.write('\n]' if item_count else ']')
 
 
 def get_user_groups(v3client):
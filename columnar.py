@@ -0,0 +1,277 @@
+# Standard Python libraries
+import itertools
+import logging
+import os
+
+# Third-party libraries
+import numpy as np
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # columnar storage is optional; JSON is always written
+    pa = None
+    pq = None
+
+ROW_GROUP_SIZE = 10000  # rows per row group; a row group is the most that's read at once
+ROW_BATCH_SIZE = 1000  # rows decoded at a time when the tables are streamed
+
+# Questions and articles are normalized into flat tables keyed by IDs, one row per question,
+# answer, comment, or article. Users aren't stored here, as the reports load them from
+# users.json along with the other small datasets. Owners are flattened to `owner_id` and
+# `owner_display_name`; `owner_id` is null when the owner has been deleted.
+if pa:
+    SCHEMAS = {
+        'questions': pa.schema([
+            ('question_id', pa.int64()),
+            ('owner_id', pa.int64()),
+            ('owner_display_name', pa.string()),
+            ('creation_date', pa.int64()),
+            ('last_activity_date', pa.int64()),
+            ('view_count', pa.int64()),
+            ('up_vote_count', pa.int64()),
+            ('down_vote_count', pa.int64()),
+            ('answer_count', pa.int64()),
+            ('comment_count', pa.int64()),
+            ('link', pa.string()),
+            ('tags', pa.list_(pa.string())),
+        ]),
+        'answers': pa.schema([
+            ('answer_id', pa.int64()),
+            ('question_id', pa.int64()),
+            ('owner_id', pa.int64()),
+            ('owner_display_name', pa.string()),
+            ('creation_date', pa.int64()),
+            ('is_accepted', pa.bool_()),
+            ('up_vote_count', pa.int64()),
+            ('down_vote_count', pa.int64()),
+        ]),
+        'comments': pa.schema([
+            ('comment_id', pa.int64()),
+            ('post_id', pa.int64()),
+            ('post_type', pa.string()),  # 'question' or 'answer'
+            ('question_id', pa.int64()),
+            ('owner_id', pa.int64()),
+            ('owner_display_name', pa.string()),
+            ('creation_date', pa.int64()),
+        ]),
+        'articles': pa.schema([
+            ('article_id', pa.int64()),
+            ('owner_id', pa.int64()),
+            ('owner_display_name', pa.string()),
+            ('creation_date', pa.int64()),
+            ('last_activity_date', pa.int64()),
+            ('view_count', pa.int64()),
+            ('score', pa.int64()),
+            ('comment_count', pa.int64()),
+            ('link', pa.string()),
+            ('tags', pa.list_(pa.string())),
+        ]),
+    }
+
+    # Columns read when questions and articles are streamed for the tag and user metrics. IDs
+    # are only read where they're needed to match answers and comments to their posts.
+    STREAM_COLUMNS = {
+        'questions': ['question_id', 'owner_id', 'owner_display_name', 'creation_date',
+                      'view_count', 'up_vote_count', 'down_vote_count', 'answer_count',
+                      'comment_count', 'tags'],
+        'answers': ['answer_id', 'question_id', 'owner_id', 'owner_display_name',
+                    'creation_date', 'is_accepted', 'up_vote_count', 'down_vote_count'],
+        'comments': ['post_id', 'post_type', 'owner_id', 'owner_display_name', 'creation_date'],
+        'articles': ['owner_id', 'owner_display_name', 'creation_date', 'view_count', 'score',
+                     'comment_count', 'tags'],
+    }
+
+
+def export_to_parquet(api_data, directory):
+
+    if pa is None:
+        logging.info("pyarrow is not installed; skipping the columnar (Parquet) data export")
+        return
+
+    tables = flatten_questions(api_data['questions'])
+    tables['articles'] = [flatten_post(article) for article in api_data['articles']]
+
+    for name, rows in tables.items():
+        schema = SCHEMAS[name]
+        rows = [{column: row.get(column) for column in schema.names} for row in rows]
+        table = pa.Table.from_pylist(rows, schema=schema)
+        file_path = os.path.join(directory, f'{name}.parquet')
+        pq.write_table(table, file_path, row_group_size=ROW_GROUP_SIZE)
+        logging.info(f"Columnar data file created: {file_path} ({table.num_rows} rows)")
+
+
+def flatten_questions(questions):
+
+    # Rows are added in the same order as the nested data, so the order of answers and comments
+    # within a question (e.g. which answer came first) is preserved when it's rebuilt
+    tables = {'questions': [], 'answers': [], 'comments': []}
+    for question in questions:
+        tables['questions'].append(flatten_post(question))
+        for comment in question.get('comments', []):
+            tables['comments'].append(dict(flatten_post(comment), post_id=question['question_id'],
+                                           post_type='question',
+                                           question_id=question['question_id']))
+
+        for answer in question.get('answers', []):
+            tables['answers'].append(dict(flatten_post(answer),
+                                          question_id=question['question_id']))
+            for comment in answer.get('comments', []):
+                tables['comments'].append(dict(flatten_post(comment), post_id=answer['answer_id'],
+                                               post_type='answer',
+                                               question_id=question['question_id']))
+
+    return tables
+
+
+def flatten_post(post):
+
+    row = {key: value for key, value in post.items()
+           if key not in ('owner', 'answers', 'comments')}
+    row['owner_id'] = post['owner'].get('user_id')
+    row['owner_display_name'] = post['owner'].get('display_name')
+
+    return row
+
+
+def columnar_data_is_current(directory):
+    """Checks whether the columnar data files exist and were written after the JSON data files,
+    so that data from a previous collection isn't used by mistake.
+
+    Args:
+        directory (str): directory of the data files
+
+    Returns:
+        bool: True if the columnar data can be used instead of the JSON data
+    """
+    if pa is None:
+        return False
+
+    for name in ['questions', 'answers', 'comments', 'articles']:
+        parquet_path = os.path.join(directory, f'{name}.parquet')
+        if not os.path.exists(parquet_path):
+            return False
+
+    for name in ['questions', 'articles']:
+        json_path = os.path.join(directory, f'{name}.json')
+        parquet_path = os.path.join(directory, f'{name}.parquet')
+        if os.path.exists(json_path) and \
+                os.path.getmtime(json_path) > os.path.getmtime(parquet_path):
+            return False
+
+    return True
+
+
+def read_parquet(name, directory, columns=None):
+
+    # Memory-mapping avoids copying the file into memory before it's decoded
+    file_path = os.path.join(directory, f'{name}.parquet')
+    return pq.read_table(file_path, columns=columns, memory_map=True)
+
+
+def stream_questions(directory):
+    """
+    Rebuilds questions, with their answers and comments nested, from the columnar tables.
+
+    The tables are read in batches of rows rather than all at once, so only the question being
+    rebuilt is held in memory. This relies on the answers and comments tables being in the same
+    order as the questions table, which is how `flatten_questions` writes them: the answers of
+    each question in turn, and the comments of each question followed by those of its answers.
+    """
+    answer_groups = itertools.groupby(read_rows('answers', directory),
+                                      key=lambda row: row['question_id'])
+    comment_groups = itertools.groupby(read_rows('comments', directory),
+                                       key=lambda row: (row['post_type'], row['post_id']))
+    next_answers = next(answer_groups, None)
+    next_comments = next(comment_groups, None)
+
+    for question in read_rows('questions', directory):
+        question = nest_owner(question)
+        if next_comments and next_comments[0] == ('question', question['question_id']):
+            question['comments'] = [nest_comment(row) for row in next_comments[1]]
+            next_comments = next(comment_groups, None)
+
+        if next_answers and next_answers[0] == question['question_id']:
+            answers = [nest_owner(row) for row in next_answers[1]]
+            next_answers = next(answer_groups, None)
+            for answer in answers:
+                if next_comments and next_comments[0] == ('answer', answer['answer_id']):
+                    answer['comments'] = [nest_comment(row) for row in next_comments[1]]
+                    next_comments = next(comment_groups, None)
+            question['answers'] = answers
+
+        yield question
+
+    # Rows left over mean that the tables weren't written in the same order, and answers or
+    # comments were missed
+    if next_answers or next_comments:
+        raise ValueError(f"The columnar data in {directory} is out of order. Delete the "
+                         ".parquet files to create reports from the JSON data instead.")
+
+
+def stream_articles(directory):
+
+    for article in read_rows('articles', directory):
+        yield nest_owner(article)
+
+
+def read_rows(name, directory):
+
+    # Only the columns the metrics need are read, and they're decoded one batch of rows at a
+    # time, so a table is never converted to objects all at once
+    file_path = os.path.join(directory, f'{name}.parquet')
+    parquet_file = pq.ParquetFile(file_path, memory_map=True)
+    for batch in parquet_file.iter_batches(batch_size=ROW_BATCH_SIZE,
+                                           columns=STREAM_COLUMNS[name]):
+        yield from batch.to_pylist()
+
+
+def nest_comment(row):
+
+    # The post columns are only used to match comments to their posts
+    del row['post_type'], row['post_id']
+    return nest_owner(row)
+
+
+def nest_owner(row):
+
+    # Restore the owner object as the API returns it; deleted users have no `user_id` field
+    owner = {'display_name': row.pop('owner_display_name')}
+    owner_id = row.pop('owner_id')
+    if owner_id is not None:
+        owner['user_id'] = owner_id
+    row['owner'] = owner
+
+    return row
+
+
+def read_kr_columns(directory):
+
+    # Knowledge reuse metrics only need three columns per question and article, so they're read
+    # straight from the columnar tables into arrays, without building any objects
+    questions = read_parquet('questions', directory,
+                             ['question_id', 'owner_id', 'creation_date', 'view_count'])
+    answers = read_parquet('answers', directory, ['question_id', 'owner_id'])
+    articles = read_parquet('articles', directory, ['owner_id', 'creation_date', 'view_count'])
+
+    # A question counts as having a deleted author if its owner or any of its answers' owners
+    # has been deleted
+    deleted_answer_question_ids = answers.column('question_id').filter(
+        answers.column('owner_id').is_null())
+    question_deleted_flags = (
+        column_to_numpy(questions.column('owner_id').is_null()) |
+        np.isin(column_to_numpy(questions.column('question_id')),
+                column_to_numpy(deleted_answer_question_ids)))
+
+    creation_dates = np.concatenate([column_to_numpy(questions.column('creation_date')),
+                                     column_to_numpy(articles.column('creation_date'))])
+    view_counts = np.concatenate([column_to_numpy(questions.column('view_count')),
+                                  column_to_numpy(articles.column('view_count'))])
+    deleted_flags = np.concatenate([question_deleted_flags,
+                                    column_to_numpy(articles.column('owner_id').is_null())])
+
+    return creation_dates.astype(np.int64), view_counts.astype(np.int64), deleted_flags
+
+
+def column_to_numpy(column):
+
+    return column.to_numpy(zero_copy_only=False)
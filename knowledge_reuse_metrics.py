@@ -1,34 +1,88 @@
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
+import numpy as np
 
+from traversal import Accumulator, traverse
 
-def create_kr_metrics(questions, articles):
+
+def create_kr_metrics(questions, articles, from_date=None, to_date=None):
+
+    kr_metrics = KnowledgeReuseMetrics(from_date, to_date)
+    traverse(questions, articles, [kr_metrics])
+
+    return kr_metrics.result()
+
+
+class KnowledgeReuseMetrics(Accumulator):
+    def __init__(self, from_date=None, to_date=None):
+        """
+        Collects the only three fields needed for knowledge reuse metrics from the content
+        visited by `traverse`: creation date, page views, and whether the content has an author
+        who has been deleted. The metrics are then calculated from these columns.
+        """
+        self.from_date = from_date
+        self.to_date = to_date
+        self.creation_dates = []
+        self.view_counts = []
+        self.deleted_flags = []
+
+    def add_question(self, question, asker_id):
+
+        self.creation_dates.append(question['creation_date'])
+        self.view_counts.append(question['view_count'])
+        self.deleted_flags.append(not question['owner'].get('user_id'))
+
+    def add_answer(self, answer, answerer_id, question):
+
+        # Page views of a question are attributed to deleted users if any of its answers are from
+        # a deleted user; they're only counted once, no matter how many answers that applies to
+        if not answer['owner'].get('user_id'):
+            self.deleted_flags[-1] = True
+
+    def add_article(self, article, author_id):
+
+        self.creation_dates.append(article['creation_date'])
+        self.view_counts.append(article['view_count'])
+        self.deleted_flags.append(not article['owner'].get('user_id'))
+
+    def result(self):
+
+        return calculate_kr_metrics(np.array(self.creation_dates, dtype=np.int64),
+                                    np.array(self.view_counts, dtype=np.int64),
+                                    np.array(self.deleted_flags, dtype=bool),
+                                    self.from_date, self.to_date)
+
+
+def calculate_kr_metrics(creation_dates, view_counts, deleted_flags, from_date=None,
+                         to_date=None):
+
+    # Only include content created within the reporting period, if one was specified
+    if from_date or to_date:
+        in_period = np.ones(len(creation_dates), dtype=bool)
+        if from_date:
+            in_period &= creation_dates >= from_date
+        if to_date:
+            in_period &= creation_dates <= to_date
+        creation_dates = creation_dates[in_period]
+        view_counts = view_counts[in_period]
+        deleted_flags = deleted_flags[in_period]
+
+    # Sort content by creation date once. Cumulative sums taken from the newest content backwards
+    # then give the page views of all content created after any point in time, so each time
+    # frame is a binary search rather than another pass over the content.
+    order = np.argsort(creation_dates, kind='stable')
+    creation_dates = creation_dates[order]
+    total_views_since = reverse_cumulative_sum(view_counts[order])
+    deleted_views_since = reverse_cumulative_sum(np.where(deleted_flags, view_counts, 0)[order])
 
     date_filters = create_date_filters()
     kr_metrics = []
     for filter_name, filter in date_filters.items():
 
-        filtered_questions = filter_content_by_date(questions, filter)
-        filtered_articles = filter_content_by_date(articles, filter)
-
-        total_page_views = 0
-        deleted_page_views = 0
-        for question in filtered_questions:
-            total_page_views += question['view_count']
-            if not question['owner'].get('user_id'):
-                deleted_page_views += question['view_count']
-                continue  # don't count page views of answers if question is already counted
-            if question.get('answers'):
-                for answer in question['answers']:
-                    if not answer['owner'].get('user_id'):
-                        deleted_page_views += question['view_count']
-                        # don't count page views of subsequent answers (i.e. avoid duplication)
-                        break
-
-        for article in filtered_articles:
-            total_page_views += article['view_count']
-            if not article['owner'].get('user_id'):
-                deleted_page_views += article['view_count']
+        first_index = np.searchsorted(creation_dates, convert_date_filter(filter), side='right')
+        total_page_views = int(total_views_since[first_index])
+        deleted_page_views = int(deleted_views_since[first_index])
+
         try:
             page_view_percentage = "{:.2f}".format((deleted_page_views / total_page_views) * 100)
         except ZeroDivisionError:
@@ -44,6 +98,12 @@ def create_kr_metrics(questions, articles):
     return kr_metrics
 
 
+def reverse_cumulative_sum(values):
+
+    # Element i is the sum of values[i:]; a trailing zero covers dates after the newest content
+    return np.append(np.cumsum(values[::-1])[::-1], 0)
+
+
 def create_date_filters():
 
     now = datetime.now()
@@ -58,15 +118,10 @@ def create_date_filters():
     return date_filters
 
 
-def convert_timestamp_format(timestamp):
-    return datetime.fromtimestamp(timestamp)
-
-
-def filter_content_by_date(content_pieces, date_filter):
-    filtered_content = []
-    for content in content_pieces:
-        content_ts = convert_timestamp_format(content['creation_date'])
-        if content_ts > date_filter:
-            filtered_content.append(content)
+def convert_date_filter(date_filter):
 
-    return filtered_content
+    # Content timestamps are compared to date filters as Unix timestamps (in local time)
+    try:
+        return date_filter.timestamp()
+    except (OSError, OverflowError):  # dates before 1970 aren't supported on some platforms
+        return float('-inf')
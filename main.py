@@ -1,5 +1,6 @@
 # Native Python libraries
 import argparse
+from datetime import date, datetime, timedelta
 import logging
 
 # Local libraries
@@ -22,10 +23,16 @@ def main():
         format='%(asctime)s | %(message)s'
     )
 
+    from_date, to_date = get_date_range(args)
+
     if not args.no_api:
-        collector()
+        collector(page_workers=args.page_workers, sme_workers=args.sme_workers,
+                  lookup_workers=args.lookup_workers, incremental=args.incremental, metrics_only=args.metrics_only,
+                  sqlite=args.sqlite, from_date=from_date, to_date=to_date,
+                  resume=args.resume, stage_workers=args.stage_workers)
 
-    create_reports()
+    create_reports(use_sqlite=args.sqlite, from_date=from_date, to_date=to_date,
+                   jobs=args.jobs)
 
     print('Reports have been created in the "reports" directory.')
 
@@ -49,6 +56,24 @@ def get_args():
                         action='store_true',
                         help='Optional. If API data has already been collected, skip API calls and '
                         'use existing JSON data. This negates the need to supply a URL or token.')
+    parser.add_argument('--incremental',
+                        action='store_true',
+                        help='Optional. Only collect questions and articles with activity since '
+                        'the previous run and merge them into the existing JSON data.')
+    parser.add_argument('--metrics-only',
+                        action='store_true',
+                        help='Optional. Only collect the question and article fields needed for '
+                        'the reports, skipping post bodies. Much faster, but the JSON data is not '
+                        'a full archive of the content.')
+    parser.add_argument('--sqlite',
+                        action='store_true',
+                        help='Optional. Also store the API data in a SQLite database '
+                        '(data/so4t.db), updating it in place on each run, and create the reports '
+                        'from it.')
+    parser.add_argument('--resume',
+                        action='store_true',
+                        help='Optional. Continue an API data collection that was interrupted, '
+                        'instead of starting over. Progress is saved in data/checkpoints.')
     parser.add_argument('--days',
                         type=int,
                         help='Optional. Only include metrics for content created within the past X '
@@ -61,6 +86,34 @@ def get_args():
                         type=str,
                         help='Optional. Only include metrics for content created on or before the '
                         'specified date. Format: YYYY-MM-DD')
+    parser.add_argument('--page-workers',
+                        type=int,
+                        default=1,
+                        help='Optional. Number of pages (or batches of users, for reputation '
+                        'history) to request concurrently when collecting questions, articles, '
+                        'users, and reputation history. Default is 1 (sequential).')
+    parser.add_argument('--sme-workers',
+                        type=int,
+                        default=1,
+                        help='Optional. Number of tags whose subject matter experts are '
+                        'requested concurrently from API v3. Default is 1 (sequential).')
+    parser.add_argument('--lookup-workers',
+                        type=int,
+                        default=1,
+                        help='Optional. Number of deactivated users whose details are requested '
+                        'concurrently from API v3. Default is 1 (sequential).')
+    parser.add_argument('--stage-workers',
+                        type=int,
+                        default=4,
+                        help='Optional. Number of collection stages (e.g. questions, articles, '
+                        'tags, users) to run concurrently. Default is 4; use 1 to run them one '
+                        'after another.')
+    parser.add_argument('--jobs',
+                        type=int,
+                        default=1,
+                        help='Optional. Number of processes to use when creating the reports; the '
+                        'tag, user, and knowledge reuse metrics and the charts are created in '
+                        'parallel. Default is 1 (sequential).')
     parser.add_argument('--logging',
                         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
                         default='INFO',
@@ -69,6 +122,33 @@ def get_args():
     return parser.parse_args()
 
 
+def get_date_range(args):
+
+    # Converts the date arguments into Unix timestamps (or None, if not specified)
+    # `--days` takes precedence over `--start-date`; the end date includes the whole day
+    # `--days` counts from the start of the day, so that the date range (and the options of an
+    # interrupted run) stays the same when the script is run again with `--resume`
+    from_date = None
+    to_date = None
+    try:
+        if args.days:
+            from_date = datetime.combine(date.today() - timedelta(days=args.days),
+                                         datetime.min.time())
+        elif args.start_date:
+            from_date = datetime.strptime(args.start_date, '%Y-%m-%d')
+        if args.end_date:
+            to_date = datetime.strptime(args.end_date, '%Y-%m-%d') + timedelta(days=1, seconds=-1)
+    except ValueError:
+        raise ValueError('Invalid date. Dates must be in the format YYYY-MM-DD')
+
+    if from_date:
+        from_date = int(from_date.timestamp())
+    if to_date:
+        to_date = int(to_date.timestamp())
+
+    return from_date, to_date
+
+
 if __name__ == "__main__":
 
     main()
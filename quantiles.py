@@ -0,0 +1,121 @@
+# Standard Python libraries
+import math
+
+MAX_EXACT_VALUES = 1000  # values kept as-is before switching to the sketch
+RELATIVE_ACCURACY = 0.01  # quantiles from the sketch are within 1% of the true value
+
+
+class QuantileSketch(object):
+    __slots__ = ('count', 'values', 'buckets', 'negative_buckets', 'zero_count', 'gamma',
+                 'log_gamma', 'positive_only')
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY, positive_only=True):
+        """
+        Tracks the distribution of a stream of durations, so that its median and tail
+        percentiles can be reported without keeping every value.
+
+        Up to `MAX_EXACT_VALUES` values are kept as-is, and quantiles are exact (the median is
+        the same as `statistics.median`). Past that, the values are moved into logarithmic
+        buckets (as in DDSketch), so memory is bounded by the range of the values rather than
+        their number, and every quantile is within `relative_accuracy` of the true value.
+
+        Durations of zero or less aren't meaningful (e.g. content created in the same second, or
+        clock skew between servers), so by default they're ignored. With `positive_only` set to
+        False they're kept, for metrics that have always included them: negative values are
+        bucketed by their magnitude, and zeros are counted.
+
+        Args:
+            relative_accuracy (float): maximum relative error of quantiles from the sketch
+            positive_only (bool): whether values of zero or less are ignored
+        """
+        self.count = 0
+        self.values = []
+        self.buckets = None
+        self.negative_buckets = None
+        self.zero_count = 0
+        self.positive_only = positive_only
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value):
+
+        if value <= 0 and self.positive_only:
+            return
+
+        self.count += 1
+        if self.buckets is None:
+            self.values.append(value)
+            if len(self.values) > MAX_EXACT_VALUES:
+                self.buckets = {}
+                self.negative_buckets = {}
+                for exact_value in self.values:
+                    self.add_to_bucket(exact_value)
+                self.values = None
+        else:
+            self.add_to_bucket(value)
+
+    def add_to_bucket(self, value):
+
+        if value > 0:
+            buckets = self.buckets
+        elif value < 0:
+            buckets = self.negative_buckets
+        else:
+            self.zero_count += 1
+            return
+
+        key = math.ceil(math.log(abs(value)) / self.log_gamma)
+        buckets[key] = buckets.get(key, 0) + 1
+
+    def sorted_buckets(self):
+        # Yields the value and count of every bucket, from the lowest value to the highest: the
+        # negative buckets (from the largest magnitude down), the zeros, then the positive buckets
+
+        for key in sorted(self.negative_buckets, reverse=True):
+            yield -self.bucket_value(key), self.negative_buckets[key]
+        if self.zero_count:
+            yield 0, self.zero_count
+        for key in sorted(self.buckets):
+            yield self.bucket_value(key), self.buckets[key]
+
+    def bucket_value(self, key):
+
+        # The value of a bucket is the midpoint of its bounds, which is within the relative
+        # accuracy of every value in it
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantiles(self, *quantiles):
+        """
+        Returns the value at each quantile (0 to 1), or None for each if no values were added.
+        Exact quantiles are linearly interpolated between the two closest values.
+        """
+        if not self.count:
+            return [None] * len(quantiles)
+
+        if self.buckets is None:
+            values = sorted(self.values)
+            results = []
+            for quantile in quantiles:
+                rank = quantile * (len(values) - 1)
+                lower = math.floor(rank)
+                upper = min(lower + 1, len(values) - 1)
+                # Weighted this way, a median between two values is exactly their mean, as
+                # with `statistics.median`
+                fraction = rank - lower
+                results.append(values[lower] * (1 - fraction) + values[upper] * fraction)
+            return results
+
+        buckets = list(self.sorted_buckets())
+        results = []
+        for quantile in quantiles:
+            rank = quantile * (self.count - 1)
+            cumulative_count = 0
+            for value, count in buckets:
+                cumulative_count += count
+                if cumulative_count > rank:
+                    break
+            results.append(value)
+        return results
@@ -1,9 +1,11 @@
 # Native Python libraries
+from concurrent.futures import ProcessPoolExecutor
 import csv
 import json
 import logging
 from math import sqrt
 import os
+import re
 
 # Third-party libraries
 import pandas as pd
@@ -13,44 +15,212 @@ from plotly.subplots import make_subplots
 from wordcloud import WordCloud
 
 # Local libraries
+import columnar
+import sqlite_store
 from collector import DATA_DIR
-from tag_metrics import create_tag_metrics
-from user_metrics import create_user_metrics
-from knowledge_reuse_metrics import create_kr_metrics
+from tag_metrics import TagMetrics
+from user_metrics import UserMetrics
+from knowledge_reuse_metrics import KnowledgeReuseMetrics, calculate_kr_metrics
+from sme_index import create_sme_index
+from traversal import traverse
 
 REPORT_DIR = 'reports'
+AUTO_OPEN_CHARTS = True  # open each HTML chart in the browser once it's created
+METRICS = ['tag_metrics', 'user_metrics', 'kr_metrics']
+BODY_FIELDS = ['body', 'body_markdown']  # not used by any metric; dropped when streaming
+STREAM_CHUNK_SIZE = 1024 * 1024  # characters read from disk at a time when streaming JSON
+MAX_ITEM_SIZE = 256 * 1024 * 1024  # characters of a single JSON item before the file is rejected
+WHITESPACE = re.compile(r'\s*')
+NUMBER_CHARACTERS = re.compile(r'[0-9eE.+-]*')
 
 
-def create_reports():
+def create_reports(use_sqlite=False, from_date=None, to_date=None, jobs=1):
 
     # Read data from JSON files
-    questions = read_json('questions', DATA_DIR)
-    articles = read_json('articles', DATA_DIR)
+    # Questions and articles can be several GB, so they're streamed from disk one at a time
+    # (without post bodies) by each metric builder instead of being loaded up front.
+    # If the SQLite database or columnar data is available, it's used for questions and
+    # articles instead.
     tags = read_json('tags', DATA_DIR)
     users = read_json('users', DATA_DIR)
     communities = read_json('communities', DATA_DIR)
+    data_source = get_data_source(use_sqlite)
+    logging.info(f'Reading questions and articles from {data_source} data')
+
+    # If a reporting period was specified (Unix timestamps), only questions and articles created
+    # within it are included in the metrics
+    period = (from_date, to_date)
+
+    # Map each SME to their tags once; both tag and user metrics use it
+    sme_index = create_sme_index(tags)
+
+    # All metrics are calculated in a single pass over the content. With more than one job, the
+    # metrics and charts each run in their own process instead (each metric with its own pass).
+    # Every process streams questions and articles from disk itself, so only the small inputs
+    # (tags, users, communities) and the resulting metrics are passed between processes.
+    # Processes started with "spawn" (the default on Windows and MacOS) import this module
+    # afresh, so they're given the setting for opening charts rather than its default.
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=set_auto_open_charts,
+                                   initargs=(AUTO_OPEN_CHARTS,)) if jobs > 1 else None
+    if executor:
+        logging.info(f'Creating reports using {jobs} processes')
+        metric_groups = [[metric] for metric in METRICS]
+    else:
+        metric_groups = [METRICS]
+
+    try:
+        # Calculate tag, user, and knowledge reuse (kr) metrics and store them in new
+        # collections
+        results = {}
+        for result in run_jobs(executor, [
+                (build_metrics, data_source, period, metrics, tags, users, communities, sme_index)
+                for metrics in metric_groups]):
+            results.update(result)
+        tag_metrics = results['tag_metrics']
+        user_metrics = results['user_metrics']
+        reputation_over_time = results['reputation_over_time']
+        kr_metrics = results['kr_metrics']
+        export_to_json('tag_metrics', tag_metrics)
+        export_to_json('user_metrics', user_metrics)
+        export_to_json('kr_metrics', kr_metrics)
+
+        # CSV reports
+        export_to_csv('tag_report', tag_metrics)
+        export_to_csv('user_report', user_metrics)
+        if reputation_over_time:
+            export_to_csv('reputation_over_time', reputation_over_time)
+        create_deleted_user_kr_csv(kr_metrics)
+
+        # Graphical reports
+        run_jobs(executor, [
+            (create_tag_cloud, tag_metrics),
+            (create_tag_bubble_chart, tag_metrics),
+            (create_tag_sme_chart, tag_metrics),
+            (create_tag_watcher_chart, tag_metrics),
+            (create_department_charts, user_metrics)
+        ])
+    finally:
+        if executor:
+            executor.shutdown()
+
+
+def set_auto_open_charts(auto_open):
+
+    global AUTO_OPEN_CHARTS
+    AUTO_OPEN_CHARTS = auto_open
+
+
+def run_jobs(executor, jobs):
+
+    # Each job is a function followed by its arguments; results are returned in the same order
+    if executor is None:
+        return [function(*args) for function, *args in jobs]
+
+    futures = [executor.submit(function, *args) for function, *args in jobs]
+    return [future.result() for future in futures]
+
+
+def build_metrics(data_source, period, metrics, tags, users, communities, sme_index):
+
+    # Each metric is an accumulator; all of them are filled by the same traversal of the content
+    accumulators = {}
+    if 'tag_metrics' in metrics:
+        accumulators['tag_metrics'] = TagMetrics(tags, communities, sme_index)
+    if 'user_metrics' in metrics:
+        # Reputation history is streamed as well, and aggregated by user (in total and by month)
+        accumulators['user_metrics'] = UserMetrics(
+            users, tags, sme_index, stream_reputation_history(data_source, *period))
+
+    # Knowledge reuse metrics only need three columns, which the SQLite database and columnar
+    # data can provide without traversing the content
+    results = {}
+    if 'kr_metrics' in metrics:
+        if data_source == 'sqlite':
+            results['kr_metrics'] = calculate_kr_metrics(*sqlite_store.read_kr_columns(DATA_DIR),
+                                                         *period)
+        elif data_source == 'columnar':
+            results['kr_metrics'] = calculate_kr_metrics(*columnar.read_kr_columns(DATA_DIR),
+                                                         *period)
+        else:
+            accumulators['kr_metrics'] = KnowledgeReuseMetrics(*period)
+
+    if accumulators:
+        traverse(stream_questions(data_source, *period), stream_articles(data_source, *period),
+                 list(accumulators.values()))
+    for name, accumulator in accumulators.items():
+        results[name] = accumulator.result()
+
+    if 'user_metrics' in metrics:
+        results['reputation_over_time'] = accumulators['user_metrics'].reputation_over_time()
+
+    return results
+
+
+def get_data_source(use_sqlite):
+
+    if use_sqlite and sqlite_store.db_exists(DATA_DIR):
+        return 'sqlite'
+    elif columnar.columnar_data_is_current(DATA_DIR):
+        return 'columnar'
+    else:
+        return 'json'
+
+
+def stream_questions(data_source, from_date=None, to_date=None):
+
+    # The SQLite database can filter by creation date in its query; other sources are filtered
+    # as they're streamed
+    if data_source == 'sqlite':
+        return sqlite_store.stream_questions(DATA_DIR, from_date=from_date, to_date=to_date)
+    elif data_source == 'columnar':
+        questions = columnar.stream_questions(DATA_DIR)
+    else:
+        questions = stream_json('questions', DATA_DIR, BODY_FIELDS)
+
+    return filter_by_creation_date(questions, from_date, to_date)
+
+
+def stream_articles(data_source, from_date=None, to_date=None):
+
+    if data_source == 'sqlite':
+        return sqlite_store.stream_articles(DATA_DIR, from_date=from_date, to_date=to_date)
+    elif data_source == 'columnar':
+        articles = columnar.stream_articles(DATA_DIR)
+    else:
+        articles = stream_json('articles', DATA_DIR, BODY_FIELDS)
+
+    return filter_by_creation_date(articles, from_date, to_date)
 
-    # Calculate tag metrics and store them in a new collection
-    tag_metrics = create_tag_metrics(questions, articles, tags, communities)
-    export_to_json('tag_metrics', tag_metrics)
 
-    # Calculate user metrics and store them in a new collection
-    user_metrics = create_user_metrics(users, questions, articles, tags)
-    export_to_json('user_metrics', user_metrics)
+def stream_reputation_history(data_source, from_date=None, to_date=None):
 
-    # Calculate knowledge reuse (kr) metrics and store them in a new collection
-    kr_metrics = create_kr_metrics(questions, articles)
-    export_to_json('kr_metrics', kr_metrics)
+    if data_source == 'sqlite':
+        return sqlite_store.stream_reputation_history(DATA_DIR, from_date, to_date)
+    else:  # reputation history isn't stored as columnar data
+        events = flatten_reputation_history(stream_json('reputation_history', DATA_DIR,
+                                                        flatten=True))
 
-    # CSV reports
-    export_to_csv('tag_report', tag_metrics)
-    export_to_csv('user_report', user_metrics)
-    create_deleted_user_kr_csv(kr_metrics)
+    return filter_by_creation_date(events, from_date, to_date)
 
-    # Graphical reports
-    create_tag_cloud(tag_metrics)
-    create_tag_charts(tag_metrics)
-    create_department_charts(user_metrics)
+
+def flatten_reputation_history(events):
+
+    # Earlier versions of the collector wrote the reputation history nested in a one-element
+    # list (`[[...]]`); `stream_json` streams the events of the nested list one at a time
+    # (with `flatten`), and anything else that isn't an event is skipped
+    for event in events:
+        if isinstance(event, dict):
+            yield event
+
+
+def filter_by_creation_date(content_pieces, from_date=None, to_date=None):
+
+    for content in content_pieces:
+        if from_date and content['creation_date'] < from_date:
+            continue
+        if to_date and content['creation_date'] > to_date:
+            continue
+        yield content
 
 
 def create_tag_cloud(tag_metrics, max_tags=100):
@@ -87,13 +257,6 @@ def create_deleted_user_kr_csv(kr_metrics):
         writer.writerows(kr_metrics)
 
 
-def create_tag_charts(tag_metrics):
-
-    create_tag_bubble_chart(tag_metrics)
-    create_tag_sme_chart(tag_metrics)
-    create_tag_watcher_chart(tag_metrics)
-
-
 def create_tag_bubble_chart(tag_metrics):
 
     for tag in tag_metrics:
@@ -147,7 +310,7 @@ def create_tag_bubble_chart(tag_metrics):
 
     data = [trace]
     fig = go.Figure(data=data, layout=layout)
-    pyo.plot(fig, filename=f'{REPORT_DIR}/tag_bubble_chart.html')
+    pyo.plot(fig, filename=f'{REPORT_DIR}/tag_bubble_chart.html', auto_open=AUTO_OPEN_CHARTS)
 
 
 def create_tag_sme_chart(tag_metrics):
@@ -195,7 +358,7 @@ def create_tag_sme_chart(tag_metrics):
 
     data = [trace]
     fig = go.Figure(data=data, layout=layout)
-    pyo.plot(fig, filename=f'{REPORT_DIR}/sme_count_chart.html')
+    pyo.plot(fig, filename=f'{REPORT_DIR}/sme_count_chart.html', auto_open=AUTO_OPEN_CHARTS)
 
 
 def create_tag_watcher_chart(tag_metrics):
@@ -243,7 +406,7 @@ def create_tag_watcher_chart(tag_metrics):
 
     data = [trace]
     fig = go.Figure(data=data, layout=layout)
-    pyo.plot(fig, filename=f'{REPORT_DIR}/tag_watcher_chart.html')
+    pyo.plot(fig, filename=f'{REPORT_DIR}/tag_watcher_chart.html', auto_open=AUTO_OPEN_CHARTS)
 
 
 def create_department_charts(user_metrics):
@@ -361,7 +524,7 @@ def create_department_charts(user_metrics):
         width=1920
     )
 
-    pyo.plot(fig, filename=f'{REPORT_DIR}/department_metrics.html')
+    pyo.plot(fig, filename=f'{REPORT_DIR}/department_metrics.html', auto_open=AUTO_OPEN_CHARTS)
 
     # create_users_department_chart(user_metrics)
     # create_questions_department_chart(user_metrics)
@@ -396,7 +559,8 @@ def create_users_department_chart(user_metrics):
 
     data = [trace]
     fig = go.Figure(data=data, layout=layout)
-    pyo.plot(fig, filename=f'{REPORT_DIR}/user_count_by_department.html')
+    pyo.plot(fig, filename=f'{REPORT_DIR}/user_count_by_department.html',
+             auto_open=AUTO_OPEN_CHARTS)
 
 
 def create_questions_department_chart(user_metrics):
@@ -427,7 +591,8 @@ def create_questions_department_chart(user_metrics):
 
     data = [trace]
     fig = go.Figure(data=data, layout=layout)
-    pyo.plot(fig, filename=f'{REPORT_DIR}/question_count_by_department.html')
+    pyo.plot(fig, filename=f'{REPORT_DIR}/question_count_by_department.html',
+             auto_open=AUTO_OPEN_CHARTS)
 
 
 def create_answers_department_chart(user_metrics):
@@ -458,7 +623,8 @@ def create_answers_department_chart(user_metrics):
 
     data = [trace]
     fig = go.Figure(data=data, layout=layout)
-    pyo.plot(fig, filename=f'{REPORT_DIR}/answer_count_by_department.html')
+    pyo.plot(fig, filename=f'{REPORT_DIR}/answer_count_by_department.html',
+             auto_open=AUTO_OPEN_CHARTS)
 
 
 def export_to_csv(data_name, data):
@@ -494,6 +660,113 @@ def read_json(file_name, directory=''):
     return data
 
 
+def stream_json(file_name, directory='', exclude_fields=None, flatten=False):
+    """
+    Yields the items of a JSON file containing an array, one at a time, without reading the
+    whole file into memory. Only the item currently being parsed is held in memory; if an item
+    is larger than MAX_ITEM_SIZE (e.g. the file is truncated or malformed), a ValueError is
+    raised instead of reading the rest of the file.
+
+    Args:
+        file_name (str): name of the JSON file, without the extension
+        directory (str): directory of the JSON file
+        exclude_fields (list): keys to drop from every object (at any depth) as it's parsed,
+            e.g. post bodies that no metric uses
+        flatten (bool): if True, the items of arrays nested in the top-level array are
+            yielded one at a time, instead of each nested array as a whole
+
+    Yields:
+        item: each item of the top-level array (or of its nested arrays)
+    """
+    file_path = os.path.join(directory, file_name+'.json')
+
+    if exclude_fields:
+        exclude_fields = set(exclude_fields)
+        decoder = json.JSONDecoder(object_hook=lambda obj: {
+            key: value for key, value in obj.items() if key not in exclude_fields})
+    else:
+        decoder = json.JSONDecoder()
+
+    try:
+        f = open(file_path, 'r')
+    except FileNotFoundError:
+        print(f'File not found: {file_path}')
+        return
+
+    with f:
+        buffer = ''
+        position = 0
+        end_of_file = False
+        expecting = 'start'  # 'start', 'item' (or end of array), or 'separator'
+        depth = 0  # arrays entered: the top-level array, and nested arrays when flattening
+        while True:
+            # Skip whitespace, reading more of the file until there's something to parse
+            position = WHITESPACE.match(buffer, position).end()
+            if position == len(buffer):
+                if end_of_file:
+                    raise ValueError(f'Unexpected end of JSON file: {file_path}')
+                buffer, position, end_of_file = read_chunk(f, buffer, position)
+                continue
+
+            char = buffer[position]
+            if expecting == 'start':
+                if char != '[':
+                    raise ValueError(f'Expected a JSON array in {file_path}')
+                position += 1
+                depth = 1
+                expecting = 'item'
+            elif char == ']' and expecting in ('item', 'separator'):
+                position += 1
+                depth -= 1
+                if depth == 0:
+                    return
+                expecting = 'separator'
+            elif char == '[' and expecting == 'item' and flatten:
+                position += 1
+                depth += 1
+            elif expecting == 'separator':
+                if char != ',':
+                    raise ValueError(f'Invalid JSON in {file_path} at character {position}')
+                position += 1
+                expecting = 'item'
+            else:
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if end_of_file:
+                        raise
+                    check_item_size(buffer, position, file_path)
+                    buffer, position, end_of_file = read_chunk(f, buffer, position)
+                    continue
+
+                # An item that runs up to the end of the buffer may have been cut short (e.g. a
+                # number split across chunks, like `12.` of `12.5`), so read more and try again
+                if NUMBER_CHARACTERS.match(buffer, end).end() == len(buffer) and not end_of_file:
+                    check_item_size(buffer, position, file_path)
+                    buffer, position, end_of_file = read_chunk(f, buffer, position)
+                    continue
+
+                position = end
+                expecting = 'separator'
+                yield item
+
+
+def check_item_size(buffer, position, file_path):
+
+    # An item that still can't be parsed once this much of the file has been read is almost
+    # certainly malformed (e.g. an unterminated string), rather than just large
+    if len(buffer) - position > MAX_ITEM_SIZE:
+        raise ValueError(f'Invalid JSON in {file_path}: no complete item found within '
+                         f'{MAX_ITEM_SIZE} characters')
+
+
+def read_chunk(f, buffer, position):
+
+    # Discard the part of the buffer that has already been parsed and add the next chunk
+    chunk = f.read(STREAM_CHUNK_SIZE)
+    return buffer[position:] + chunk, 0, not chunk
+
+
 def export_to_json(data_name, data):
     file_name = data_name + '.json'
     directory = 'data'
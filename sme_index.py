@@ -0,0 +1,27 @@
+def create_sme_index(tags):
+    """Creates an inverted index of subject matter experts (SMEs): user ID -> names of the tags
+    the user is a SME for. A user counts as a SME for a tag if they're assigned to it
+    individually or are a member of a user group that's assigned to it.
+
+    Building the index is a single pass over the SME assignments in `tags`, so joining SMEs to
+    users or answers doesn't require comparing every user to every SME of every tag.
+
+    Args:
+        tags (list): tags from the API, each with a `smes` field containing `users` and
+            `userGroups` (and each group's `users`)
+
+    Returns:
+        sme_index (dict): lists of tag names, keyed by user ID. Tag names are in the same order
+            as `tags` and appear once per user, even if the user is both an individual and a
+            group SME for the tag.
+    """
+    sme_index = {}
+    for tag in tags:
+        sme_ids = [user['id'] for user in tag['smes']['users']]
+        for group in tag['smes']['userGroups']:
+            sme_ids += [user['id'] for user in group['users']]
+
+        for user_id in dict.fromkeys(sme_ids):  # de-duplicate, preserving order
+            sme_index.setdefault(user_id, []).append(tag['name'])
+
+    return sme_index
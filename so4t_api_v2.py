@@ -1,13 +1,26 @@
 # Standard Python libraries
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import logging
-import time
+import math
+import re
 
 # Third-party libraries
 import requests
 
+# Local libraries
+from throttle import APIRequestError, Throttle, ThrottledAdapter
+
+# Reputation history is requested for batches of users; the batch size adapts between 1 and
+# the documented maximum of 100, depending on which batch sizes the API accepts
+REPUTATION_BATCH_SIZE = 50
+REPUTATION_BATCH_GROWTH = 5
+REPUTATION_MAX_BATCH_SIZE = 100
+
 
 class V2Client(object):
-    def __init__(self, url, key=None, token=None, proxy=None):
+    def __init__(self, url, key=None, token=None, proxy=None, pool_size=10, max_retries=3,
+                 page_workers=1, checkpoint=None, throttle=None):
 
         print("Initializing API v2.3 client...")
 
@@ -46,8 +59,71 @@ class V2Client(object):
 
         self.proxies = {'https': proxy} if proxy else {'https': None}
 
+        # Pagination settings; with more than one page worker, pages are requested concurrently
+        self.page_workers = page_workers
+
+        # If a checkpoint is provided, every page received is saved to disk as it arrives, and
+        # pages saved by a previous (interrupted) run are reused instead of being requested again
+        self.checkpoint = checkpoint
+        self.total_filter = None
+
+        # All API calls go through a throttle, which paces them, retries transient failures,
+        # and pauses every worker when the API requests a backoff. It can be shared with other
+        # clients making calls to the same instance.
+        self.throttle = throttle or Throttle(max_retries=max_retries)
+
+        # All API calls share a single session so that TCP/TLS connections (including those
+        # made through a proxy) are kept alive and reused across pages and endpoints
+        self.session = self.create_session(max(pool_size, page_workers))
+
         # Test the API connection and set the SSL verification variable
         self.ssl_verify = self.test_connection()
+        self.session.verify = self.ssl_verify
+
+    def create_session(self, pool_size):
+
+        # Connection pooling documentation:
+        # https://requests.readthedocs.io/en/latest/user/advanced/#session-objects
+        # Transient failures (connection errors, HTTP 429/5xx, throttle violations) are retried
+        # by the adapter; any other API error (e.g. HTTP 400) is raised by `get_page`
+        # Only API v2.3 calls count towards its quota, so only they stop once it's used up
+        adapter = ThrottledAdapter(self.throttle, check_quota=True, pool_connections=pool_size,
+                                   pool_maxsize=pool_size)
+
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.headers.update(self.headers)
+        session.proxies.update(self.proxies)
+
+        return session
+
+    def get_pool_stats(self):
+
+        # urllib3 keeps a connection pool per host (and per proxy); each pool counts the
+        # requests it served and the new connections it had to open to serve them
+        adapter = self.session.get_adapter('https://')
+        pool_managers = [adapter.poolmanager] + list(adapter.proxy_manager.values())
+
+        stats = {'requests': 0, 'connections_opened': 0}
+        for pool_manager in pool_managers:
+            for key in pool_manager.pools.keys():
+                pool = pool_manager.pools.get(key)
+                if pool is None:
+                    continue
+                stats['requests'] += pool.num_requests
+                stats['connections_opened'] += pool.num_connections
+
+        stats['pool_hits'] = max(stats['requests'] - stats['connections_opened'], 0)
+        stats['pool_misses'] = stats['connections_opened']
+
+        return stats
+
+    def log_pool_stats(self):
+
+        stats = self.get_pool_stats()
+        logging.info(f"API v2.3 connection pool: {stats['requests']} requests, "
+                     f"{stats['pool_hits']} reused connections (hits), "
+                     f"{stats['pool_misses']} new connections (misses)")
 
     def test_connection(self):
 
@@ -63,12 +139,10 @@ class V2Client(object):
 
         logging.info("Testing API 2.3 connection...")
         try:
-            response = requests.get(url, params=params, headers=headers,
-                                    proxies=self.proxies)
+            response = self.session.get(url, params=params, headers=headers)
         except requests.exceptions.SSLError:
             logging.warning("SSL error. Trying again without SSL verification...")
-            response = requests.get(url, params=params, headers=headers,
-                                    verify=False, proxies=self.proxies)
+            response = self.session.get(url, params=params, headers=headers, verify=False)
             ssl_verify = False
 
         if response.status_code == 200:
@@ -105,7 +179,8 @@ class V2Client(object):
 
         return filter_string
 
-    def get_all_questions(self, filter_string=''):
+    def get_all_questions(self, filter_string='', min_activity_date=None, from_date=None,
+                         to_date=None):
 
         # API endpoint documentation: https://api.stackexchange.com/docs/questions
         endpoint = "/questions"
@@ -117,10 +192,20 @@ class V2Client(object):
         }
         if filter_string:
             params['filter'] = filter_string
+        if min_activity_date:
+            # When sorting by activity, `min` filters on `last_activity_date` (Unix timestamp)
+            params['sort'] = 'activity'
+            params['order'] = 'asc'
+            params['min'] = min_activity_date
+        if from_date:  # `fromdate` and `todate` filter on `creation_date` (Unix timestamps)
+            params['fromdate'] = from_date
+        if to_date:
+            params['todate'] = to_date
 
-        return self.get_items(endpoint_url, params)
+        return self.get_paginated_items(endpoint_url, params)
 
-    def get_all_articles(self, filter_string=''):
+    def get_all_articles(self, filter_string='', min_activity_date=None, from_date=None,
+                        to_date=None):
 
         # API endpoint documentation: https://api.stackexchange.com/docs/articles
         endpoint = "/articles"
@@ -132,8 +217,17 @@ class V2Client(object):
         }
         if filter_string:
             params['filter'] = filter_string
-
-        return self.get_items(endpoint_url, params)
+        if min_activity_date:
+            # When sorting by activity, `min` filters on `last_activity_date` (Unix timestamp)
+            params['sort'] = 'activity'
+            params['order'] = 'asc'
+            params['min'] = min_activity_date
+        if from_date:  # `fromdate` and `todate` filter on `creation_date` (Unix timestamps)
+            params['fromdate'] = from_date
+        if to_date:
+            params['todate'] = to_date
+
+        return self.get_paginated_items(endpoint_url, params)
 
     def get_all_users(self, filter_string=''):
 
@@ -148,7 +242,7 @@ class V2Client(object):
         if filter_string:
             params['filter'] = filter_string
 
-        return self.get_items(endpoint_url, params)
+        return self.get_paginated_items(endpoint_url, params)
 
     def get_impersonation_token(self, account_id):
 
@@ -161,81 +255,278 @@ class V2Client(object):
             'account_id': account_id
         }
 
-        response_data = requests.post(endpoint_url, params=params)
-        impersonation_token = response_data[0]['access_token']
+        response = self.session.post(endpoint_url, params=params)
+        impersonation_token = response.json()['items'][0]['access_token']
 
         return impersonation_token
 
     def get_reputation_history(self, user_ids, filter_string=''):
 
+        reputation_history = []
+        for batch, items in self.get_reputation_history_batches(user_ids, filter_string):
+            reputation_history += items
+
+        return reputation_history
+
+    def get_reputation_history_batches(self, user_ids, filter_string=''):
+        """Yields the reputation history of users in batches, as each batch is received.
+
+        User IDs need to be sent in batches, semicolon-separated. Documentation says batches
+        can have up to 100 IDs, but testing shows that 100 can be too large (e.g. the URL gets
+        too long), so the batch size adapts: a batch that's rejected because of its ID list
+        (HTTP 414, or HTTP 400 for a bad `ids` parameter) is split in half and retried, and the
+        batch size grows again as batches succeed. If a single ID is rejected, that user is
+        skipped; any other error is raised. Batches are requested concurrently by the page
+        workers.
+
+        Args:
+            user_ids (list): IDs of the users to get the reputation history of
+            filter_string (str): optional API filter
+
+        Yields:
+            tuple: the user IDs of the batch, and the reputation history items of those users
+        """
         # API endpoint documentation: https://api.stackexchange.com/docs/reputation-history
-        # Documentation says User IDs need to be sent in batches of 100, semicolon-separated
-        # However, testing shows that batches of 100 is too large, so batches of 50 are used
+        batch_size = REPUTATION_BATCH_SIZE
+        remaining_ids = deque(user_ids)
+        split_batches = deque()  # batches that failed and have been split, to be retried first
+
+        with ThreadPoolExecutor(max_workers=self.page_workers) as executor:
+            futures = {}
+            try:
+                while remaining_ids or split_batches or futures:
+                    while len(futures) < self.page_workers and (remaining_ids or split_batches):
+                        if split_batches:
+                            batch = split_batches.popleft()
+                        else:
+                            batch = [remaining_ids.popleft()
+                                     for _ in range(min(batch_size, len(remaining_ids)))]
+                        future = executor.submit(self.get_reputation_history_batch, batch,
+                                                 filter_string)
+                        futures[future] = batch
+
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        batch = futures.pop(future)
+                        try:
+                            items = future.result()
+                        except APIRequestError as e:
+                            # Any other error (e.g. a bad filter, or throttling that outlasted
+                            # the retries) would fail for every batch, so it isn't retried
+                            if not is_id_list_error(e):
+                                raise
+                            if len(batch) == 1:
+                                # A single ID can't make the URL too long, so only an error
+                                # about the ID itself is specific to the user
+                                if e.error_name != 'bad_parameter':
+                                    raise
+                                logging.error(f"Unable to get the reputation history of user "
+                                              f"{batch[0]}; skipping this user")
+                                continue
+                            half = len(batch) // 2
+                            split_batches.extend([batch[:half], batch[half:]])
+                            batch_size = max(half, 1)
+                            logging.warning(f"Reputation history batch of {len(batch)} users "
+                                            f"failed; retrying as two batches of {half} and "
+                                            f"{len(batch) - half}")
+                            continue
+
+                        batch_size = min(batch_size + REPUTATION_BATCH_GROWTH,
+                                         REPUTATION_MAX_BATCH_SIZE)
+                        yield batch, items
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def get_reputation_history_batch(self, user_ids, filter_string=''):
+
         # User IDs also need to be converted from INT to STR
-        batch_size = 50
-        user_ids = [str(user_id) for user_id in user_ids]
-        user_id_batches = [user_ids[i:i + batch_size] for i in range(0, len(user_ids), batch_size)]
+        user_id_string = ';'.join(str(user_id) for user_id in user_ids)
+        endpoint = f"/users/{user_id_string}/reputation-history"
+        endpoint_url = self.api_url + endpoint
 
-        reputation_history = []
-        for batch in user_id_batches:
-            user_id_string = ';'.join(batch)  # Convert list of user IDs into a string
-            endpoint = f"/users/{user_id_string}/reputation-history"
-            endpoint_url = self.api_url + endpoint
-
-            params = {
-                'page': 1,
-                'pagesize': 100,
-            }
-            if filter_string:
-                params['filter'] = filter_string
+        params = {
+            'page': 1,
+            'pagesize': 100,
+        }
+        if filter_string:
+            params['filter'] = filter_string
 
-            reputation_history += self.get_items(endpoint_url, params)
+        # Batches aren't the same from one run to the next, so their pages aren't saved to the
+        # checkpoint; completed batches are saved by the caller instead
+        return self.get_items(endpoint_url, params, save_pages=False)
 
-        return reputation_history
+    def get_paginated_items(self, endpoint_url, params):
+
+        if self.page_workers > 1:
+            return self.get_items_concurrently(endpoint_url, params)
+        else:
+            return self.get_items(endpoint_url, params)
 
-    def get_items(self, endpoint_url, params):
+    def get_items(self, endpoint_url, params, save_pages=True):
 
         # SO Business and Basic require a team slug parameter
         if not self.soe:
             params['team'] = self.team_slug
 
+        # Paginated requests are made in a stable order, so pages saved by an interrupted run can
+        # be reused (see `get_items_concurrently`)
+        if save_pages:
+            if self.checkpoint and params.get('page'):
+                params.setdefault('sort', 'creation')
+                params.setdefault('order', 'asc')
+            checkpoint_key, saved_pages = self.get_saved_pages(endpoint_url, params)
+        else:
+            checkpoint_key, saved_pages = None, {}
+
         items = []
         while True:  # Keep performing API calls until all items are received
-            if params.get('page'):
-                logging.info(f"Getting page {params['page']} from {endpoint_url}")
+            if params.get('page') in saved_pages:
+                response_data = saved_pages[params['page']]
             else:
-                logging.info(f"Getting data from {endpoint_url}")
-            response = requests.get(endpoint_url, headers=self.headers, params=params,
-                                    verify=self.ssl_verify, proxies=self.proxies)
-
-            if response.status_code != 200:
-                # Many API call failures result in an HTTP 400 status code (Bad Request)
-                # To understand the reason for the 400 error, specific API error codes can be
-                # found here: https://api.stackoverflowteams.com/docs/error-handling
-                logging.error(
-                    f"/{endpoint_url} API call failed with status code: {response.status_code}.")
-                logging.error(response.text)
-                logging.error(f"Failed request URL and params: {response.request.url}")
+                response_data = self.get_page(endpoint_url, params)
+                if checkpoint_key:
+                    self.checkpoint.save_page(checkpoint_key, params['page'], response_data)
+
+            items += response_data.get('items')
+
+            if not response_data.get('has_more'):
                 break
 
+            params['page'] += 1
+
+        return items
+
+    def get_items_concurrently(self, endpoint_url, params):
+
+        # SO Business and Basic require a team slug parameter
+        if not self.soe:
+            params['team'] = self.team_slug
+
+        # Sorting by creation date in ascending order keeps page boundaries stable while pages
+        # are being fetched; content created mid-run is appended to the end instead of shifting
+        # items between pages
+        params.setdefault('sort', 'creation')
+        params.setdefault('order', 'asc')
+
+        total = self.get_total(endpoint_url, params)
+        page_count = math.ceil(total / params['pagesize'])
+        logging.info(f"{total} items ({page_count} pages) to be retrieved from {endpoint_url} "
+                     f"using {self.page_workers} workers")
+
+        checkpoint_key, saved_pages = self.get_saved_pages(endpoint_url, params)
+
+        with ThreadPoolExecutor(max_workers=self.page_workers) as executor:
+            futures = {page: executor.submit(self.get_and_save_page, endpoint_url,
+                                             dict(params, page=page), checkpoint_key)
+                       for page in range(1, page_count + 1) if page not in saved_pages}
+
+            # Results are collected in page order, regardless of the order in which they finish.
+            # If any page fails, the pages that haven't been requested yet are cancelled.
+            items = []
             try:
-                items += response.json().get('items')
+                for page in range(1, page_count + 1):
+                    if page in saved_pages:
+                        response_data = saved_pages[page]
+                    else:
+                        response_data = futures[page].result()
+                    items += response_data.get('items')
+            except BaseException:
+                for future in futures.values():
+                    future.cancel()
+                raise
+
+        return items
+
+    def get_and_save_page(self, endpoint_url, params, checkpoint_key):
+
+        response_data = self.get_page(endpoint_url, params)
+        if checkpoint_key:
+            self.checkpoint.save_page(checkpoint_key, params['page'], response_data)
+
+        return response_data
+
+    def get_saved_pages(self, endpoint_url, params):
+
+        # Only paginated requests are saved (e.g. not filter creation)
+        if not self.checkpoint or not params.get('page'):
+            return None, {}
+
+        # Pages can only be reused if items stay on the same page between runs. When sorted by
+        # activity (e.g. incremental runs), an item with new activity moves to another page, and
+        # items would be skipped or duplicated, so those pages are requested again instead.
+        if (params.get('sort'), params.get('order')) != ('creation', 'asc'):
+            return None, {}
+
+        checkpoint_key = self.checkpoint.page_key(endpoint_url, params)
+        return checkpoint_key, self.checkpoint.load_pages(checkpoint_key)
+
+    def get_total(self, endpoint_url, params):
+
+        # A filter with a base of 'total' makes the API return only the number of items that
+        # match the request, which is used to calculate how many pages need to be requested
+        if not self.total_filter:
+            self.total_filter = self.create_filter(base='total')
+
+        response_data = self.get_page(endpoint_url, dict(params, filter=self.total_filter))
+
+        return response_data['total']
+
+    def get_page(self, endpoint_url, params):
+
+        if params.get('page'):
+            logging.info(f"Getting page {params['page']} from {endpoint_url}")
+        else:
+            logging.info(f"Getting data from {endpoint_url}")
+        response = self.session.get(endpoint_url, params=params)
+
+        if response.status_code != 200:
+            # Many API call failures result in an HTTP 400 status code (Bad Request)
+            # To understand the reason for the 400 error, specific API error codes can be
+            # found here: https://api.stackoverflowteams.com/docs/error-handling
+            logging.error(
+                f"/{endpoint_url} API call failed with status code: {response.status_code}.")
+            logging.error(response.text)
+            logging.error(f"Failed request URL and params: {response.request.url}")
+            try:
+                error = response.json()
             except requests.exceptions.JSONDecodeError:
-                logging.error(f"Unexpected response from {endpoint_url}")
-                logging.error(f"Expected JSON response, but received this instead: {response.text}")
-                raise SystemExit
+                error = {}
+            raise APIRequestError(f"{endpoint_url} API call failed with status code "
+                                  f"{response.status_code}", response.status_code,
+                                  error.get('error_name'), error.get('error_message'))
 
-            if not response.json().get('has_more'):
-                break
+        try:
+            response_data = response.json()
+        except requests.exceptions.JSONDecodeError:
+            logging.error(f"Unexpected response from {endpoint_url}")
+            logging.error(f"Expected JSON response, but received this instead: {response.text}")
+            raise SystemExit
 
-            # If the endpoint gets overloaded, it will send a backoff request in the response
-            # Failure to backoff will result in a 502 error (throttle_violation)
-            # Rate limiting documentation: https://api.stackexchange.com/docs/throttle
-            if response.json().get('backoff'):
-                backoff_time = response.json().get('backoff') + 1
-                logging.warning(f"API backoff request received. Waiting {backoff_time} seconds...")
-                time.sleep(backoff_time)
+        # If the endpoint gets overloaded, it will send a backoff request in the response
+        # Failure to backoff will result in a 502 error (throttle_violation)
+        # The backoff applies to every worker, not just the one that received it
+        # Rate limiting documentation: https://api.stackexchange.com/docs/throttle
+        if response_data.get('backoff'):
+            self.throttle.set_backoff(response_data.get('backoff') + 1)
+        self.throttle.update_quota(response_data.get('quota_remaining'),
+                                   response_data.get('quota_max'))
 
-            params['page'] += 1
+        return response_data
 
-        return items
+
+def is_id_list_error(error):
+
+    # The request was rejected because of the list of IDs in its URL: the URL was too long
+    # (HTTP 414, or an HTTP 400 from the web server rather than the API), or the API rejected
+    # the `ids` parameter
+    if error.status_code == 414:
+        return True
+    if error.status_code != 400:
+        return False
+    if error.error_name is None:  # not an API error response
+        return True
+
+    return error.error_name == 'bad_parameter' and \
+        re.search(r'\bids?\b', error.error_message or '', re.IGNORECASE) is not None
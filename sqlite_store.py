@@ -0,0 +1,489 @@
+# Standard Python libraries
+import itertools
+import logging
+import os
+import sqlite3
+
+# Third-party libraries
+import numpy as np
+
+# Local libraries
+from columnar import flatten_post, flatten_questions
+
+DB_FILE = 'so4t.db'
+
+# Questions, answers, comments, articles, and users use the same flat layout as the columnar
+# data files: nested owners become `owner_id` (NULL for deleted users) and `owner_display_name`.
+# Tags of questions and articles are stored in their own tables so they can be indexed.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    question_id INTEGER PRIMARY KEY,
+    owner_id INTEGER,
+    owner_display_name TEXT,
+    creation_date INTEGER,
+    last_activity_date INTEGER,
+    view_count INTEGER,
+    up_vote_count INTEGER,
+    down_vote_count INTEGER,
+    answer_count INTEGER,
+    comment_count INTEGER,
+    link TEXT
+);
+CREATE TABLE IF NOT EXISTS question_tags (
+    question_id INTEGER,
+    tag_name TEXT,
+    position INTEGER
+);
+CREATE TABLE IF NOT EXISTS answers (
+    answer_id INTEGER PRIMARY KEY,
+    question_id INTEGER,
+    owner_id INTEGER,
+    owner_display_name TEXT,
+    creation_date INTEGER,
+    is_accepted INTEGER,
+    up_vote_count INTEGER,
+    down_vote_count INTEGER,
+    position INTEGER
+);
+CREATE TABLE IF NOT EXISTS comments (
+    comment_id INTEGER PRIMARY KEY,
+    post_id INTEGER,
+    post_type TEXT,
+    question_id INTEGER,
+    owner_id INTEGER,
+    owner_display_name TEXT,
+    creation_date INTEGER,
+    position INTEGER
+);
+CREATE TABLE IF NOT EXISTS articles (
+    article_id INTEGER PRIMARY KEY,
+    owner_id INTEGER,
+    owner_display_name TEXT,
+    creation_date INTEGER,
+    last_activity_date INTEGER,
+    view_count INTEGER,
+    score INTEGER,
+    comment_count INTEGER,
+    link TEXT
+);
+CREATE TABLE IF NOT EXISTS article_tags (
+    article_id INTEGER,
+    tag_name TEXT,
+    position INTEGER
+);
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    account_id INTEGER,
+    display_name TEXT,
+    reputation INTEGER,
+    creation_date INTEGER,
+    last_access_date INTEGER,
+    is_deactivated INTEGER,
+    moderator INTEGER,
+    email TEXT,
+    title TEXT,
+    department TEXT,
+    external_id TEXT,
+    link TEXT
+);
+CREATE TABLE IF NOT EXISTS tags (
+    tag_id INTEGER PRIMARY KEY,
+    name TEXT,
+    post_count INTEGER,
+    watcher_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS smes (
+    tag_id INTEGER,
+    user_id INTEGER,
+    group_id INTEGER  -- NULL for individual SMEs
+);
+CREATE TABLE IF NOT EXISTS reputation_history (
+    user_id INTEGER,
+    creation_date INTEGER,
+    post_id INTEGER,
+    reputation_change INTEGER,
+    reputation_history_type TEXT
+);
+
+CREATE INDEX IF NOT EXISTS questions_owner ON questions (owner_id);
+CREATE INDEX IF NOT EXISTS questions_creation_date ON questions (creation_date);
+CREATE INDEX IF NOT EXISTS question_tags_question_position ON question_tags (question_id, position);
+CREATE INDEX IF NOT EXISTS question_tags_tag ON question_tags (tag_name);
+CREATE INDEX IF NOT EXISTS answers_question_position ON answers (question_id, position);
+CREATE INDEX IF NOT EXISTS answers_owner ON answers (owner_id);
+CREATE INDEX IF NOT EXISTS answers_creation_date ON answers (creation_date);
+CREATE INDEX IF NOT EXISTS comments_question_post ON comments (question_id, post_type, post_id,
+                                                  position);
+CREATE INDEX IF NOT EXISTS comments_owner ON comments (owner_id);
+CREATE INDEX IF NOT EXISTS comments_creation_date ON comments (creation_date);
+CREATE INDEX IF NOT EXISTS articles_owner ON articles (owner_id);
+CREATE INDEX IF NOT EXISTS articles_creation_date ON articles (creation_date);
+CREATE INDEX IF NOT EXISTS article_tags_article_position ON article_tags (article_id, position);
+CREATE INDEX IF NOT EXISTS article_tags_tag ON article_tags (tag_name);
+CREATE INDEX IF NOT EXISTS smes_tag ON smes (tag_id);
+CREATE INDEX IF NOT EXISTS smes_user ON smes (user_id);
+CREATE INDEX IF NOT EXISTS reputation_history_user ON reputation_history (user_id);
+CREATE INDEX IF NOT EXISTS reputation_history_creation_date ON reputation_history (creation_date);
+"""
+
+QUESTION_COLUMNS = ['question_id', 'owner_id', 'owner_display_name', 'creation_date',
+                    'last_activity_date', 'view_count', 'up_vote_count', 'down_vote_count',
+                    'answer_count', 'comment_count', 'link']
+ANSWER_COLUMNS = ['answer_id', 'question_id', 'owner_id', 'owner_display_name', 'creation_date',
+                  'is_accepted', 'up_vote_count', 'down_vote_count', 'position']
+COMMENT_COLUMNS = ['comment_id', 'post_id', 'post_type', 'question_id', 'owner_id',
+                   'owner_display_name', 'creation_date', 'position']
+ARTICLE_COLUMNS = ['article_id', 'owner_id', 'owner_display_name', 'creation_date',
+                   'last_activity_date', 'view_count', 'score', 'comment_count', 'link']
+USER_COLUMNS = ['user_id', 'account_id', 'display_name', 'reputation', 'creation_date',
+                'last_access_date', 'is_deactivated', 'moderator', 'email', 'title', 'department',
+                'external_id', 'link']
+REPUTATION_HISTORY_COLUMNS = ['user_id', 'creation_date', 'post_id', 'reputation_change',
+                              'reputation_history_type']
+CHILD_TABLES = {  # rows that belong to a question or article, keyed by its ID
+    'questions': ['question_tags', 'answers', 'comments'],
+    'articles': ['article_tags'],
+}
+
+
+def connect(directory):
+
+    connection = sqlite3.connect(os.path.join(directory, DB_FILE))
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+
+    return connection
+
+
+def db_exists(directory):
+
+    return os.path.exists(os.path.join(directory, DB_FILE))
+
+
+def upsert_api_data(api_data, directory, complete_datasets=(), from_date=None, to_date=None):
+    """Inserts or updates API data in the SQLite database. Questions, articles, and users are
+    upserted by ID, so incremental collections only need to pass the items that changed.
+    Tags, SMEs, and reputation history are replaced in full.
+
+    Questions, articles, and users that were collected in full (rather than incrementally) are
+    everything the API has, so any stored ones that are missing from them have been deleted
+    since the previous collection, and are removed. Questions and articles are only removed
+    within the date range they were collected for, if there was one.
+
+    Args:
+        api_data (dict): API data, keyed by dataset name (as exported to JSON by the collector)
+        directory (str): directory of the database file
+        complete_datasets (iterable): names of the datasets that were collected in full
+        from_date (int): Unix timestamp the questions and articles were collected from, if any
+        to_date (int): Unix timestamp the questions and articles were collected to, if any
+    """
+    connection = connect(directory)
+    with connection:  # single transaction
+        if api_data.get('questions') is not None:
+            questions = list(api_data['questions'])
+            upsert_questions(connection, questions)
+            if 'questions' in complete_datasets:
+                delete_missing(connection, 'questions', 'question_id',
+                               [question['question_id'] for question in questions],
+                               from_date, to_date)
+        if api_data.get('articles') is not None:
+            articles = list(api_data['articles'])
+            upsert_articles(connection, articles)
+            if 'articles' in complete_datasets:
+                delete_missing(connection, 'articles', 'article_id',
+                               [article['article_id'] for article in articles],
+                               from_date, to_date)
+        if api_data.get('users') is not None:
+            upsert_rows(connection, 'users', USER_COLUMNS, api_data['users'])
+            if 'users' in complete_datasets:  # users are never limited to a date range
+                delete_missing(connection, 'users', 'user_id',
+                               [user['user_id'] for user in api_data['users']])
+        if api_data.get('tags') is not None:
+            replace_tags(connection, api_data['tags'])
+        if api_data.get('reputation_history') is not None:
+            connection.execute("DELETE FROM reputation_history")
+            insert_rows(connection, 'reputation_history', REPUTATION_HISTORY_COLUMNS,
+                        api_data['reputation_history'])
+    connection.close()
+
+    logging.info(f"API data stored in {os.path.join(directory, DB_FILE)}")
+
+
+def delete_missing(connection, table, id_field, ids, from_date=None, to_date=None):
+
+    # The collected IDs go in a temporary table, so rows that aren't among them are found with
+    # a single indexed query however many there are
+    connection.execute("CREATE TEMP TABLE IF NOT EXISTS collected_ids (id INTEGER PRIMARY KEY)")
+    connection.execute("DELETE FROM collected_ids")
+    connection.executemany("INSERT OR IGNORE INTO collected_ids (id) VALUES (?)",
+                           [(item_id,) for item_id in ids])
+
+    where, params = build_filters('t', None, None, from_date=from_date, to_date=to_date)
+    where = f"{where} AND" if where else 'WHERE'
+    deleted = connection.execute(
+        f"DELETE FROM {table} AS t {where} t.{id_field} NOT IN (SELECT id FROM collected_ids)",
+        params).rowcount
+
+    # Tags, answers, and comments of deleted posts go with them
+    for child_table in CHILD_TABLES.get(table, []):
+        connection.execute(f"DELETE FROM {child_table} WHERE {id_field} NOT IN "
+                           f"(SELECT {id_field} FROM {table})")
+
+    if deleted:
+        logging.info(f"Removed {deleted} {table} that are no longer returned by the API")
+
+
+def upsert_questions(connection, questions):
+
+    question_ids = [(question['question_id'],) for question in questions]
+
+    # Answers and comments of updated questions are replaced, which also removes any that
+    # have been deleted since the previous collection
+    for table in ['question_tags', 'answers', 'comments']:
+        connection.executemany(f"DELETE FROM {table} WHERE question_id = ?", question_ids)
+
+    tables = flatten_questions(questions)
+    add_positions(tables['answers'], 'question_id')
+    add_positions(tables['comments'], 'post_id')
+    upsert_rows(connection, 'questions', QUESTION_COLUMNS, tables['questions'])
+    upsert_rows(connection, 'answers', ANSWER_COLUMNS, tables['answers'])
+    upsert_rows(connection, 'comments', COMMENT_COLUMNS, tables['comments'])
+    insert_tags(connection, 'question_tags', 'question_id', questions)
+
+
+def upsert_articles(connection, articles):
+
+    connection.executemany("DELETE FROM article_tags WHERE article_id = ?",
+                           [(article['article_id'],) for article in articles])
+    upsert_rows(connection, 'articles', ARTICLE_COLUMNS,
+                [flatten_post(article) for article in articles])
+    insert_tags(connection, 'article_tags', 'article_id', articles)
+
+
+def replace_tags(connection, tags):
+
+    connection.execute("DELETE FROM tags")
+    connection.execute("DELETE FROM smes")
+    connection.executemany(
+        "INSERT INTO tags (tag_id, name, post_count, watcher_count) VALUES (?, ?, ?, ?)",
+        [(tag['id'], tag['name'], tag.get('postCount'), tag.get('watcherCount'))
+         for tag in tags])
+
+    sme_rows = []
+    for tag in tags:
+        for user in tag['smes']['users']:
+            sme_rows.append((tag['id'], user['id'], None))
+        for group in tag['smes']['userGroups']:
+            for user in group['users']:
+                sme_rows.append((tag['id'], user['id'], group['id']))
+    connection.executemany("INSERT INTO smes (tag_id, user_id, group_id) VALUES (?, ?, ?)",
+                           sme_rows)
+
+
+def add_positions(rows, parent_field):
+
+    # Keep track of the order of answers and comments within their parent post
+    positions = {}
+    for row in rows:
+        key = (row.get('post_type'), row[parent_field])
+        row['position'] = positions.get(key, 0)
+        positions[key] = row['position'] + 1
+
+
+def insert_tags(connection, table, id_field, posts):
+
+    rows = [(post[id_field], tag_name, position)
+            for post in posts for position, tag_name in enumerate(post.get('tags', []))]
+    connection.executemany(
+        f"INSERT INTO {table} ({id_field}, tag_name, position) VALUES (?, ?, ?)", rows)
+
+
+def upsert_rows(connection, table, columns, rows):
+
+    placeholders = ', '.join('?' for _ in columns)
+    connection.executemany(
+        f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+        [tuple(row.get(column) for column in columns) for row in rows])
+
+
+def insert_rows(connection, table, columns, rows):
+
+    placeholders = ', '.join('?' for _ in columns)
+    connection.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+        (tuple(row.get(column) for column in columns) for row in rows))
+
+
+def stream_questions(directory, tag=None, from_date=None, to_date=None):
+    """Yields questions, with their answers and comments nested in the same shape as the API
+    data, optionally limited to a tag and/or a range of creation dates.
+
+    Each table is read with a single query, ordered by question ID, and the rows of each
+    question are merged as the questions are read (as `columnar.stream_questions` does), rather
+    than querying the tags, answers, and comments of every question separately.
+
+    Args:
+        directory (str): directory of the database file
+        tag (str): only include questions with this tag
+        from_date (int): only include questions created on or after this Unix timestamp
+        to_date (int): only include questions created on or before this Unix timestamp
+
+    Yields:
+        question (dict)
+    """
+    connection = connect(directory)
+    where, params = build_filters('q', 'question_tags', 'question_id', tag, from_date, to_date)
+
+    questions = connection.execute(
+        f"SELECT q.* FROM questions q {where} ORDER BY q.question_id", params)
+    tags = RowGroups(connection.execute(
+        f"SELECT t.question_id, t.tag_name FROM question_tags t "
+        f"JOIN questions q ON q.question_id = t.question_id {where} "
+        f"ORDER BY t.question_id, t.position", params), 'question_id')
+    answers = RowGroups(connection.execute(
+        f"SELECT a.* FROM answers a JOIN questions q ON q.question_id = a.question_id {where} "
+        f"ORDER BY a.question_id, a.position", params), 'question_id')
+    comments = RowGroups(connection.execute(
+        f"SELECT c.* FROM comments c JOIN questions q ON q.question_id = c.question_id {where} "
+        f"ORDER BY c.question_id, c.post_type, c.post_id, c.position", params), 'question_id')
+
+    for question in questions:
+        question = nest_owner(dict(question))
+        question_id = question['question_id']
+        question['tags'] = [row['tag_name'] for row in tags.take(question_id)]
+
+        question_comments = comments.take(question_id)
+        comments_by_answer = {}
+        for comment in question_comments:
+            if comment['post_type'] == 'answer':
+                comments_by_answer.setdefault(comment['post_id'], []).append(comment)
+        question_comments = [nest_owner(dict(comment)) for comment in question_comments
+                             if comment['post_type'] == 'question']
+        if question_comments:
+            question['comments'] = question_comments
+
+        question_answers = [nest_owner(dict(answer)) for answer in answers.take(question_id)]
+        for answer in question_answers:
+            answer['is_accepted'] = bool(answer['is_accepted'])
+            answer_comments = [nest_owner(dict(comment))
+                               for comment in comments_by_answer.get(answer['answer_id'], [])]
+            if answer_comments:
+                answer['comments'] = answer_comments
+        if question_answers:
+            question['answers'] = question_answers
+
+        yield question
+
+    connection.close()
+
+
+def stream_articles(directory, tag=None, from_date=None, to_date=None):
+
+    connection = connect(directory)
+    where, params = build_filters('a', 'article_tags', 'article_id', tag, from_date, to_date)
+
+    articles = connection.execute(
+        f"SELECT a.* FROM articles a {where} ORDER BY a.article_id", params)
+    tags = RowGroups(connection.execute(
+        f"SELECT t.article_id, t.tag_name FROM article_tags t "
+        f"JOIN articles a ON a.article_id = t.article_id {where} "
+        f"ORDER BY t.article_id, t.position", params), 'article_id')
+    for article in articles:
+        article = nest_owner(dict(article))
+        article['tags'] = [row['tag_name'] for row in tags.take(article['article_id'])]
+        yield article
+
+    connection.close()
+
+
+class RowGroups(object):
+    def __init__(self, rows, key):
+        """
+        Rows of a query ordered by `key` (e.g. the answers of each question, ordered by question
+        ID), from which the rows of each key are taken in the same order. Only the rows of the
+        current key are held in memory.
+        """
+        self.groups = itertools.groupby(rows, key=lambda row: row[key])
+        self.next_group = next(self.groups, None)
+
+    def take(self, key):
+
+        # Keys are taken in ascending order, so any groups before `key` have no parent row and
+        # are skipped
+        while self.next_group is not None and self.next_group[0] < key:
+            self.next_group = next(self.groups, None)
+
+        if self.next_group is None or self.next_group[0] != key:
+            return []
+        rows = list(self.next_group[1])
+        self.next_group = next(self.groups, None)
+        return rows
+
+
+def stream_reputation_history(directory, from_date=None, to_date=None):
+
+    connection = connect(directory)
+    where, params = build_filters('r', None, None, from_date=from_date, to_date=to_date)
+
+    for event in connection.execute(f"SELECT r.* FROM reputation_history r {where}", params):
+        yield dict(event)
+
+    connection.close()
+
+
+def build_filters(alias, tag_table, id_field, tag=None, from_date=None, to_date=None):
+
+    conditions = []
+    params = []
+    if tag:
+        conditions.append(
+            f"{alias}.{id_field} IN (SELECT {id_field} FROM {tag_table} WHERE tag_name = ?)")
+        params.append(tag)
+    if from_date:
+        conditions.append(f"{alias}.creation_date >= ?")
+        params.append(from_date)
+    if to_date:
+        conditions.append(f"{alias}.creation_date <= ?")
+        params.append(to_date)
+
+    where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+    return where, params
+
+
+def nest_owner(row):
+
+    # Restore the owner object as the API returns it; deleted users have no `user_id` field
+    owner = {'display_name': row.pop('owner_display_name')}
+    owner_id = row.pop('owner_id')
+    if owner_id is not None:
+        owner['user_id'] = owner_id
+    row['owner'] = owner
+    row.pop('position', None)
+
+    return row
+
+
+def read_kr_columns(directory):
+
+    # The deleted-author flag is aggregated in SQL, so knowledge reuse metrics only need to
+    # read three columns per question and article
+    connection = connect(directory)
+    rows = connection.execute("""
+        SELECT creation_date, view_count,
+               owner_id IS NULL OR EXISTS (
+                   SELECT 1 FROM answers a
+                   WHERE a.question_id = q.question_id AND a.owner_id IS NULL
+               ) AS deleted
+        FROM questions q
+        UNION ALL
+        SELECT creation_date, view_count, owner_id IS NULL AS deleted
+        FROM articles
+    """).fetchall()
+    connection.close()
+
+    creation_dates = np.array([row['creation_date'] for row in rows], dtype=np.int64)
+    view_counts = np.array([row['view_count'] for row in rows], dtype=np.int64)
+    deleted_flags = np.array([row['deleted'] for row in rows], dtype=bool)
+
+    return creation_dates, view_counts, deleted_flags
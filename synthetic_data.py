@@ -0,0 +1,292 @@
+'''
+Generates a synthetic dataset in the same format as the data collected from the API, so that the
+report pipeline can be run (and benchmarked) without access to a real instance.
+
+Activity is skewed the way it is on a real instance: a few tags and users account for most of
+the content (Zipf distributions), and a fraction of the content is owned by deleted users.
+'''
+
+# Standard Python libraries
+import argparse
+from itertools import accumulate, count
+import logging
+import os
+import random
+import time
+
+# Local libraries
+from collector import DATA_DIR, export_items_to_json
+
+ARTICLE_RATIO = 0.1  # share of posts that are articles
+ANSWERS_PER_QUESTION = 1.25  # on average; the rest of the posts are split between Q&A
+DELETED_USER_RATIO = 0.05  # share of content owned by deleted users
+DEPARTMENTS = ['Engineering', 'Sales', 'Support', 'Marketing', 'Finance', 'Operations', None]
+SECONDS_PER_DAY = 60 * 60 * 24
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Generates synthetic questions, articles, users, tags, and communities.')
+    parser.add_argument('--posts', type=int, default=10000,
+                        help='Total number of questions, answers, and articles. Default is '
+                        '10000.')
+    parser.add_argument('--users', type=int,
+                        help='Number of users. Default is one per 20 posts.')
+    parser.add_argument('--tags', type=int,
+                        help='Number of tags. Default is one per 100 posts (up to 5000).')
+    parser.add_argument('--deleted-ratio', type=float, default=DELETED_USER_RATIO,
+                        help='Share of content owned by deleted users. Default is '
+                        f'{DELETED_USER_RATIO}.')
+    parser.add_argument('--years', type=float, default=3,
+                        help='Number of years the content is spread over. Default is 3.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed, so the same dataset can be generated again. '
+                        'Default is 0.')
+    parser.add_argument('--directory', default=DATA_DIR,
+                        help=f'Directory to write the JSON files to. Default is "{DATA_DIR}".')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(message)s')
+    generate_data(args.directory, args.posts, args.users, args.tags, args.deleted_ratio,
+                  args.years, args.seed)
+
+
+def generate_data(directory, post_count, user_count=None, tag_count=None,
+                  deleted_ratio=DELETED_USER_RATIO, years=3, seed=0):
+    """
+    Writes questions.json, articles.json, users.json, tags.json, communities.json, and
+    reputation_history.json to `directory`. Questions and articles are written one at a time,
+    so datasets of millions of posts can be generated without holding them in memory.
+
+    Args:
+        directory (str): directory to write the JSON files to
+        post_count (int): total number of questions, answers, and articles
+        user_count (int): number of (active) users; defaults to one per 20 posts
+        tag_count (int): number of tags; defaults to one per 100 posts, up to 5000
+        deleted_ratio (float): share of content owned by deleted users
+        years (float): number of years the content is spread over, up to now
+        seed (int): random seed
+    """
+    generator = SyntheticData(post_count, user_count, tag_count, deleted_ratio, years, seed)
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    logging.info(f'Generating {generator.question_count} questions (with about '
+                 f'{round(generator.question_count * ANSWERS_PER_QUESTION)} answers) and '
+                 f'{generator.article_count} articles in "{directory}"...')
+    export_items_to_json('questions', generator.questions(), directory)
+    export_items_to_json('articles', generator.articles(), directory)
+    export_items_to_json('reputation_history', generator.reputation_history(), directory)
+    export_items_to_json('users', generator.users, directory)
+    export_items_to_json('tags', generator.tags, directory)
+    export_items_to_json('communities', generator.communities, directory)
+
+
+class SyntheticData(object):
+    def __init__(self, post_count, user_count=None, tag_count=None,
+                 deleted_ratio=DELETED_USER_RATIO, years=3, seed=0):
+
+        self.random = random.Random(seed)
+        self.now = int(time.time())
+        self.start = self.now - int(years * 365 * SECONDS_PER_DAY)
+        self.deleted_ratio = deleted_ratio
+
+        self.article_count = round(post_count * ARTICLE_RATIO)
+        self.question_count = max(
+            round((post_count - self.article_count) / (1 + ANSWERS_PER_QUESTION)), 1)
+
+        user_count = user_count or max(post_count // 20, 10)
+        tag_count = tag_count or min(max(post_count // 100, 10), 5000)
+
+        self.users = [self.create_user(user_id) for user_id in range(1, user_count + 1)]
+        self.tags = [self.create_tag(tag_id, user_count) for tag_id in range(1, tag_count + 1)]
+        self.communities = [self.create_community(community_id)
+                            for community_id in range(1, max(tag_count // 20, 1) + 1)]
+
+        # Cumulative weights, so that skewed choices are a binary search rather than a scan
+        self.user_weights = zipf_weights(user_count, 1.0)
+        self.tag_weights = zipf_weights(tag_count, 1.1)
+        self.deleted_user_ids = range(user_count + 1, user_count + 1 + max(user_count // 10, 1))
+
+        # Questions, answers, and articles share one sequence of post IDs, and comments have their
+        # own, so that IDs are unique the way they are on a real instance
+        self.post_ids = count(1)
+        self.comment_ids = count(1)
+
+    def create_user(self, user_id):
+
+        creation_date = self.random.randint(self.start - 365 * SECONDS_PER_DAY, self.now)
+        user = {
+            'user_id': user_id,
+            'display_name': f'Synthetic User {user_id}',
+            'reputation': int(self.random.paretovariate(1.2)) * 10,
+            'creation_date': creation_date,
+            'last_access_date': self.random.randint(creation_date, self.now),
+            'link': f'https://example.com/users/{user_id}',
+            'email': f'user{user_id}@example.com',
+            'title': self.random.choice(['Engineer', 'Manager', 'Analyst', 'Director', None]),
+            'department': self.random.choice(DEPARTMENTS),
+            'external_id': None,
+            'account_id': user_id + 100000,
+            'moderator': self.random.random() < 0.01
+        }
+        if self.random.random() < 0.05:
+            user['is_deactivated'] = True
+
+        return user
+
+    def create_tag(self, tag_id, user_count):
+
+        sme_count = self.random.choice([0, 0, 1, 2, 3, 5])
+        return {
+            'id': tag_id,
+            'name': f'tag-{tag_id}',
+            'watcherCount': int(self.random.paretovariate(1.5)),
+            'subjectMatterExpertCount': sme_count,
+            'smes': {
+                'users': [{'id': self.random.randint(1, user_count)} for _ in range(sme_count)],
+                'userGroups': [
+                    {'id': tag_id, 'users': [{'id': self.random.randint(1, user_count)}
+                                             for _ in range(3)]}
+                ] if self.random.random() < 0.1 else []
+            }
+        }
+
+    def create_community(self, community_id):
+
+        return {
+            'id': community_id,
+            'name': f'Community {community_id}',
+            'tags': [{'name': tag['name']} for tag in self.random.sample(
+                self.tags, min(len(self.tags), self.random.randint(1, 10)))]
+        }
+
+    def owner(self):
+
+        if self.random.random() < self.deleted_ratio:
+            # Deleted users only have a display name, which contains their former user ID
+            return {'display_name': f'user{self.random.choice(self.deleted_user_ids)}'}
+
+        user = self.users[self.random.choices(range(len(self.users)),
+                                              cum_weights=self.user_weights)[0]]
+        return {'user_id': user['user_id'], 'display_name': user['display_name']}
+
+    def post_tags(self):
+
+        tag_indexes = set(self.random.choices(range(len(self.tags)), cum_weights=self.tag_weights,
+                                              k=self.random.randint(1, 5)))
+        return [self.tags[index]['name'] for index in tag_indexes]
+
+    def response_date(self, creation_date):
+
+        # Most responses come within hours, but some take months
+        return min(creation_date + int(self.random.lognormvariate(9, 2)), self.now)
+
+    def comments(self, post_id, creation_date):
+
+        comments = []
+        for _ in range(self.random.choice([0, 0, 0, 1, 1, 2, 3])):
+            comments.append({
+                'comment_id': next(self.comment_ids),
+                'post_id': post_id,
+                'owner': self.owner(),
+                'creation_date': self.response_date(creation_date),
+                'score': self.random.randint(0, 2),
+                'body': 'Synthetic comment.'
+            })
+        return comments
+
+    def questions(self):
+
+        for _ in range(self.question_count):
+            question_id = next(self.post_ids)
+            creation_date = self.random.randint(self.start, self.now)
+            question = {
+                'question_id': question_id,
+                'title': f'Synthetic question {question_id}',
+                'owner': self.owner(),
+                'creation_date': creation_date,
+                'last_activity_date': creation_date,
+                'view_count': int(self.random.paretovariate(1.1) * 10),
+                'up_vote_count': int(self.random.expovariate(0.5)),
+                'down_vote_count': int(self.random.expovariate(3)),
+                'tags': self.post_tags(),
+                'link': f'https://example.com/questions/{question_id}',
+                'body': 'Synthetic question body.',
+                'is_answered': False
+            }
+
+            # The number of answers is geometrically distributed, averaging ANSWERS_PER_QUESTION
+            answers = []
+            while self.random.random() < ANSWERS_PER_QUESTION / (1 + ANSWERS_PER_QUESTION):
+                answer_id = next(self.post_ids)
+                answer = {
+                    'answer_id': answer_id,
+                    'question_id': question_id,
+                    'owner': self.owner(),
+                    'creation_date': self.response_date(creation_date),
+                    'is_accepted': not answers and self.random.random() < 0.3,
+                    'up_vote_count': int(self.random.expovariate(0.5)),
+                    'down_vote_count': int(self.random.expovariate(3)),
+                    'body': 'Synthetic answer body.'
+                }
+                answer_comments = self.comments(answer_id, answer['creation_date'])
+                if answer_comments:
+                    answer['comments'] = answer_comments
+                answer['comment_count'] = len(answer_comments)
+                answers.append(answer)
+
+            answers.sort(key=lambda k: k['creation_date'])
+            question_comments = self.comments(question_id, creation_date)
+            if answers:
+                question['answers'] = answers
+                question['is_answered'] = True
+            if question_comments:
+                question['comments'] = question_comments
+            question['answer_count'] = len(answers)
+            question['comment_count'] = len(question_comments)
+
+            yield question
+
+    def articles(self):
+
+        for _ in range(self.article_count):
+            article_id = next(self.post_ids)
+            creation_date = self.random.randint(self.start, self.now)
+            yield {
+                'article_id': article_id,
+                'title': f'Synthetic article {article_id}',
+                'owner': self.owner(),
+                'creation_date': creation_date,
+                'last_activity_date': creation_date,
+                'view_count': int(self.random.paretovariate(1.1) * 20),
+                'score': int(self.random.expovariate(0.3)),
+                'comment_count': self.random.choice([0, 0, 1, 2]),
+                'tags': self.post_tags(),
+                'link': f'https://example.com/articles/{article_id}',
+                'body': 'Synthetic article body.'
+            }
+
+    def reputation_history(self):
+
+        for user in self.users:
+            for _ in range(min(int(self.random.paretovariate(1.5)), 100)):
+                yield {
+                    'user_id': user['user_id'],
+                    'creation_date': self.random.randint(user['creation_date'], self.now),
+                    'post_id': self.random.randint(1, self.question_count),
+                    'reputation_change': self.random.choice([10, 10, 10, 15, 2, -2]),
+                    'reputation_history_type': 'post_upvoted'
+                }
+
+
+def zipf_weights(size, exponent):
+
+    return list(accumulate(1 / rank ** exponent for rank in range(1, size + 1)))
+
+
+if __name__ == '__main__':
+
+    main()
@@ -1,199 +1,251 @@
-# Standard Python libraries
-import statistics
+# Local libraries
+from quantiles import QuantileSketch
+from sme_index import create_sme_index
+from traversal import Accumulator, traverse
 
 
-def create_tag_metrics(questions, articles, tags, communities):
+def create_tag_metrics(questions, articles, tags, communities, sme_index=None):
 
-    tags = process_tags(tags)
-    tags = process_questions(tags, questions)
-    tags = process_articles(tags, articles)
-    # tags = process_users(tags, api_data['users']
-    tags = process_communities(tags, communities)
-
-    # tally up miscellaneous metrics for each tag
-    for tag in tags:
-        # Calculate unique contributors
-        tag['metrics']['unique_askers'] = len(tag['contributors']['askers'])
-        tag['metrics']['unique_answerers'] = len(tag['contributors']['answerers'])
-        tag['metrics']['unique_commenters'] = len(tag['contributors']['commenters'])
-        tag['metrics']['unique_article_contributors'] = len(
-            tag['contributors']['article_contributors'])
-        tag['metrics']['total_unique_contributors'] = len(set(
-            tag['contributors']['askers'] +
-            tag['contributors']['answerers'] +
-            tag['contributors']['commenters'] +
-            tag['contributors']['article_contributors']))
-
-        # Calculate total self-answered questions
-        tag['metrics']['questions_self_answered'] = len(tag['self_answered_questions'])
-
-        # Calculate median time to first answer and median time to first response
-        try:
-            tag['metrics']['median_time_to_first_response_hours'] = round(statistics.median(
-                [list(response.values())[0] for response in tag['response_times']]), 2)
-        except statistics.StatisticsError:  # if there are no responses for a tag
-            pass
-
-        try:
-            tag['metrics']['median_time_to_first_answer_hours'] = round(statistics.median(
-                [list(answer.values())[0] for answer in tag['answer_times']]), 2)
-        except statistics.StatisticsError:  # if there are no answers for a tag
-            pass
-
-        # Sort responses and answers by time to first response/answer, in descending order
-        tag['response_times'] = sorted(
-            tag['response_times'],
-            key=lambda k: list(k.values())[0],
-            reverse=True)
-        tag['answer_times'] = sorted(
-            tag['answer_times'],
-            key=lambda k: list(k.values())[0],
-            reverse=True)
-
-    tag_metrics = [tag['metrics'] for tag in tags]
-    tag_metrics = sorted(tag_metrics, key=lambda k: k['total_page_views'], reverse=True)
-
-    return tag_metrics
+    tag_metrics = TagMetrics(tags, communities, sme_index)
+    traverse(questions, articles, [tag_metrics])
 
+    return tag_metrics.result()
 
-def process_tags(tags):
 
-    for tag in tags:
-        tag['metrics'] = {
-            'tag_name': tag['name'],
-            'total_page_views': 0,
-            'webhooks': 0,
-            'tag_watchers': tag['watcherCount'],
-            'communities': 0,
-            'total_smes': 0,
-            'median_time_to_first_answer_hours': 0,
-            'median_time_to_first_response_hours': 0,
-            'total_unique_contributors': 0,
-            'unique_askers': 0,
-            'unique_answerers': 0,
-            'unique_commenters': 0,
-            'unique_article_contributors': 0,
-            'question_count': 0,
-            'question_upvotes': 0,
-            'question_downvotes': 0,
-            'question_comments': 0,
-            'questions_no_answers': 0,
-            'questions_accepted_answer': 0,
-            'questions_self_answered': 0,
-            'answer_count': 0,
-            'sme_answers': 0,
-            'answer_upvotes': 0,
-            'answer_downvotes': 0,
-            'answer_comments': 0,
-            'article_count': 0,
-            'article_upvotes': 0,
-            'article_comments': 0,
-        }
-        tag['contributors'] = {
-            'askers': [],
-            'answerers': [],
-            'article_contributors': [],
-            'commenters': [],
-            'individual_smes': [],
-            'group_smes': []
-        }
-        tag['answer_times'] = []
-        tag['response_times'] = []
-        tag['self_answered_questions'] = []
-
-        # calculate total unique SMEs, including individuals and groups
-        for user in tag['smes']['users']:
-            tag['contributors']['individual_smes'] = add_user_to_list(
-                user['id'], tag['contributors']['individual_smes'])
-        for group in tag['smes']['userGroups']:
-            for user in group['users']:
-                tag['contributors']['group_smes'] = add_user_to_list(
-                    user['id'], tag['contributors']['group_smes'])
-
-        tag['metrics']['total_smes'] = len(set(
-            tag['contributors']['individual_smes'] + tag['contributors']['group_smes']))
+class TagMetrics(Accumulator):
+    def __init__(self, tags, communities, sme_index=None):
+        """
+        Calculates tag metrics from the questions, answers, comments, and articles visited by
+        `traverse`.
 
-    return tags
+        Args:
+            tags (list): tags from the API, with their SMEs
+            communities (list): communities from the API; None if they weren't collected
+            sme_index (dict): SME user IDs mapped to tag names, as created by `create_sme_index`
+        """
+        if sme_index is None:
+            sme_index = create_sme_index(tags)
 
+        self.tags = process_tags(tags)
+        self.tag_index = create_tag_index(self.tags)
+        self.sme_index = sme_index
+        self.communities = communities
+        self.tags = process_smes(self.tags, self.tag_index, sme_index)
 
-def process_questions(tags, questions):
+    def add_question(self, question, asker_id):
 
-    for question in questions:
-        for tag in question['tags']:
-            tag_index = get_tag_index(tags, tag)
-            tag_data = tags[tag_index]
-            asker_id = validate_user_id(question['owner'])
-
-            tag_data['contributors']['askers'] = add_user_to_list(
-                asker_id, tag_data['contributors']['askers'])
-
-            tag_data['metrics']['question_count'] += 1
-            tag_data['metrics']['total_page_views'] += question['view_count']
-            tag_data['metrics']['question_upvotes'] += question['up_vote_count']
-            tag_data['metrics']['question_downvotes'] += question['down_vote_count']
-
-            # Calculate tag metrics for comments
-            if question.get('comments'):
-                tag_data, time_to_first_comment = process_question_comments(
-                    tag_data, question)
-            else:
-                time_to_first_comment = 0
+        # Times to first comment, answer, and response are the same for every tag of a question
+        if question.get('comments'):
+            time_to_first_comment = get_time_to_first_comment(question)
+        else:
+            time_to_first_comment = 0
 
-            # calculate tag metrics for answers
-            if question.get('answers'):
-                tag_data, time_to_first_answer = process_answers(
-                    tag_data, question['answers'], question)
-            else:
-                tag_data['metrics']['questions_no_answers'] += 1
-                time_to_first_answer = 0
-
-            # Calculate time to first response, which is the lesser of the time to first comment
-            # and the time to first answer
-            if time_to_first_answer > 0 and time_to_first_comment > 0:
-                time_to_first_response = min(time_to_first_answer, time_to_first_comment)
-            elif time_to_first_answer > 0:
-                time_to_first_response = time_to_first_answer
-            elif time_to_first_comment > 0:
-                # If the question is self-answered, the first comment is not considered a response
-                if question['link'] not in tag_data['self_answered_questions']:
-                    time_to_first_response = time_to_first_comment
-                else:
-                    time_to_first_response = None
+        if question.get('answers'):
+            time_to_first_answer, self_answered = get_time_to_first_answer(question)
+        else:
+            time_to_first_answer, self_answered = 0, False
+
+        # Calculate time to first response, which is the lesser of the time to first comment
+        # and the time to first answer
+        if time_to_first_answer > 0 and time_to_first_comment > 0:
+            time_to_first_response = min(time_to_first_answer, time_to_first_comment)
+        elif time_to_first_answer > 0:
+            time_to_first_response = time_to_first_answer
+        elif time_to_first_comment > 0:
+            # If the question is self-answered, the first comment is not considered a response
+            if not self_answered:
+                time_to_first_response = time_to_first_comment
             else:
                 time_to_first_response = None
+        else:
+            time_to_first_response = None
 
+        for tag in question['tags']:
+            tag_record = self.tag_index[tag]
+            tag_record.askers.add(asker_id)
+
+            tag_record.question_count += 1
+            tag_record.total_page_views += question['view_count']
+            tag_record.question_upvotes += question['up_vote_count']
+            tag_record.question_downvotes += question['down_vote_count']
+            if not question.get('answers'):
+                tag_record.questions_no_answers += 1
+
+            if self_answered:
+                tag_record.questions_self_answered += 1
+            if time_to_first_answer:
+                tag_record.answer_times.add(time_to_first_answer)
             if time_to_first_response:  # if there are no responses, don't add to list
-                tag_data['response_times'].append({question['link']: time_to_first_response})
+                tag_record.response_times.add(time_to_first_response)
 
-            tags[tag_index] = tag_data
+    def add_answer(self, answer, answerer_id, question):
 
-    return tags
+        for tag in question['tags']:
+            tag_record = self.tag_index[tag]
+            tag_record.answerers.add(answerer_id)
+            if answer['is_accepted']:
+                tag_record.questions_accepted_answer += 1
+            tag_record.answer_count += 1
+            tag_record.answer_upvotes += answer['up_vote_count']
+            tag_record.answer_downvotes += answer['down_vote_count']
+
+            # Calculate number of answers from SMEs
+            if tag_record.name in self.sme_index.get(answerer_id, []):
+                tag_record.sme_answers += 1
+
+    def add_comment(self, comment, commenter_id, post, question):
+
+        for tag in question['tags']:
+            tag_record = self.tag_index[tag]
+            tag_record.commenters.add(commenter_id)
+            if post is question:
+                tag_record.question_comments += 1
+            else:
+                tag_record.answer_comments += 1
+
+    def add_article(self, article, author_id):
+
+        for tag in article['tags']:
+            tag_record = self.tag_index[tag]
+            tag_record.total_page_views += article['view_count']
+            tag_record.article_count += 1
+            tag_record.article_upvotes += article['score']
+            tag_record.article_comments += article['comment_count']
+
+            # Add article author to list of contributors
+            tag_record.article_contributors.add(author_id)
+
+            # As of 2023.05.23, Article comments are slightly innaccurate due to a bug in the API
+            # if article.get('comments'):
+            #     for comment in article['comments']:
+            #         commenter_id = validate_user_id(comment)
+            #         tag_contributors[tag]['commenters'] = add_user_to_list(
+            #             commenter_id, tag_contributors[tag]['commenters']
+            #         )
+
+    def result(self):
+
+        tags = self.tags
+        # tags = process_users(tags, api_data['users']
+        tags = process_communities(tags, self.tag_index, self.communities)
+
+        tag_metrics = [tag.metrics(include_communities=self.communities is not None)
+                       for tag in tags]
+        tag_metrics = sorted(tag_metrics, key=lambda k: k['total_page_views'], reverse=True)
+
+        return tag_metrics
+
+
+class TagRecord(object):
+    # Running totals for a tag. Slots keep each record small, and only counters, contributor
+    # IDs, and response times are kept; the content itself is never retained.
+    __slots__ = (
+        'name', 'total_page_views', 'webhooks', 'tag_watchers', 'communities', 'total_smes',
+        'question_count', 'question_upvotes', 'question_downvotes', 'question_comments',
+        'questions_no_answers', 'questions_accepted_answer', 'questions_self_answered',
+        'answer_count', 'sme_answers', 'answer_upvotes', 'answer_downvotes', 'answer_comments',
+        'article_count', 'article_upvotes', 'article_comments',
+        'askers', 'answerers', 'article_contributors', 'commenters',
+        'answer_times', 'response_times'
+    )
+
+    def __init__(self, tag):
+
+        self.name = tag['name']
+        self.tag_watchers = tag['watcherCount']
+        for counter in ('total_page_views', 'webhooks', 'communities', 'total_smes',
+                        'question_count', 'question_upvotes', 'question_downvotes',
+                        'question_comments', 'questions_no_answers',
+                        'questions_accepted_answer', 'questions_self_answered', 'answer_count',
+                        'sme_answers', 'answer_upvotes', 'answer_downvotes', 'answer_comments',
+                        'article_count', 'article_upvotes', 'article_comments'):
+            setattr(self, counter, 0)
+
+        # Contributors are kept in sets, so adding a user and checking membership doesn't
+        # require scanning everyone who has already been added
+        self.askers = set()
+        self.answerers = set()
+        self.article_contributors = set()
+        self.commenters = set()
+
+        # Distributions of the times to first answer and first response (in hours) of the
+        # questions with the tag. Answers dated before their question (e.g. imported content) have
+        # always counted towards the time to first answer, so negative times are kept.
+        self.answer_times = QuantileSketch(positive_only=False)
+        self.response_times = QuantileSketch()
+
+    def metrics(self, include_communities=True):
+
+        answer_p50, answer_p90, answer_p99 = percentile_hours(self.answer_times)
+        response_p50, response_p90, response_p99 = percentile_hours(self.response_times)
+        metrics = {
+            'tag_name': self.name,
+            'total_page_views': self.total_page_views,
+            'webhooks': self.webhooks,
+            'tag_watchers': self.tag_watchers,
+            'communities': self.communities,
+            'total_smes': self.total_smes,
+            'median_time_to_first_answer_hours': answer_p50,
+            'median_time_to_first_response_hours': response_p50,
+            'p90_time_to_first_answer_hours': answer_p90,
+            'p99_time_to_first_answer_hours': answer_p99,
+            'p90_time_to_first_response_hours': response_p90,
+            'p99_time_to_first_response_hours': response_p99,
+            'total_unique_contributors': len(
+                self.askers | self.answerers | self.commenters | self.article_contributors),
+            'unique_askers': len(self.askers),
+            'unique_answerers': len(self.answerers),
+            'unique_commenters': len(self.commenters),
+            'unique_article_contributors': len(self.article_contributors),
+            'question_count': self.question_count,
+            'question_upvotes': self.question_upvotes,
+            'question_downvotes': self.question_downvotes,
+            'question_comments': self.question_comments,
+            'questions_no_answers': self.questions_no_answers,
+            'questions_accepted_answer': self.questions_accepted_answer,
+            'questions_self_answered': self.questions_self_answered,
+            'answer_count': self.answer_count,
+            'sme_answers': self.sme_answers,
+            'answer_upvotes': self.answer_upvotes,
+            'answer_downvotes': self.answer_downvotes,
+            'answer_comments': self.answer_comments,
+            'article_count': self.article_count,
+            'article_upvotes': self.article_upvotes,
+            'article_comments': self.article_comments,
+        }
+        if not include_communities:  # if no communities were collected, remove the metric
+            del metrics['communities']
+
+        return metrics
 
 
-def process_answers(tag_data, answers, question):
+def percentile_hours(times):
 
-    for answer in answers:
-        answerer_id = validate_user_id(answer['owner'])
-        tag_data['contributors']['answerers'] = add_user_to_list(
-            answerer_id, tag_data['contributors']['answerers'])
-        if answer['is_accepted']:
-            tag_data['metrics']['questions_accepted_answer'] += 1
-        tag_data['metrics']['answer_count'] += 1
-        tag_data['metrics']['answer_upvotes'] += answer['up_vote_count']
-        tag_data['metrics']['answer_downvotes'] += answer['down_vote_count']
+    # Median, 90th, and 99th percentile times to first answer/response; 0 if there are no
+    # answers/responses for a tag
+    if not times:
+        return 0, 0, 0
 
-        # Calculate number of answers from SMEs
-        if (answerer_id in tag_data['contributors']['group_smes']
-                or answerer_id in tag_data['contributors']['individual_smes']):
-            tag_data['metrics']['sme_answers'] += 1
+    return [round(hours, 2) for hours in times.quantiles(0.5, 0.9, 0.99)]
 
-        if answer.get('comments'):
-            tag_data['metrics']['answer_comments'] += len(answer['comments'])
-            for comment in answer['comments']:
-                commenter_id = validate_user_id(comment['owner'])
-                tag_data['contributors']['commenters'] = add_user_to_list(
-                    commenter_id, tag_data['contributors']['commenters']
-                )
+
+def process_tags(tags):
+
+    return [TagRecord(tag) for tag in tags]
+
+
+def process_smes(tags, tag_index, sme_index):
+
+    # calculate total unique SMEs, including individuals and groups
+    # `sme_index` lists each SME's tags once, so every entry is a unique SME for that tag
+    for tag_names in sme_index.values():
+        for tag_name in tag_names:
+            tag_index[tag_name].total_smes += 1
+
+    return tags
+
+
+def get_time_to_first_answer(question):
 
     # Calculate time to first answer (i.e. response) for questions
     # Deleted answers do not show up in the API response; they are not included in the calculation
@@ -204,33 +256,26 @@ def process_answers(tag_data, answers, question):
     # If the owner of the question has a 'user_id', we can validate it was not self-answered
     # If both uers have been deleted, the `display_name` attribute can be compared to see if they
         # are the same person
+    first_answer = question['answers'][0]
     time_to_first_answer = 0
-    if answers[0]['owner'].get('user_id'):  # answer owner is known
-        if answers[0]['owner']['user_id'] != question['owner'].get('user_id'):
-            time_to_first_answer = (answers[0]['creation_date'] - question['creation_date'])/60/60
+    self_answered = False
+    if first_answer['owner'].get('user_id'):  # answer owner is known
+        if first_answer['owner']['user_id'] != question['owner'].get('user_id'):
+            time_to_first_answer = (first_answer['creation_date'] - question['creation_date'])/60/60
         else:  # if answer owner is the same as question owner, it's a self-answer
-            tag_data['self_answered_questions'].append(question['link'])
+            self_answered = True
     elif question['owner'].get('user_id'):  # answer owner is unknown, but question owner is known
-        time_to_first_answer = (answers[0]['creation_date'] - question['creation_date'])/60/60
+        time_to_first_answer = (first_answer['creation_date'] - question['creation_date'])/60/60
     else:  # if both question and answer owner are unknown, check display names for a match
-        if answers[0]['owner']['display_name'] == question['owner']['display_name']:
-            tag_data['self_answered_questions'].append(question['link'])
+        if first_answer['owner']['display_name'] == question['owner']['display_name']:
+            self_answered = True
         else:
-            time_to_first_answer = (answers[0]['creation_date'] - question['creation_date'])/60/60
+            time_to_first_answer = (first_answer['creation_date'] - question['creation_date'])/60/60
 
-    if time_to_first_answer:
-        tag_data['answer_times'].append({question['link']: time_to_first_answer})
+    return time_to_first_answer, self_answered
 
-    return tag_data, time_to_first_answer
 
-
-def process_question_comments(tag_data, question):
-
-    tag_data['metrics']['question_comments'] += len(question['comments'])
-    for comment in question['comments']:
-        commenter_id = validate_user_id(comment['owner'])
-        tag_data['contributors']['commenters'] = add_user_to_list(
-            commenter_id, tag_data['contributors']['commenters'])
+def get_time_to_first_comment(question):
 
     # Calculate time to first comment
     # There's an edge case where the first comment is from the question asker,
@@ -253,39 +298,7 @@ def process_question_comments(tag_data, question):
     else:
         time_to_first_comment = 0
 
-    return tag_data, time_to_first_comment
-
-
-def process_articles(tags, articles):
-
-    for article in articles:
-        for tag in article['tags']:
-            tag_index = get_tag_index(tags, tag)
-            tag_data = tags[tag_index]
-            tag_data['metrics']['total_page_views'] += article['view_count']
-            tag_data['metrics']['article_count'] += 1
-            tag_data['metrics']['article_upvotes'] += article['score']
-            tag_data['metrics']['article_comments'] += article['comment_count']
-            tag_data['metrics']['unique_article_contributors'] = len(
-                tag_data['contributors']['article_contributors'])
-
-            # Add article author to list of contributors
-            article_author_id = validate_user_id(article['owner'])
-            tag_data['contributors']['article_contributors'] = add_user_to_list(
-                article_author_id, tag_data['contributors']['article_contributors']
-            )
-
-            # As of 2023.05.23, Article comments are slightly innaccurate due to a bug in the API
-            # if article.get('comments'):
-            #     for comment in article['comments']:
-            #         commenter_id = validate_user_id(comment)
-            #         tag_contributors[tag]['commenters'] = add_user_to_list(
-            #             commenter_id, tag_contributors[tag]['commenters']
-            #         )
-
-            tags[tag_index] = tag_data
-
-    return tags
+    return time_to_first_comment
 
 
 def process_users(tags, users):
@@ -294,81 +307,53 @@ def process_users(tags, users):
     return tags
 
 
-def process_communities(tags, communities):
+def process_communities(tags, tag_index, communities):
 
-    if communities is None:  # if no communities were collected, remove the metric from the report
-        for tag in tags:
-            del tag['metrics']['communities']
+    if communities is None:  # if no communities were collected, the metric is left out
         return tags
 
     # Search for tags in community descriptions and add community count to tag metrics
     for community in communities:
         for tag in community['tags']:
-            tag_index = get_tag_index(tags, tag['name'])
-            try:
-                tags[tag_index]['metrics']['communities'] += 1
-                try:
-                    tags[tag_index]['communities'] += community
-                except KeyError:  # if communities key does not exist, create it
-                    tags[tag_index]['communities'] = [community]
-            except TypeError:  # get_tag_index returned None
-                pass
+            tag_record = tag_index.get(tag['name'])
+            if tag_record is None:  # tag not found
+                continue
+            tag_record.communities += 1
 
     return tags
 
 
-def process_webhooks(tags, webhooks):
+def process_webhooks(tags, tag_index, webhooks):
 
-    if webhooks is None:  # if no webhooks were collected, remove the metric from the report
-        for tag in tags:
-            del tag['metrics']['webhooks']
+    if webhooks is None:  # if no webhooks were collected, the metric is left out
         return tags
 
     # Search for tags in webhook descriptions and add webhook count to tag metrics
     for webhook in webhooks:
         for tag_name in webhook['tags']:
-            tag_index = get_tag_index(tags, tag_name)
-            try:
-                tags[tag_index]['metrics']['webhooks'] += 1
-            except TypeError:  # get_tag_index returned None
-                pass
+            tag_record = tag_index.get(tag_name)
+            if tag_record is None:  # tag not found
+                continue
+            tag_record.webhooks += 1
 
     return tags
 
 
-def get_tag_index(tags, tag_name):
-
-    for index, tag in enumerate(tags):
-        if tag['name'] == tag_name:
-            return index
-
-    return None  # if tag is not found
-
-
-def add_user_to_list(user_id, user_list):
-    """Checks to see if a user_id already exists is in a list. If not, it adds the new user_id to
-    the list.
+def create_tag_index(tags):
+    """Creates a dictionary of tag name -> tag, so tags can be looked up by name without scanning
+    the full tag list.
 
     Args:
-        user_id (int): the unique user ID of a particular user in Stack Overflow
-        user_list (list): current user list
+        tags (list): tag records, as returned by `process_tags`
 
     Returns:
-        user_list (list): updated user list
+        tag_index (dict): tag records, keyed by tag name
     """
-    if user_id not in user_list:
-        user_list.append(user_id)
-    return user_list
-
-
-def validate_user_id(user):
-
-    try:
-        user_id = user['user_id']
-    except KeyError:  # if user_id is not present, the user was deleted
-        user_id = f"{user['display_name']} (DELETED)"
+    tag_index = {}
+    for tag in tags:
+        tag_index.setdefault(tag.name, tag)  # if a name is repeated, the first tag is used
 
-    return user_id
+    return tag_index
 
 
 # def export_to_csv(data_name, data):
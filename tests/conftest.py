@@ -0,0 +1,7 @@
+# Standard Python libraries
+import os
+import sys
+
+# The modules are top-level scripts rather than a package, so the tests import them from the
+# repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,108 @@
+# Standard Python libraries
+import random
+
+NOW = 1700000000  # fixed, so the generated content (and the metrics) are always the same
+
+
+def generate_content(seed=1, question_count=400, user_count=60, tag_count=25,
+                     early_answers=False):
+    """
+    Generates questions (with answers and comments), articles, tags, users, and communities in
+    the format returned by the APIs, including the edge cases the metrics handle: deleted users,
+    self-answered questions, comments from the asker, and communities with unknown tags.
+
+    With `early_answers`, the first answer of about a third of the questions is dated at or
+    before its question (e.g. imported content, or clock skew between servers).
+
+    Returns:
+        questions, articles, tags, users, communities
+    """
+    rng = random.Random(seed)
+
+    users = []
+    for user_id in range(2, user_count + 2):
+        user = {'user_id': user_id, 'display_name': f'User {user_id}',
+                'reputation': rng.randint(1, 500),
+                'creation_date': NOW - rng.randint(1000, 10**8),
+                'last_access_date': NOW - rng.randint(0, 10**6), 'email': 'e', 'title': 't',
+                'department': rng.choice(['A', 'B', None]), 'external_id': 'x',
+                'account_id': user_id + 1000, 'moderator': False, 'link': 'l'}
+        if rng.random() < 0.5:
+            user['is_deactivated'] = rng.random() < 0.2
+        users.append(user)
+
+    def owner():
+        x = rng.random()
+        if x < 0.1:  # deleted user
+            return {'display_name': f'user{rng.randint(500, 520)}'}
+        if x < 0.12:  # deleted user without an ID in their display name
+            return {'display_name': 'weird name'}
+        user_id = rng.randint(2, user_count + 1)
+        return {'user_id': user_id, 'display_name': f'User {user_id}'}
+
+    tag_names = [f't{index}' for index in range(tag_count)]
+    tags = []
+    for index, name in enumerate(tag_names):
+        smes = {
+            'users': [{'id': rng.randint(2, user_count + 1)} for _ in range(rng.randint(0, 3))],
+            'userGroups': [{'id': 900 + group, 'users': [{'id': rng.randint(2, user_count + 1)}
+                                                         for _ in range(rng.randint(0, 3))]}
+                           for group in range(rng.randint(0, 2))]
+        }
+        tags.append({'id': index, 'name': name, 'watcherCount': rng.randint(0, 30),
+                     'subjectMatterExpertCount': 1, 'smes': smes})
+
+    def comments(creation_date):
+        return [{'comment_id': rng.randint(1, 10**9), 'owner': owner(),
+                 'creation_date': creation_date + rng.randint(-10, 10**5)}
+                for _ in range(rng.randint(0, 3))]
+
+    questions = []
+    for question_id in range(question_count):
+        creation_date = NOW - rng.randint(0, 3 * 365 * 86400)
+        question = {'question_id': question_id, 'owner': owner(),
+                    'creation_date': creation_date, 'last_activity_date': creation_date + 5,
+                    'view_count': rng.randint(0, 1000), 'up_vote_count': rng.randint(0, 9),
+                    'down_vote_count': rng.randint(0, 3),
+                    'tags': rng.sample(tag_names, rng.randint(1, 3)),
+                    'link': f'https://example.com/q/{question_id}', 'is_answered': True}
+        question_comments = comments(creation_date)
+        if question_comments:
+            question['comments'] = question_comments
+        question['comment_count'] = len(question_comments)
+
+        answers = []
+        for index in range(rng.choice([0, 0, 1, 2, 3, 5])):
+            answer = {'answer_id': question_id * 10 + index, 'owner': owner(),
+                      'creation_date': creation_date + rng.randint(-100, 10**6),
+                      'is_accepted': rng.random() < 0.2, 'up_vote_count': rng.randint(0, 9),
+                      'down_vote_count': rng.randint(0, 2), 'question_id': question_id}
+            if rng.random() < 0.1:  # self-answer
+                answer['owner'] = dict(question['owner'])
+            if early_answers and index == 0 and rng.random() < 0.35:
+                answer['creation_date'] = creation_date - rng.choice([0, 60, 7200, 86400])
+            answer_comments = comments(creation_date)
+            if answer_comments:
+                answer['comments'] = answer_comments
+            answer['comment_count'] = len(answer_comments)
+            answers.append(answer)
+        if answers:
+            question['answers'] = answers
+        question['answer_count'] = len(answers)
+        questions.append(question)
+
+    articles = []
+    for article_id in range(question_count // 5):
+        creation_date = NOW - rng.randint(0, 3 * 365 * 86400)
+        articles.append({'article_id': article_id, 'owner': owner(),
+                         'creation_date': creation_date, 'last_activity_date': creation_date,
+                         'view_count': rng.randint(0, 500), 'score': rng.randint(0, 9),
+                         'comment_count': rng.randint(0, 3),
+                         'tags': rng.sample(tag_names, rng.randint(1, 2)),
+                         'link': f'https://example.com/a/{article_id}'})
+
+    communities = [{'id': index, 'name': f'c{index}',
+                    'tags': [{'name': rng.choice(tag_names + ['missing'])} for _ in range(2)]}
+                   for index in range(4)]
+
+    return questions, articles, tags, users, communities
@@ -0,0 +1,99 @@
+# Standard Python libraries
+import argparse
+from datetime import date, datetime, time
+import threading
+from unittest import mock
+
+# Local libraries
+import collector
+import main
+from checkpoint import Checkpoint
+
+
+def options_for(args):
+
+    from_date, to_date = main.get_date_range(args)
+    return {'high_water_marks': {}, 'metrics_only': False, 'from_date': from_date,
+            'to_date': to_date}
+
+
+def test_days_window_is_stable_within_a_day():
+
+    # The window starts at midnight, rather than at the current time, so running the script
+    # again (e.g. with --resume) gives the same date range
+    args = argparse.Namespace(days=90, start_date=None, end_date=None)
+    from_date, to_date = main.get_date_range(args)
+
+    assert datetime.fromtimestamp(from_date).time() == time.min
+    assert (date.today() - datetime.fromtimestamp(from_date).date()).days == 90
+    assert to_date is None
+
+
+def test_resume_with_days_keeps_progress(tmp_path):
+
+    args = argparse.Namespace(days=90, start_date=None, end_date=None)
+    checkpoint = Checkpoint(str(tmp_path), options=options_for(args))
+    checkpoint.save_item('tag_smes', 1, {'users': [1, 2]})
+
+    resumed = Checkpoint(str(tmp_path), resume=True, options=options_for(args))
+
+    assert resumed.load_item('tag_smes', 1) == {'users': [1, 2]}
+
+
+def test_different_options_start_a_new_run(tmp_path):
+
+    checkpoint = Checkpoint(str(tmp_path), options={'from_date': 1})
+    checkpoint.save_item('tag_smes', 1, {'users': [1]})
+
+    restarted = Checkpoint(str(tmp_path), resume=True, options={'from_date': 2})
+
+    assert restarted.load_item('tag_smes', 1) is None
+
+
+def save_pages(checkpoint, endpoint_url, page_count):
+
+    key = checkpoint.page_key(endpoint_url, {'page': 1, 'pagesize': 100})
+    for page in range(1, page_count + 1):
+        checkpoint.save_page(key, page, {'items': [{'page': page}], 'has_more': True})
+    return key
+
+
+def test_completed_stage_pages_are_deleted(tmp_path):
+
+    checkpoint = Checkpoint(str(tmp_path))
+    keys = {}
+
+    # Another stage's pages, saved from another thread, are kept until that stage completes
+    def get_articles():
+        checkpoint.start_stage('articles')
+        keys['articles'] = save_pages(checkpoint, '/articles', 2)
+
+    other_stage = threading.Thread(target=get_articles)
+    other_stage.start()
+    other_stage.join()
+
+    def get_questions():
+        keys['questions'] = save_pages(checkpoint, '/questions', 3)
+        return [{'question_id': 1}]
+
+    assert collector.run_stage(checkpoint, 'questions', get_questions) == [{'question_id': 1}]
+
+    assert checkpoint.load_pages(keys['questions']) == {}
+    assert len(checkpoint.load_pages(keys['articles'])) == 2
+    assert checkpoint.load_stage('questions') == [{'question_id': 1}]
+
+
+def test_reputation_history_is_streamed_from_saved_batches(tmp_path):
+
+    checkpoint = Checkpoint(str(tmp_path))
+    users = [{'user_id': user_id} for user_id in [5, 3, 9, 1, 7]]
+    for batch in [[5, 3], [9], [7]]:  # user 1's batch was never saved
+        checkpoint.save_item('reputation_history', batch[0], {
+            'user_ids': batch, 'items': [{'user_id': user_id} for user_id in batch]})
+
+    with mock.patch.object(checkpoint, 'load_item', wraps=checkpoint.load_item) as load_item:
+        events = list(collector.stream_reputation_history(checkpoint, users))
+
+    # Batches are read once each, in the order of the users
+    assert [event['user_id'] for event in events] == [5, 3, 9, 7]
+    assert load_item.call_count == 3
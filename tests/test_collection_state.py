@@ -0,0 +1,45 @@
+# Standard Python libraries
+import json
+
+# Third-party libraries
+import pytest
+
+# Local libraries
+import collector
+
+API_DATA = {
+    'questions': [{'question_id': 1, 'last_activity_date': 1700000000},
+                  {'question_id': 2, 'last_activity_date': 1700000500}],
+    'articles': [{'article_id': 3, 'last_activity_date': 1700000200}]
+}
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(collector, 'DATA_DIR', str(tmp_path))
+    for name in ['questions', 'articles']:
+        with open(tmp_path / f'{name}.json', 'w') as f:
+            json.dump(API_DATA[name], f)
+    return tmp_path
+
+
+def test_full_collection_saves_high_water_marks(data_dir):
+
+    collector.save_high_water_marks(API_DATA)
+
+    previous_data, high_water_marks = collector.get_previous_collection()
+    assert high_water_marks == {'questions': 1700000500, 'articles': 1700000200}
+    assert previous_data == API_DATA
+
+
+@pytest.mark.parametrize('from_date, to_date', [(1690000000, None), (None, 1710000000),
+                                                (1690000000, 1710000000)])
+def test_date_range_collection_is_not_built_on(data_dir, from_date, to_date):
+
+    # A previous full collection saved high-water marks; collecting a date range over it must
+    # discard them, so the next incremental run doesn't merge into the range's data
+    collector.save_high_water_marks(API_DATA)
+    collector.save_high_water_marks(API_DATA, from_date, to_date)
+
+    assert collector.get_previous_collection() == ({}, {})
@@ -0,0 +1,110 @@
+# Third-party libraries
+import pytest
+
+# Local libraries
+import columnar
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+def owner(user_id):
+
+    if user_id is None:  # deleted users only have a display name
+        return {'display_name': 'user999'}
+    return {'user_id': user_id, 'display_name': f'User {user_id}'}
+
+
+def create_questions(count):
+
+    questions = []
+    answer_id = 1000
+    comment_id = 5000
+    for question_id in range(1, count + 1):
+        question = {
+            'question_id': question_id, 'owner': owner(question_id % 7 or None),
+            'creation_date': 1700000000 + question_id, 'view_count': question_id * 3,
+            'up_vote_count': question_id % 4, 'down_vote_count': question_id % 2,
+            'answer_count': question_id % 3, 'comment_count': question_id % 2,
+            'tags': [f'tag-{question_id % 5}']
+        }
+        if question_id % 2:
+            comment_id += 1
+            question['comments'] = [{'comment_id': comment_id, 'owner': owner(2),
+                                     'creation_date': 1700000100 + question_id}]
+
+        answers = []
+        for _ in range(question_id % 3):
+            answer_id += 1
+            answer = {'answer_id': answer_id, 'owner': owner(answer_id % 5 or None),
+                      'creation_date': 1700000200 + answer_id, 'is_accepted': not answers,
+                      'up_vote_count': 1, 'down_vote_count': 0}
+            if answer_id % 2:
+                comment_id += 1
+                answer['comments'] = [{'comment_id': comment_id, 'owner': owner(3),
+                                       'creation_date': 1700000300 + answer_id}]
+            answers.append(answer)
+        if answers:
+            question['answers'] = answers
+        questions.append(question)
+
+    return questions
+
+
+def expected_question(question):
+    # What the stream returns: only the columns the metrics need, with the owners nested
+
+    columns = columnar.STREAM_COLUMNS
+    expected = {key: value for key, value in question.items()
+                if key in columns['questions'] or key == 'owner'}
+    if question.get('comments'):
+        expected['comments'] = [expected_comment(comment) for comment in question['comments']]
+    if question.get('answers'):
+        expected['answers'] = []
+        for answer in question['answers']:
+            expected_answer = dict(answer, question_id=question['question_id'])
+            if answer.get('comments'):
+                expected_answer['comments'] = [expected_comment(comment)
+                                               for comment in answer['comments']]
+            expected['answers'].append(expected_answer)
+
+    return expected
+
+
+def expected_comment(comment):
+
+    return {key: value for key, value in comment.items() if key in ('owner', 'creation_date')}
+
+
+def test_stream_questions_rebuilds_nested_questions(tmp_path, monkeypatch):
+
+    # Small batches and row groups, so answers and comments of a question span several of them
+    monkeypatch.setattr(columnar, 'ROW_BATCH_SIZE', 3)
+    monkeypatch.setattr(columnar, 'ROW_GROUP_SIZE', 5)
+    questions = create_questions(50)
+    articles = [{'article_id': 1, 'owner': owner(None), 'creation_date': 1700000000,
+                 'view_count': 10, 'score': 2, 'comment_count': 0, 'tags': ['tag-1']}]
+    columnar.export_to_parquet({'questions': questions, 'articles': articles}, str(tmp_path))
+
+    streamed = list(columnar.stream_questions(str(tmp_path)))
+
+    assert streamed == [expected_question(question) for question in questions]
+    assert list(columnar.stream_articles(str(tmp_path))) == [
+        {key: value for key, value in articles[0].items() if key != 'article_id'}]
+
+
+def test_out_of_order_tables_fail(tmp_path):
+
+    # Answers and comments that aren't in the same order as the questions are never silently
+    # dropped
+    tables = columnar.flatten_questions(create_questions(10))
+    tables['questions'].reverse()
+    tables['articles'] = []
+    for name, rows in tables.items():
+        schema = columnar.SCHEMAS[name]
+        rows = [{column: row.get(column) for column in schema.names} for row in rows]
+        pq.write_table(pa.Table.from_pylist(rows, schema=schema),
+                       str(tmp_path / f'{name}.parquet'))
+
+    with pytest.raises(ValueError):
+        list(columnar.stream_questions(str(tmp_path)))
@@ -0,0 +1,65 @@
+# Standard Python libraries
+from unittest import mock
+
+# Third-party libraries
+import pytest
+
+# Local libraries
+import collector
+from checkpoint import Checkpoint
+
+
+def v3_user(user_id, role='Registered'):
+
+    return {'id': user_id, 'email': f'user{user_id}@example.com', 'jobTitle': f'Title {user_id}',
+            'department': f'Department {user_id}', 'externalId': f'ext-{user_id}', 'role': role}
+
+
+def create_clients(v2_ids, v3_users, deactivated_users):
+
+    v2client = mock.Mock(api_url='https://example.com', soe=False)
+    v2client.get_all_users.return_value = [{'user_id': user_id, 'display_name': f'User {user_id}'}
+                                           for user_id in v2_ids]
+    v3client = mock.Mock(api_url='https://example.com')
+    v3client.get_users.return_value = v3_users
+    v3client.get_user_by_id.side_effect = lambda user_id: deactivated_users[user_id]
+
+    return v2client, v3client
+
+
+@pytest.mark.parametrize('lookup_workers', [1, 4])
+def test_v2_and_v3_users_are_joined_by_id(tmp_path, lookup_workers):
+
+    # Users 8 and 12 are only in API v2 (deactivated); users 50 and 51 are only in API v3; the
+    # Community user (-1) and user 1 are excluded
+    v2_ids = [-1, 1, 12, 3, 8, 5]
+    v3_users = [v3_user(5, role='Moderator'), v3_user(51), v3_user(3), v3_user(50), v3_user(1)]
+    deactivated_users = {8: v3_user(8), 12: v3_user(12, role='Moderator')}
+    v2client, v3client = create_clients(v2_ids, v3_users, deactivated_users)
+
+    users = collector.get_users(v2client, v3client, lookup_workers, Checkpoint(str(tmp_path)))
+
+    # Users keep the API v2 order, each with the API v3 fields of the user with the same ID
+    assert [user['user_id'] for user in users] == [12, 3, 8, 5]
+    for user in users:
+        assert user['email'] == f"user{user['user_id']}@example.com"
+        assert user['title'] == f"Title {user['user_id']}"
+        assert user['department'] == f"Department {user['user_id']}"
+        assert user['external_id'] == f"ext-{user['user_id']}"
+    assert [user['moderator'] for user in users] == [True, False, False, True]
+    assert [user.get('is_deactivated', False) for user in users] == [True, False, True, False]
+
+    # Only the users missing from API v3 are requested individually
+    assert sorted(call.args[0] for call in v3client.get_user_by_id.call_args_list) == [8, 12]
+
+
+def test_deactivated_users_are_not_requested_again_when_resumed(tmp_path):
+
+    v2client, v3client = create_clients([2, 3], [v3_user(2)], {3: v3_user(3)})
+    collector.get_users(v2client, v3client, 1, Checkpoint(str(tmp_path)))
+
+    v3client.get_user_by_id.reset_mock()
+    users = collector.get_users(v2client, v3client, 1, Checkpoint(str(tmp_path), resume=True))
+
+    assert not v3client.get_user_by_id.called
+    assert users[1]['email'] == 'user3@example.com' and users[1]['is_deactivated']
@@ -0,0 +1,86 @@
+# Standard Python libraries
+from unittest import mock
+
+# Third-party libraries
+import pytest
+
+# Local libraries
+from checkpoint import Checkpoint
+from so4t_api_v2 import V2Client
+from throttle import APIRequestError
+
+ENDPOINT_URL = 'https://example.com/api/2.3/questions'
+
+
+def create_client(checkpoint):
+
+    # Skips the connection test that the client makes when it's created
+    with mock.patch.object(V2Client, 'test_connection', return_value=True):
+        return V2Client('https://example.com', key='key', checkpoint=checkpoint)
+
+
+def fake_api(item_ids, fail_on_page=None):
+    # Returns a `get_page` replacement serving `item_ids` two per page, in the order requested
+
+    requests = []
+
+    def get_page(endpoint_url, params):
+        requests.append(dict(params))
+        if params['page'] == fail_on_page:
+            raise APIRequestError('Simulated failure', status_code=500)
+        ordered = item_ids if params.get('sort') == 'creation' else item_ids[::-1]
+        start = (params['page'] - 1) * 2
+        return {'items': [{'question_id': item_id} for item_id in ordered[start:start + 2]],
+                'has_more': start + 2 < len(ordered)}
+
+    return get_page, requests
+
+
+def test_sequential_pages_are_requested_by_creation_date(tmp_path):
+
+    client = create_client(Checkpoint(str(tmp_path)))
+    get_page, requests = fake_api([1, 2, 3])
+    with mock.patch.object(client, 'get_page', side_effect=get_page):
+        items = client.get_items(ENDPOINT_URL, {'page': 1, 'pagesize': 2})
+
+    assert [item['question_id'] for item in items] == [1, 2, 3]
+    assert all(request['sort'] == 'creation' and request['order'] == 'asc'
+               for request in requests)
+
+
+def test_resume_reuses_saved_pages(tmp_path):
+
+    options = {'from_date': None}
+    client = create_client(Checkpoint(str(tmp_path), options=options))
+    get_page, _ = fake_api([1, 2, 3, 4, 5], fail_on_page=2)
+    with mock.patch.object(client, 'get_page', side_effect=get_page):
+        with pytest.raises(APIRequestError):
+            client.get_items(ENDPOINT_URL, {'page': 1, 'pagesize': 2})
+
+    # A new question is created before the run is resumed; it's added to the last page, so
+    # the saved first page is still accurate
+    client = create_client(Checkpoint(str(tmp_path), resume=True, options=options))
+    get_page, requests = fake_api([1, 2, 3, 4, 5, 6])
+    with mock.patch.object(client, 'get_page', side_effect=get_page):
+        items = client.get_items(ENDPOINT_URL, {'page': 1, 'pagesize': 2})
+
+    assert [item['question_id'] for item in items] == [1, 2, 3, 4, 5, 6]
+    assert [request['page'] for request in requests] == [2, 3]
+
+
+def test_pages_sorted_by_activity_are_not_reused(tmp_path):
+
+    options = {'from_date': None}
+    params = {'page': 1, 'pagesize': 2, 'sort': 'activity', 'order': 'asc', 'min': 1}
+    client = create_client(Checkpoint(str(tmp_path), options=options))
+    get_page, _ = fake_api([1, 2, 3], fail_on_page=2)
+    with mock.patch.object(client, 'get_page', side_effect=get_page):
+        with pytest.raises(APIRequestError):
+            client.get_items(ENDPOINT_URL, dict(params))
+
+    client = create_client(Checkpoint(str(tmp_path), resume=True, options=options))
+    get_page, requests = fake_api([1, 2, 3])
+    with mock.patch.object(client, 'get_page', side_effect=get_page):
+        client.get_items(ENDPOINT_URL, dict(params))
+
+    assert [request['page'] for request in requests] == [1, 2]
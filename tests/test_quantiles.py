@@ -0,0 +1,248 @@
+# Standard Python libraries
+import math
+import random
+import statistics
+
+# Third-party libraries
+from hypothesis import given, settings, strategies as st
+import pytest
+
+# Local libraries
+from quantiles import MAX_EXACT_VALUES, RELATIVE_ACCURACY, QuantileSketch
+
+QUANTILES = (0.5, 0.9, 0.99)
+SEEDS = range(20)
+
+# Response times in hours, from seconds to years, and runs of repeated values, so that adjacent
+# duplicates and adjacent values of zero or less are common
+positive_hours = st.floats(min_value=1e-4, max_value=1e5)
+non_positive_hours = st.one_of(st.just(0.0), st.floats(min_value=-1e5, max_value=-1e-4))
+hour_runs = st.lists(st.tuples(st.one_of(positive_hours, non_positive_hours),
+                               st.integers(min_value=1, max_value=5)), max_size=100)
+
+
+def reference_quantiles(values, quantiles):
+    # Reference implementation: linear interpolation between the closest ranks of the sorted
+    # values, the same definition as `statistics.quantiles(method='inclusive')`
+
+    values = sorted(values)
+    results = []
+    for quantile in quantiles:
+        rank = quantile * (len(values) - 1)
+        lower = math.floor(rank)
+        upper = min(lower + 1, len(values) - 1)
+        results.append(values[lower] + (values[upper] - values[lower]) * (rank - lower))
+
+    return results
+
+
+def nearest_rank(values, quantile):
+
+    values = sorted(values)
+    return values[int(quantile * (len(values) - 1))]
+
+
+def generate_durations(rng, count):
+    # Response times in hours: mostly minutes to hours, with a long tail of weeks and months,
+    # some duplicates, and some values of zero or less (e.g. clock skew) mixed in
+
+    distribution = rng.choice(['lognormal', 'exponential', 'uniform', 'duplicates'])
+    values = []
+    for _ in range(count):
+        if distribution == 'lognormal':
+            value = rng.lognormvariate(1, 2.5)
+        elif distribution == 'exponential':
+            value = rng.expovariate(0.05)
+        elif distribution == 'uniform':
+            value = rng.uniform(0.001, 5000)
+        else:
+            value = rng.choice([0.5, 1, 24, 168])
+        if rng.random() < 0.05:
+            value = -value if rng.random() < 0.5 else 0
+        values.append(value)
+
+    return values
+
+
+def add_all(values):
+
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+
+    return sketch
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_exact_at_or_below_threshold(seed):
+
+    rng = random.Random(seed)
+    values = generate_durations(rng, rng.randint(1, MAX_EXACT_VALUES))
+    positive_values = [value for value in values if value > 0]
+    if not positive_values:
+        return
+
+    sketch = add_all(values)
+
+    assert len(sketch) == len(positive_values)
+    assert sketch.quantiles(0.5)[0] == statistics.median(positive_values)
+    assert sketch.quantiles(*QUANTILES) == pytest.approx(
+        reference_quantiles(positive_values, QUANTILES), rel=1e-12)
+
+
+def test_exact_at_threshold_boundary():
+
+    rng = random.Random(0)
+    values = [rng.lognormvariate(1, 2) for _ in range(MAX_EXACT_VALUES)]
+    sketch = add_all(values)
+
+    assert sketch.buckets is None
+    assert sketch.quantiles(0.5)[0] == statistics.median(values)
+
+    sketch.add(1.0)  # one more value switches to the sketch
+    assert sketch.buckets is not None
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_within_relative_accuracy_above_threshold(seed):
+
+    rng = random.Random(seed)
+    values = generate_durations(rng, rng.randint(MAX_EXACT_VALUES + 1, 50000))
+    positive_values = [value for value in values if value > 0]
+
+    sketch = add_all(values)
+
+    assert len(sketch) == len(positive_values)
+    for quantile, estimate in zip(QUANTILES, sketch.quantiles(*QUANTILES)):
+        # The sketch returns a value of the rank it falls on, rather than interpolating
+        expected = nearest_rank(positive_values, quantile)
+        assert abs(estimate - expected) <= RELATIVE_ACCURACY * expected * (1 + 1e-9)
+
+
+def test_large_dataset_memory_is_bounded():
+
+    rng = random.Random(1)
+    sketch = add_all(rng.lognormvariate(1, 2) for _ in range(500000))
+
+    # Buckets depend on the range of the values, not their number
+    assert sketch.values is None
+    assert len(sketch.buckets) < 2000
+
+
+@pytest.mark.parametrize('values', [[], [0], [-1, -2.5, 0]])
+def test_non_positive_values_are_dropped(values):
+
+    sketch = add_all(values)
+
+    assert len(sketch) == 0
+    assert not sketch
+    assert sketch.quantiles(*QUANTILES) == [None, None, None]
+
+
+def test_non_positive_values_do_not_affect_quantiles():
+
+    # Adjacent non-positive values were skipped by the cleanup this replaced
+    values = [5.0, -1.0, -2.0, 0.0, 1.0, 3.0, -4.0]
+
+    assert add_all(values).quantiles(0.5) == [statistics.median([5.0, 1.0, 3.0])]
+
+
+def test_non_positive_values_can_be_kept():
+
+    # Tag times to first answer keep answers dated before their question
+    sketch = QuantileSketch(positive_only=False)
+    for value in [-2.0, 1.0, 2.0]:
+        sketch.add(value)
+
+    assert len(sketch) == 3
+    assert sketch.quantiles(0.5) == [1.0]
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_kept_non_positive_values_within_relative_accuracy(seed):
+
+    rng = random.Random(seed)
+    values = generate_durations(rng, rng.randint(1, 5000))
+    values += [-rng.lognormvariate(1, 2) for _ in range(len(values) // 10)] + [0] * 5
+
+    sketch = QuantileSketch(positive_only=False)
+    for value in values:
+        sketch.add(value)
+
+    assert len(sketch) == len(values)
+    quantiles = (0.01, 0.05) + QUANTILES  # low quantiles fall on the negative values
+    for quantile, estimate in zip(quantiles, sketch.quantiles(*quantiles)):
+        if sketch.buckets is None:
+            assert estimate == pytest.approx(reference_quantiles(values, [quantile])[0],
+                                             rel=1e-12, abs=1e-12)
+        else:
+            expected = nearest_rank(values, quantile)
+            assert abs(estimate - expected) <= RELATIVE_ACCURACY * abs(expected) * (1 + 1e-9)
+
+
+@given(hour_runs)
+def test_exact_matches_reference_for_generated_values(runs):
+
+    values = [value for value, repeat in runs for _ in range(repeat)]
+    positive_values = [value for value in values if value > 0]
+
+    sketch = add_all(values)
+
+    assert len(sketch) == len(positive_values)
+    if not positive_values:
+        assert sketch.quantiles(*QUANTILES) == [None, None, None]
+        return
+    assert sketch.quantiles(0.5)[0] == statistics.median(positive_values)
+    assert sketch.quantiles(*QUANTILES) == pytest.approx(
+        reference_quantiles(positive_values, QUANTILES), rel=1e-12)
+
+
+def generate_with_non_positive_runs(rng, positive_count):
+    # Positive values with runs of up to 10 adjacent values of zero or less inserted between them
+
+    values = []
+    for _ in range(positive_count):
+        if rng.random() < 0.05:
+            values += [rng.choice([0.0, -rng.expovariate(1)]) for _ in range(rng.randint(1, 10))]
+        values.append(rng.lognormvariate(1, 2.5))
+
+    return values
+
+
+@settings(max_examples=50, deadline=None)
+@given(st.integers(min_value=0, max_value=2**32),
+       st.integers(min_value=MAX_EXACT_VALUES - 5, max_value=MAX_EXACT_VALUES + 5))
+def test_exact_sketch_boundary_matches_reference(seed, positive_count):
+
+    values = generate_with_non_positive_runs(random.Random(seed), positive_count)
+    positive_values = [value for value in values if value > 0]
+
+    sketch = add_all(values)
+
+    assert len(sketch) == positive_count
+    if positive_count <= MAX_EXACT_VALUES:
+        assert sketch.buckets is None
+        assert sketch.quantiles(0.5)[0] == statistics.median(positive_values)
+        assert sketch.quantiles(*QUANTILES) == pytest.approx(
+            reference_quantiles(positive_values, QUANTILES), rel=1e-12)
+    else:
+        assert sketch.values is None
+        for quantile, estimate in zip(QUANTILES, sketch.quantiles(*QUANTILES)):
+            expected = nearest_rank(positive_values, quantile)
+            assert abs(estimate - expected) <= RELATIVE_ACCURACY * expected * (1 + 1e-9)
+
+
+@settings(max_examples=25, deadline=None)
+@given(st.integers(min_value=0, max_value=2**32),
+       st.integers(min_value=MAX_EXACT_VALUES + 1, max_value=100000))
+def test_large_generated_datasets_within_relative_accuracy(seed, positive_count):
+
+    values = generate_with_non_positive_runs(random.Random(seed), positive_count)
+    positive_values = [value for value in values if value > 0]
+
+    sketch = add_all(values)
+
+    assert len(sketch) == positive_count
+    for quantile, estimate in zip(QUANTILES, sketch.quantiles(*QUANTILES)):
+        expected = nearest_rank(positive_values, quantile)
+        assert abs(estimate - expected) <= RELATIVE_ACCURACY * expected * (1 + 1e-9)
@@ -0,0 +1,64 @@
+# Standard Python libraries
+from concurrent.futures import ProcessPoolExecutor
+import filecmp
+import functools
+import multiprocessing
+import os
+import shutil
+import sys
+
+# Third-party libraries
+import pytest
+
+# Local libraries
+from collector import DATA_DIR
+import reports
+from synthetic_data import generate_data
+
+METRIC_FILES = ['tag_metrics.json', 'user_metrics.json', 'kr_metrics.json']
+REPORT_FILES = ['tag_report.csv', 'user_report.csv', 'reputation_over_time.csv', 'deleted_kr.csv',
+                'so4t_tag_cloud_100_tags.png', 'tag_bubble_chart.html', 'sme_count_chart.html',
+                'tag_watcher_chart.html', 'department_metrics.html']
+
+
+@pytest.fixture
+def report_dirs(tmp_path, monkeypatch):
+
+    # Any browser opened by the reports (in any process) records its URL instead
+    opened = tmp_path / 'opened.txt'
+    monkeypatch.setenv('BROWSER', f'{sys.executable} -c "import sys; '
+                       f'open({str(opened)!r}, \'a\').write(sys.argv[1])" %s')
+    monkeypatch.setattr(reports, 'AUTO_OPEN_CHARTS', False)
+
+    # Both runs use the same synthetic dataset, each in its own working directory
+    sequential, parallel = tmp_path / 'jobs_1', tmp_path / 'jobs_2'
+    generate_data(str(sequential / DATA_DIR), 3000, seed=7)
+    shutil.copytree(sequential / DATA_DIR, parallel / DATA_DIR)
+
+    return (sequential, parallel), opened
+
+
+def test_parallel_reports_match_sequential(report_dirs, monkeypatch):
+
+    (sequential, parallel), opened = report_dirs
+
+    monkeypatch.chdir(sequential)
+    reports.create_reports(jobs=1)
+
+    # Spawned processes start from a fresh import of `reports`, unlike forked ones, so they
+    # also check that the processes are given the settings of the parent
+    monkeypatch.setattr(reports, 'ProcessPoolExecutor', functools.partial(
+        ProcessPoolExecutor, mp_context=multiprocessing.get_context('spawn')))
+    monkeypatch.chdir(parallel)
+    reports.create_reports(jobs=2)
+
+    for name in METRIC_FILES:
+        assert filecmp.cmp(sequential / DATA_DIR / name, parallel / DATA_DIR / name,
+                           shallow=False), name
+    for name in REPORT_FILES:
+        assert os.path.exists(parallel / reports.REPORT_DIR / name), name
+        if name.endswith('.csv'):
+            assert filecmp.cmp(sequential / reports.REPORT_DIR / name,
+                               parallel / reports.REPORT_DIR / name, shallow=False), name
+
+    assert not opened.exists()
@@ -0,0 +1,101 @@
+# Standard Python libraries
+import threading
+from unittest import mock
+
+# Third-party libraries
+import pytest
+
+# Local libraries
+from so4t_api_v2 import V2Client
+from throttle import APIRequestError
+
+USER_IDS = list(range(1, 2001))
+
+
+def create_client():
+
+    # Skips the connection test that the client makes when it's created
+    with mock.patch.object(V2Client, 'test_connection', return_value=True):
+        return V2Client('https://example.com', key='key', page_workers=4)
+
+
+def fake_batches(fail):
+    # Returns a `get_reputation_history_batch` replacement that calls `fail(batch)` (which may
+    # raise) and otherwise returns one event per user, along with the list of requested batches
+
+    requests = []
+    lock = threading.Lock()
+
+    def get_batch(user_ids, filter_string=''):
+        with lock:
+            requests.append(list(user_ids))
+        fail(user_ids)
+        return [{'user_id': user_id, 'reputation_change': 10} for user_id in user_ids]
+
+    return get_batch, requests
+
+
+def get_events(client, get_batch):
+
+    with mock.patch.object(client, 'get_reputation_history_batch', side_effect=get_batch):
+        return client.get_reputation_history(USER_IDS)
+
+
+def test_long_batches_are_split():
+
+    def fail(user_ids):
+        if len(user_ids) > 20:
+            raise APIRequestError('URL too long', status_code=414)
+
+    get_batch, requests = fake_batches(fail)
+    events = get_events(create_client(), get_batch)
+
+    assert sorted(event['user_id'] for event in events) == USER_IDS
+    assert any(len(batch) <= 20 for batch in requests)
+
+
+def test_rejected_user_is_skipped():
+
+    def fail(user_ids):
+        if 777 in user_ids:
+            raise APIRequestError('Bad ids', status_code=400, error_name='bad_parameter',
+                                  error_message='ids')
+
+    get_batch, requests = fake_batches(fail)
+    events = get_events(create_client(), get_batch)
+
+    assert sorted(event['user_id'] for event in events) == [
+        user_id for user_id in USER_IDS if user_id != 777]
+
+
+@pytest.mark.parametrize('error', [
+    APIRequestError('Bad filter', status_code=400, error_name='bad_parameter',
+                    error_message='filter'),
+    APIRequestError('Throttled', status_code=400, error_name='throttle_violation',
+                    error_message='too many requests from this IP, more requests available '
+                    'in 30 seconds'),
+    APIRequestError('Server error', status_code=500),
+])
+def test_persistent_errors_are_raised_without_splitting(error):
+
+    def fail(user_ids):
+        raise error
+
+    get_batch, requests = fake_batches(fail)
+    with pytest.raises(APIRequestError):
+        get_events(create_client(), get_batch)
+
+    # Failing batches aren't split down to single users
+    assert len(requests) <= 4
+
+
+def test_persistent_web_server_error_is_raised():
+
+    # An HTTP 400 that isn't an API error may be a URL that's too long, so batches are split;
+    # if a single user still fails, the error isn't about the user, so it's raised
+    def fail(user_ids):
+        raise APIRequestError('Bad request', status_code=400)
+
+    get_batch, requests = fake_batches(fail)
+    with pytest.raises(APIRequestError):
+        get_events(create_client(), get_batch)
@@ -0,0 +1,80 @@
+# Standard Python libraries
+import json
+import os
+
+# Local libraries
+import reports
+from user_metrics import create_user_metrics
+
+EVENTS = [
+    {'user_id': 1, 'creation_date': 1700000000, 'post_id': 10, 'reputation_change': 10,
+     'reputation_history_type': 'post_upvoted'},
+    {'user_id': 1, 'creation_date': 1703000000, 'post_id': 11, 'reputation_change': -2,
+     'reputation_history_type': 'post_downvoted'},
+    {'user_id': 2, 'creation_date': 1703000000, 'post_id': 12, 'reputation_change': 15,
+     'reputation_history_type': 'answer_accepted'},
+]
+USERS = [
+    {'user_id': user_id, 'display_name': f'User {user_id}', 'reputation': 100,
+     'creation_date': 1600000000, 'last_access_date': 1700000000, 'email': '', 'title': '',
+     'department': '', 'external_id': '', 'account_id': user_id, 'moderator': False}
+    for user_id in (1, 2)
+]
+
+
+def write_reputation_history(directory, data):
+
+    os.makedirs(os.path.join(directory, reports.DATA_DIR))
+    with open(os.path.join(directory, reports.DATA_DIR, 'reputation_history.json'), 'w') as f:
+        json.dump(data, f, indent=4)
+
+
+def test_current_format(tmp_path, monkeypatch):
+
+    write_reputation_history(tmp_path, EVENTS)
+    monkeypatch.chdir(tmp_path)
+
+    assert list(reports.stream_reputation_history('json')) == EVENTS
+
+
+def test_old_format_is_flattened(tmp_path, monkeypatch):
+
+    # Earlier versions of the collector wrote the events nested in a one-element list
+    write_reputation_history(tmp_path, [EVENTS])
+    monkeypatch.chdir(tmp_path)
+
+    assert list(reports.stream_reputation_history('json')) == EVENTS
+    assert list(reports.stream_reputation_history('json', from_date=1701000000)) == EVENTS[1:]
+
+
+def test_user_metrics_from_old_format(tmp_path, monkeypatch):
+
+    write_reputation_history(tmp_path, [EVENTS])
+    monkeypatch.chdir(tmp_path)
+
+    user_metrics = create_user_metrics(
+        [dict(user) for user in USERS], [], [], [],
+        reputation_history=reports.stream_reputation_history('json'))
+
+    net_reputation = {user['User ID']: user['Net Reputation'] for user in user_metrics}
+    assert net_reputation == {1: 8, 2: 15}
+
+
+def test_non_event_items_are_skipped(tmp_path, monkeypatch):
+
+    write_reputation_history(tmp_path, [EVENTS[0], None, [EVENTS[1], 'not an event', []], 42])
+    monkeypatch.chdir(tmp_path)
+
+    assert list(reports.stream_reputation_history('json')) == EVENTS[:2]
+
+
+def test_old_format_is_streamed_one_event_at_a_time(tmp_path, monkeypatch):
+
+    # Any item larger than a few events is rejected, so the nested list can't be parsed whole
+    events = [dict(EVENTS[0], post_id=post_id) for post_id in range(2000)]
+    write_reputation_history(tmp_path, [events])
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(reports, 'STREAM_CHUNK_SIZE', 100)
+    monkeypatch.setattr(reports, 'MAX_ITEM_SIZE', 1000)
+
+    assert list(reports.stream_reputation_history('json')) == events
@@ -0,0 +1,109 @@
+# Standard Python libraries
+import asyncio
+import threading
+import time
+
+# Third-party libraries
+import pytest
+
+# Local libraries
+import collector
+from checkpoint import Checkpoint
+
+
+class StageRecorder(object):
+    # Fake stage functions that record when they run and how many run at once
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.finished = []
+
+    def stage(self, name, seconds=0.05, error=None, wait_for=None):
+
+        def function(*args):
+            with self.lock:
+                self.running += 1
+                self.max_running = max(self.max_running, self.running)
+            try:
+                if wait_for is not None:
+                    assert wait_for.wait(5)
+                time.sleep(seconds)
+                if error is not None:
+                    raise error
+                return {'stage': name, 'args': list(args)}
+            finally:
+                with self.lock:
+                    self.running -= 1
+                    self.finished.append(name)
+
+        return function
+
+
+def run(checkpoint, stages, stage_workers):
+
+    return asyncio.run(collector.run_stages(checkpoint, stages, stage_workers))
+
+
+def test_stages_receive_their_dependencies_data(tmp_path):
+
+    recorder = StageRecorder()
+    stages = {
+        'dependent': (recorder.stage('dependent'), ('arg',), ['first', 'second']),
+        'first': (recorder.stage('first', seconds=0.1), (), []),
+        'second': (recorder.stage('second'), (1,), []),
+    }
+
+    results = run(Checkpoint(str(tmp_path)), stages, stage_workers=3)
+
+    # Results are in the order the stages are listed, and a stage only runs once the stages
+    # it depends on have finished
+    assert list(results) == ['dependent', 'first', 'second']
+    assert results['dependent']['args'] == ['arg', results['first'], results['second']]
+    assert recorder.finished[-1] == 'dependent'
+
+
+@pytest.mark.parametrize('stage_workers', [1, 2, 3])
+def test_stage_workers_caps_concurrent_stages(tmp_path, stage_workers):
+
+    recorder = StageRecorder()
+    stages = {f'stage{number}': (recorder.stage(f'stage{number}'), (), [])
+              for number in range(6)}
+
+    results = run(Checkpoint(str(tmp_path)), stages, stage_workers)
+
+    assert len(results) == 6
+    assert recorder.max_running == stage_workers
+
+
+def test_failed_stage_lets_running_stages_finish_and_save(tmp_path):
+
+    recorder = StageRecorder()
+    slow_started = threading.Event()
+    slow = recorder.stage('slow', seconds=0.3)
+
+    def start_slow(*args):
+        slow_started.set()
+        return slow(*args)
+
+    stages = {
+        'slow': (start_slow, (), []),
+        'failing': (recorder.stage('failing', error=ValueError('API error'),
+                                   wait_for=slow_started), (), []),
+        'waiting': (recorder.stage('waiting'), (), []),  # never starts: no worker is free
+        'dependent': (recorder.stage('dependent'), (), ['failing']),
+    }
+    checkpoint = Checkpoint(str(tmp_path))
+
+    with pytest.raises(ValueError, match='API error'):
+        run(checkpoint, stages, stage_workers=2)
+
+    # The running stage finished and was saved before the error was raised; stages that
+    # hadn't started never ran
+    assert recorder.finished == ['failing', 'slow']
+    assert checkpoint.is_complete('slow')
+    assert checkpoint.load_stage('slow') == {'stage': 'slow', 'args': []}
+    assert not checkpoint.is_complete('failing')
+    assert not checkpoint.is_complete('waiting')
@@ -0,0 +1,180 @@
+# Standard Python libraries
+import copy
+
+# Local libraries
+from generated_content import NOW, generate_content
+import sqlite_store
+
+
+def stored_ids(directory, table, id_field):
+
+    connection = sqlite_store.connect(str(directory))
+    ids = {row[0] for row in connection.execute(f"SELECT {id_field} FROM {table}")}
+    connection.close()
+    return ids
+
+
+def content(question_count=50):
+
+    questions, articles, tags, users, communities = generate_content(
+        1, question_count=question_count)
+    return {'questions': questions, 'articles': articles, 'tags': tags, 'users': users}
+
+
+def test_upsert_updates_questions_and_replaces_their_answers(tmp_path):
+
+    api_data = content()
+    sqlite_store.upsert_api_data(api_data, str(tmp_path))
+
+    question = copy.deepcopy(next(question for question in api_data['questions']
+                                  if len(question.get('answers', [])) > 1))
+    question['view_count'] += 1000
+    question['answers'] = question['answers'][:1]
+    sqlite_store.upsert_api_data({'questions': [question]}, str(tmp_path))
+
+    stored = next(stored for stored in sqlite_store.stream_questions(str(tmp_path))
+                  if stored['question_id'] == question['question_id'])
+    assert stored['view_count'] == question['view_count']
+    assert [answer['answer_id'] for answer in stored['answers']] == [
+        question['answers'][0]['answer_id']]
+    assert len(stored_ids(tmp_path, 'questions', 'question_id')) == len(api_data['questions'])
+
+
+def test_full_collection_removes_deleted_content(tmp_path):
+
+    api_data = content()
+    sqlite_store.upsert_api_data(api_data, str(tmp_path))
+
+    deleted_question = next(question for question in api_data['questions']
+                            if question.get('answers') and question.get('comments'))
+    remaining = {
+        'questions': [question for question in api_data['questions']
+                      if question is not deleted_question],
+        'articles': api_data['articles'][1:],
+        'users': api_data['users'][1:],
+    }
+    sqlite_store.upsert_api_data(remaining, str(tmp_path),
+                                 complete_datasets=['questions', 'articles', 'users'])
+
+    question_id = deleted_question['question_id']
+    assert question_id not in stored_ids(tmp_path, 'questions', 'question_id')
+    for table in ['question_tags', 'answers', 'comments']:
+        assert question_id not in stored_ids(tmp_path, table, 'question_id')
+    assert stored_ids(tmp_path, 'articles', 'article_id') == {
+        article['article_id'] for article in remaining['articles']}
+    assert api_data['articles'][0]['article_id'] not in stored_ids(tmp_path, 'article_tags',
+                                                                    'article_id')
+    assert stored_ids(tmp_path, 'users', 'user_id') == {
+        user['user_id'] for user in remaining['users']}
+
+
+def test_incremental_collection_keeps_stored_content(tmp_path):
+
+    api_data = content()
+    sqlite_store.upsert_api_data(api_data, str(tmp_path))
+
+    # Only the users were collected in full
+    sqlite_store.upsert_api_data({'questions': api_data['questions'][:5],
+                                  'articles': [], 'users': api_data['users']},
+                                 str(tmp_path), complete_datasets=['users'])
+
+    assert len(stored_ids(tmp_path, 'questions', 'question_id')) == len(api_data['questions'])
+    assert len(stored_ids(tmp_path, 'articles', 'article_id')) == len(api_data['articles'])
+
+
+def test_date_range_collection_only_removes_content_in_range(tmp_path):
+
+    api_data = content()
+    sqlite_store.upsert_api_data(api_data, str(tmp_path))
+
+    from_date = NOW - 365 * 86400
+    in_range = [question for question in api_data['questions']
+                if question['creation_date'] >= from_date]
+    sqlite_store.upsert_api_data({'questions': in_range[1:]}, str(tmp_path),
+                                 complete_datasets=['questions'], from_date=from_date)
+
+    assert stored_ids(tmp_path, 'questions', 'question_id') == {
+        question['question_id'] for question in api_data['questions']
+        if question is not in_range[0]}
+
+
+def stored_fields(question):
+    # The fields of a question (and its answers and comments) that the database keeps
+
+    def post(item, fields):
+        return {field: item[field] for field in fields + ['owner', 'creation_date']
+                if field in item}
+
+    stored = post(question, ['question_id', 'last_activity_date', 'view_count',
+                             'up_vote_count', 'down_vote_count', 'answer_count',
+                             'comment_count', 'link', 'tags'])
+    if question.get('comments'):
+        stored['comments'] = [post(comment, ['comment_id'])
+                              for comment in question['comments']]
+    if question.get('answers'):
+        stored['answers'] = []
+        for answer in question['answers']:
+            stored_answer = post(answer, ['answer_id', 'question_id', 'is_accepted',
+                                          'up_vote_count', 'down_vote_count'])
+            if answer.get('comments'):
+                stored_answer['comments'] = [post(comment, ['comment_id'])
+                                             for comment in answer['comments']]
+            stored['answers'].append(stored_answer)
+
+    return stored
+
+
+def test_stream_questions_rebuilds_nested_questions(tmp_path):
+
+    api_data = content(question_count=200)
+    sqlite_store.upsert_api_data(api_data, str(tmp_path))
+
+    streamed = list(sqlite_store.stream_questions(str(tmp_path)))
+
+    assert [stored_fields(question) for question in streamed] == [
+        stored_fields(question) for question in api_data['questions']]
+
+
+def test_stream_questions_and_articles_filters(tmp_path):
+
+    api_data = content(question_count=200)
+    sqlite_store.upsert_api_data(api_data, str(tmp_path))
+    tag = api_data['questions'][0]['tags'][0]
+    from_date, to_date = NOW - 2 * 365 * 86400, NOW - 365 * 86400
+
+    def expected(items, id_field):
+        return [item[id_field] for item in items if tag in item['tags'] and
+                from_date <= item['creation_date'] <= to_date]
+
+    questions = list(sqlite_store.stream_questions(str(tmp_path), tag, from_date, to_date))
+    articles = list(sqlite_store.stream_articles(str(tmp_path), tag, from_date, to_date))
+
+    assert [question['question_id'] for question in questions] == expected(
+        api_data['questions'], 'question_id')
+    assert [article['article_id'] for article in articles] == expected(
+        api_data['articles'], 'article_id')
+    assert questions and all(stored_fields(question) in [
+        stored_fields(api_question) for api_question in api_data['questions']]
+        for question in questions)
+    assert all(article['tags'] == api_article['tags'] for article in articles
+               for api_article in api_data['articles']
+               if api_article['article_id'] == article['article_id'])
+
+
+def test_read_kr_columns_matches_content(tmp_path):
+
+    api_data = content(question_count=200)
+    sqlite_store.upsert_api_data(api_data, str(tmp_path))
+
+    creation_dates, view_counts, deleted_flags = sqlite_store.read_kr_columns(str(tmp_path))
+
+    # A question counts as deleted if its owner or any of its answers' owners was deleted
+    expected = [(question['creation_date'], question['view_count'],
+                 'user_id' not in question['owner'] or any(
+                     'user_id' not in answer['owner'] for answer in question.get('answers', [])))
+                for question in api_data['questions']]
+    expected += [(article['creation_date'], article['view_count'],
+                  'user_id' not in article['owner']) for article in api_data['articles']]
+    assert sorted(zip(creation_dates.tolist(), view_counts.tolist(),
+                      deleted_flags.tolist())) == sorted(expected)
+    assert any(deleted_flags) and not all(deleted_flags)
@@ -0,0 +1,64 @@
+# Standard Python libraries
+import json
+
+# Third-party libraries
+import pytest
+
+# Local libraries
+import reports
+
+ITEMS = [{'id': item_id, 'score': item_id / 2, 'body': 'x' * 50, 'tags': ['a', 'b']}
+         for item_id in range(200)]
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+
+    monkeypatch.setattr(reports, 'STREAM_CHUNK_SIZE', 64)
+    monkeypatch.setattr(reports, 'MAX_ITEM_SIZE', 1024)
+
+
+def write_file(directory, text):
+
+    with open(directory / 'items.json', 'w') as f:
+        f.write(text)
+
+
+@pytest.mark.parametrize('indent', [None, 4])
+def test_items_are_streamed(tmp_path, small_chunks, indent):
+
+    write_file(tmp_path, json.dumps(ITEMS, indent=indent))
+
+    assert list(reports.stream_json('items', str(tmp_path))) == ITEMS
+    assert list(reports.stream_json('items', str(tmp_path), exclude_fields=['body'])) == [
+        {key: value for key, value in item.items() if key != 'body'} for item in ITEMS]
+
+
+def test_nested_arrays_are_flattened(tmp_path, small_chunks, monkeypatch):
+
+    write_file(tmp_path, json.dumps([ITEMS[:50], [], ITEMS[50], [[ITEMS[51]], ITEMS[52:]]]))
+
+    # The nested arrays are larger than MAX_ITEM_SIZE, but only their items are parsed whole
+    assert list(reports.stream_json('items', str(tmp_path), flatten=True)) == ITEMS
+
+    monkeypatch.setattr(reports, 'MAX_ITEM_SIZE', 1024 * 1024)
+    assert len(list(reports.stream_json('items', str(tmp_path)))) == 4
+
+
+@pytest.mark.parametrize('text', [
+    '[{"id": 1}, {"id": "' + 'x' * 100000,  # truncated in an unterminated string
+    '[{"id": 1}, {"id": 2, ' + '"key": 1, ' * 20000,  # truncated object
+    '[{"id": 1}, [' + '{"id": 2}, ' * 20000,  # nested array that's too large to flatten
+])
+def test_malformed_file_fails_without_reading_it_all(tmp_path, small_chunks, monkeypatch, text):
+
+    write_file(tmp_path, text)
+    chunks_read = []
+    read_chunk = reports.read_chunk
+    monkeypatch.setattr(reports, 'read_chunk', lambda *args: chunks_read.append(1) or
+                        read_chunk(*args))
+
+    with pytest.raises(ValueError, match='no complete item'):
+        list(reports.stream_json('items', str(tmp_path)))
+
+    assert len(chunks_read) * reports.STREAM_CHUNK_SIZE < 2 * reports.MAX_ITEM_SIZE
@@ -0,0 +1,56 @@
+# Standard Python libraries
+import json
+
+# Local libraries
+import reports
+import sqlite_store
+from sme_index import create_sme_index
+from synthetic_data import generate_data
+from tag_metrics import create_tag_metrics
+from user_metrics import create_user_metrics
+
+
+def generate(directory):
+
+    generate_data(str(directory), 2000, seed=5)
+    return {name: reports.read_json(name, str(directory))
+            for name in ['questions', 'articles', 'users', 'tags', 'communities',
+                         'reputation_history']}
+
+
+def test_post_and_comment_ids_are_unique(tmp_path):
+
+    data = generate(tmp_path)
+    questions = data['questions']
+    answers = [answer for question in questions for answer in question.get('answers', [])]
+    post_ids = ([question['question_id'] for question in questions] +
+                [answer['answer_id'] for answer in answers] +
+                [article['article_id'] for article in data['articles']])
+    assert len(post_ids) == len(set(post_ids))
+
+    comments = [(comment, post['question_id'] if post in questions else post['answer_id'])
+                for post in questions + answers for comment in post.get('comments', [])]
+    assert comments
+    assert len({comment['comment_id'] for comment, _ in comments}) == len(comments)
+    assert all(comment['post_id'] == post_id for comment, post_id in comments)
+
+
+def test_sqlite_metrics_match_json(tmp_path):
+
+    data = generate(tmp_path)
+    sqlite_store.upsert_api_data(data, str(tmp_path))
+    sme_index = create_sme_index(data['tags'])
+
+    def metrics(questions, articles, reputation_history):
+        questions, articles = list(questions), list(articles)
+        tag_metrics = create_tag_metrics(questions, articles, data['tags'], data['communities'],
+                                         sme_index)
+        user_metrics = create_user_metrics(data['users'], questions, articles, data['tags'],
+                                           sme_index, reputation_history)
+        return json.dumps([tag_metrics, user_metrics], indent=4)
+
+    json_metrics = metrics(data['questions'], data['articles'], data['reputation_history'])
+    sqlite_metrics = metrics(sqlite_store.stream_questions(str(tmp_path)),
+                             sqlite_store.stream_articles(str(tmp_path)),
+                             sqlite_store.stream_reputation_history(str(tmp_path)))
+    assert sqlite_metrics == json_metrics
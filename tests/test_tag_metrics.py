@@ -0,0 +1,59 @@
+# Standard Python libraries
+import copy
+import json
+import os
+
+# Third-party libraries
+import pytest
+
+# Local libraries
+from generated_content import generate_content
+from tag_metrics import create_tag_metrics
+
+# Output of `create_tag_metrics` before tags were indexed by name and contributors tracked in
+# sets, for the content generated with each set of options
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'fixtures',
+                             'tag_metrics_baseline.json')
+CASES = {
+    '1': {'seed': 1},
+    '2': {'seed': 2},
+    '3': {'seed': 3},
+    # First answers dated at or before their question, which the baseline counted towards the
+    # time to first answer (except for times of zero)
+    'early_answers': {'seed': 4, 'early_answers': True},
+}
+
+
+def load_baseline():
+
+    with open(BASELINE_FILE, 'r') as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_tag_metrics_match_baseline(case):
+
+    questions, articles, tags, users, communities = generate_content(**CASES[case])
+    baseline = load_baseline()[case]
+
+    tag_metrics = create_tag_metrics(questions, articles, tags, communities)
+
+    # Compared as JSON, the way tag_metrics.json is written. Percentiles other than the median
+    # were added later, so only the baseline's metrics (in the same order) are compared.
+    tag_metrics = json.loads(json.dumps(tag_metrics))
+    assert [{key: tag[key] for key in baseline_tag} for tag, baseline_tag
+            in zip(tag_metrics, baseline)] == baseline
+    assert len(tag_metrics) == len(baseline)
+    assert all([key for key in tag if key in baseline_tag] == list(baseline_tag)
+               for tag, baseline_tag in zip(tag_metrics, baseline))
+
+
+def test_tag_metrics_do_not_modify_content():
+
+    content = generate_content(1)
+    original = copy.deepcopy(content)
+    questions, articles, tags, users, communities = content
+
+    create_tag_metrics(questions, articles, tags, communities)
+
+    assert content == original
@@ -0,0 +1,66 @@
+# Standard Python libraries
+from unittest import mock
+
+# Third-party libraries
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+# Local libraries
+import throttle
+from throttle import APIRequestError, Throttle, ThrottledAdapter
+
+
+def fake_response(status_code, headers=None):
+
+    return mock.Mock(status_code=status_code, headers=headers or {})
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+
+    monkeypatch.setattr(throttle.time, 'sleep', lambda seconds: None)
+
+
+def send(adapter, responses):
+
+    request = requests.Request('GET', 'https://example.com/api').prepare()
+    with mock.patch.object(HTTPAdapter, 'send', side_effect=responses) as parent_send:
+        return adapter.send(request), parent_send
+
+
+def test_retried_responses_are_closed():
+
+    failed = [fake_response(503), fake_response(429, {'Retry-After': '1'})]
+    succeeded = fake_response(200)
+    response, parent_send = send(ThrottledAdapter(Throttle(max_retries=3)), failed + [succeeded])
+
+    assert response is succeeded
+    assert parent_send.call_count == 3
+    assert all(failure.close.called for failure in failed)
+    assert not succeeded.close.called
+
+
+def test_response_is_returned_open_once_retries_are_exhausted():
+
+    failed = [fake_response(503), fake_response(503)]
+    response, _ = send(ThrottledAdapter(Throttle(max_retries=1)), failed)
+
+    assert response is failed[-1]
+    assert failed[0].close.called
+    assert not response.close.called
+
+
+def test_exhausted_quota_only_stops_v2_calls():
+
+    shared_throttle = Throttle(max_retries=1)
+    shared_throttle.update_quota(0, 10000)
+    v2_adapter = ThrottledAdapter(shared_throttle, check_quota=True)
+    v3_adapter = ThrottledAdapter(shared_throttle)
+
+    response, _ = send(v3_adapter, [fake_response(200)])
+    assert response.status_code == 200
+
+    with pytest.raises(APIRequestError) as error:
+        send(v2_adapter, [fake_response(200)])
+    assert error.value.error_name == 'quota_exhausted'
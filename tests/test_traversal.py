@@ -0,0 +1,142 @@
+# Standard Python libraries
+import datetime
+import json
+import os
+import statistics
+import time
+
+# Third-party libraries
+import pytest
+
+# Local libraries
+from generated_content import NOW, generate_content
+import knowledge_reuse_metrics
+from knowledge_reuse_metrics import KnowledgeReuseMetrics
+from tag_metrics import TagMetrics
+from test_tag_metrics import CASES, load_baseline as load_tag_baseline
+from traversal import traverse, validate_user_id
+from user_metrics import UserMetrics
+
+# Output of `create_user_metrics` and `create_kr_metrics` before the metrics shared a single
+# traversal, when each of them walked the content separately, for the same content as the tag
+# metrics baseline. Both depend on the current time, which was one hour after `NOW`.
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'fixtures', 'metrics_baseline.json')
+BASELINE_TIME = NOW + 3600
+
+
+class FrozenDatetime(datetime.datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls.fromtimestamp(BASELINE_TIME, tz)
+
+
+@pytest.fixture
+def baseline_time(monkeypatch):
+
+    monkeypatch.setattr(time, 'time', lambda: BASELINE_TIME)
+    monkeypatch.setattr(knowledge_reuse_metrics, 'datetime', FrozenDatetime)
+
+
+def load_baseline():
+
+    with open(BASELINE_FILE, 'r') as f:
+        return json.load(f)
+
+
+def expected_user_metrics(baseline_rows, questions, tags):
+    # Two user metrics were changed on purpose after the baseline, so they're taken from
+    # reference implementations instead:
+    # - 'SME Tags' includes the members of SME groups, which the baseline missed
+    # - 'Median Answer Time (Hours)' leaves out every answer time of zero or less; the baseline
+    #   skipped some of them when several were next to each other
+
+    sme_tags = {}
+    for tag in tags:
+        sme_ids = [sme['id'] for sme in tag['smes']['users']] + [
+            user['id'] for group in tag['smes']['userGroups'] for user in group['users']]
+        for user_id in set(sme_ids):
+            sme_tags.setdefault(user_id, set()).add(tag['name'])
+
+    answer_times = {}
+    for question in questions:
+        for answer in question.get('answers', []):
+            hours = (answer['creation_date'] - question['creation_date'])/60/60
+            owner = answer['owner']
+            user_id = owner.get('user_id', owner['display_name'].replace('user', ''))
+            if hours > 0:
+                answer_times.setdefault(str(user_id), []).append(hours)
+
+    expected_rows = []
+    for row in baseline_rows:
+        times = answer_times.get(str(row['User ID']))
+        expected_rows.append(dict(
+            row, **{'SME Tags': sorted(sme_tags.get(row['User ID'], [])),
+                    'Median Answer Time (Hours)': round(statistics.median(times), 2)
+                    if times else ''}))
+
+    return expected_rows
+
+
+def matches_baseline(rows, baseline_rows):
+    # Metrics added later (e.g. percentiles) are left out of the comparison; the baseline's
+    # metrics must all be there, with the same values and in the same order
+
+    rows = json.loads(json.dumps(rows))  # compared as JSON, the way the metrics are written
+    return len(rows) == len(baseline_rows) and all(
+        [key for key in row if key in baseline_row] == list(baseline_row) and
+        all(row[key] == value for key, value in baseline_row.items())
+        for row, baseline_row in zip(rows, baseline_rows))
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_single_traversal_matches_separate_passes(case, baseline_time):
+
+    questions, articles, tags, users, communities = generate_content(**CASES[case])
+    baseline = load_baseline()[case]
+
+    accumulators = [TagMetrics(tags, communities), UserMetrics(users, tags),
+                    KnowledgeReuseMetrics()]
+    traverse(questions, articles, accumulators)
+    tag_metrics, user_metrics, kr_metrics = [accumulator.result()
+                                             for accumulator in accumulators]
+
+    assert matches_baseline(tag_metrics, load_tag_baseline()[case])
+    for row in user_metrics:
+        row['SME Tags'] = sorted(row['SME Tags'].split(', ')) if row['SME Tags'] else []
+    assert matches_baseline(user_metrics, expected_user_metrics(baseline['user_metrics'],
+                                                                questions, tags))
+    assert matches_baseline(kr_metrics, baseline['kr_metrics'])
+
+
+@pytest.mark.parametrize('owner, user_id', [
+    ({'user_id': 5, 'display_name': 'User 5'}, 5),
+    ({'display_name': 'user123'}, 123),
+    ({'display_name': 'username'}, 'username'),
+    ({'display_name': 'userX'}, 'userX'),
+    ({'display_name': 'user'}, 'user'),
+    ({'display_name': 'superuser5'}, 'superuser5'),
+    ({'display_name': 'user5 (old account)'}, 'user5 (old account)'),
+    ({'display_name': 'weird name'}, 'weird name'),
+])
+def test_validate_user_id(owner, user_id):
+
+    assert validate_user_id(owner) == user_id
+
+
+def test_deleted_owner_names_are_not_merged_with_users():
+
+    questions, articles, tags, users, communities = generate_content(1, question_count=0)
+    tag = tags[0]['name']
+    owners = [{'user_id': 5, 'display_name': 'User 5'}, {'display_name': 'superuser5'},
+              {'display_name': 'username'}, {'display_name': 'userX'}]
+    questions = [{'question_id': index, 'owner': owner, 'creation_date': NOW,
+                  'view_count': 1, 'up_vote_count': 0, 'down_vote_count': 0, 'answer_count': 0,
+                  'tags': [tag]} for index, owner in enumerate(owners)]
+
+    accumulators = [TagMetrics(tags, communities), UserMetrics(users, tags)]
+    traverse(questions, [], accumulators)
+    tag_metrics, user_metrics = [accumulator.result() for accumulator in accumulators]
+
+    assert next(row for row in tag_metrics if row['tag_name'] == tag)['unique_askers'] == 4
+    assert {row['User ID'] for row in user_metrics if row['Questions']} == {
+        5, 'superuser5', 'username', 'userX'}
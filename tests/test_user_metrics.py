@@ -0,0 +1,133 @@
+# Standard Python libraries
+import math
+import random
+import statistics
+
+# Third-party libraries
+from hypothesis import given, settings, strategies as st
+
+# Local libraries
+from quantiles import MAX_EXACT_VALUES, RELATIVE_ACCURACY
+from user_metrics import create_user_metrics
+
+USER_COUNT = 20
+
+
+def generate_content(seed, question_count):
+    # A few prolific answerers account for most answers; some answers have a creation date at
+    # or before their question's (e.g. clock skew or imported content)
+
+    rng = random.Random(seed)
+    users = [{'user_id': user_id, 'display_name': f'User {user_id}', 'reputation': user_id,
+              'creation_date': 1600000000, 'last_access_date': 1700000000, 'email': '',
+              'title': '', 'department': '', 'external_id': '', 'account_id': user_id,
+              'moderator': False}
+             for user_id in range(1, USER_COUNT + 1)]
+
+    questions = []
+    for question_id in range(question_count):
+        creation_date = 1700000000 + question_id * 100
+        answers = []
+        for _ in range(rng.randint(0, 4)):
+            answerer_id = min(int(rng.paretovariate(1)), USER_COUNT)
+            answers.append({
+                'owner': {'user_id': answerer_id, 'display_name': f'User {answerer_id}'},
+                'creation_date': creation_date + rng.choice(
+                    [0, -60, int(rng.expovariate(1 / 7200))]),
+                'is_accepted': False, 'up_vote_count': 0, 'down_vote_count': 0
+            })
+        questions.append({'owner': {'user_id': 1, 'display_name': 'User 1'},
+                          'creation_date': creation_date, 'answer_count': len(answers),
+                          'answers': answers, 'up_vote_count': 0, 'down_vote_count': 0,
+                          'tags': []})
+
+    return users, questions
+
+
+def reference_answer_times(questions):
+    # Reference implementation: every answer's response time, keeping only positive times
+
+    answer_times = {}
+    for question in questions:
+        for answer in question['answers']:
+            hours = (answer['creation_date'] - question['creation_date'])/60/60
+            if hours > 0:
+                answer_times.setdefault(answer['owner']['user_id'], []).append(hours)
+
+    return answer_times
+
+
+def test_median_answer_times_match_reference():
+
+    users, questions = generate_content(seed=1, question_count=5000)
+    answer_times = reference_answer_times(questions)
+
+    user_metrics = create_user_metrics(users, questions, [], [])
+
+    for user in user_metrics:
+        times = answer_times.get(user['User ID'])
+        if not times:
+            assert user['Median Answer Time (Hours)'] == ''
+        elif len(times) <= 1000:  # exact below the sketch threshold
+            assert user['Median Answer Time (Hours)'] == round(statistics.median(times), 2)
+        else:
+            median = statistics.median(times)
+            assert abs(user['Median Answer Time (Hours)'] - median) <= 0.01 * median + 0.01
+
+    # The most prolific answerer has enough answers for the sketch to be used
+    assert max(len(times) for times in answer_times.values()) > 1000
+
+
+def reference_percentile(times, quantile):
+    # Percentile of the sorted times, interpolated between the two closest ranks
+
+    times = sorted(times)
+    rank = quantile * (len(times) - 1)
+    lower = math.floor(rank)
+    upper = min(lower + 1, len(times) - 1)
+    return times[lower] * (1 - (rank - lower)) + times[upper] * (rank - lower)
+
+
+@settings(max_examples=30, deadline=None)
+@given(st.integers(min_value=0, max_value=2**32),
+       st.integers(min_value=1, max_value=3 * MAX_EXACT_VALUES))
+def test_answer_time_percentiles_match_reference(seed, answer_count):
+    # One prolific answerer, whose answers include runs of adjacent answers dated at or before
+    # their question: the cleanup this replaced skipped every other one of those
+
+    rng = random.Random(seed)
+    users, _ = generate_content(seed, 0)
+    questions = []
+    while len(questions) < answer_count:
+        if rng.random() < 0.1:
+            offsets = [rng.choice([0, -60, -3600]) for _ in range(rng.randint(2, 6))]
+        else:
+            offsets = [int(rng.lognormvariate(8, 2)) + 1]
+        for offset in offsets:
+            creation_date = 1700000000 + len(questions) * 100
+            questions.append({
+                'owner': {'user_id': 1, 'display_name': 'User 1'},
+                'creation_date': creation_date, 'answer_count': 1, 'up_vote_count': 0,
+                'down_vote_count': 0, 'tags': [],
+                'answers': [{'owner': {'user_id': 2, 'display_name': 'User 2'},
+                             'creation_date': creation_date + offset, 'is_accepted': False,
+                             'up_vote_count': 0, 'down_vote_count': 0}]
+            })
+    times = reference_answer_times(questions).get(2, [])
+
+    user = next(user for user in create_user_metrics(users, questions, [], [])
+                if user['User ID'] == 2)
+
+    if not times:
+        assert user['Median Answer Time (Hours)'] == ''
+        return
+    columns = {0.5: 'Median Answer Time (Hours)', 0.9: 'P90 Answer Time (Hours)',
+               0.99: 'P99 Answer Time (Hours)'}
+    for quantile, column in columns.items():
+        if len(times) <= MAX_EXACT_VALUES:
+            expected = statistics.median(times) if quantile == 0.5 else \
+                reference_percentile(times, quantile)
+            assert user[column] == round(expected, 2)
+        else:
+            expected = sorted(times)[int(quantile * (len(times) - 1))]
+            assert abs(user[column] - expected) <= RELATIVE_ACCURACY * expected + 0.005
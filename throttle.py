@@ -0,0 +1,216 @@
+# Standard Python libraries
+import logging
+import random
+import re
+import threading
+import time
+
+# Third-party libraries
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+MAX_RETRY_WAIT = 300  # seconds; longer waits (e.g. an exhausted daily quota) fail immediately
+QUOTA_WARNING_RATIO = 0.1  # warn when less than 10% of the API quota remains
+
+
+class APIRequestError(Exception):
+    """Raised when an API request fails and can't be retried (or retries are exhausted), so
+    that incomplete data is never mistaken for a complete collection."""
+
+    def __init__(self, message, status_code=None, error_name=None, error_message=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error_name = error_name
+        self.error_message = error_message
+
+
+class Throttle(object):
+    def __init__(self, calls_per_second=None, burst=None, max_retries=3):
+        """
+        Paces API calls and coordinates backoff across every worker (and client) it's shared
+        with, so that the combined request rate stays within what the API allows.
+
+        * Token bucket: calls are spread at `calls_per_second`, with short bursts of up to
+            `burst` calls. The rate is halved whenever the API throttles a request and recovers
+            gradually as calls succeed.
+        * Backoff: a backoff request (or Retry-After header) pauses all workers until it has
+            elapsed, not just the worker that received it.
+        * Quota: the remaining API quota reported by API v2.3 is tracked, and v2.3 calls stop
+            with an error once it has been used up rather than failing one after another. The
+            quota doesn't apply to API v3, so its calls carry on.
+
+        Args:
+            calls_per_second (float): maximum request rate; None for no pacing
+            burst (int): number of calls that can be made at once before pacing applies;
+                defaults to one second's worth of calls
+            max_retries (int): retries for each request that fails with a transient error
+        """
+        self.max_rate = calls_per_second
+        self.rate = calls_per_second
+        self.capacity = burst or (max(calls_per_second, 1) if calls_per_second else 1)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.max_retries = max_retries
+
+        self.backoff_until = 0
+        self.quota_remaining = None
+        self.quota_max = None
+        self.quota_warned = False
+        self.lock = threading.Lock()
+
+    def check_quota(self):
+
+        if self.quota_remaining == 0:
+            logging.error(f"The API quota ({self.quota_max} requests) has been used up. Wait "
+                          "for it to reset, then run the script again with --resume.")
+            raise APIRequestError("API quota exhausted", error_name='quota_exhausted')
+
+    def wait(self):
+
+        # Reserve a token (which may put the bucket in debt), then sleep outside of the lock
+        # until the token would have been available
+        with self.lock:
+            now = time.monotonic()
+            wait_time = max(self.backoff_until - now, 0)
+            if self.rate:
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                self.tokens -= 1
+                if self.tokens < 0:
+                    wait_time = max(wait_time, -self.tokens / self.rate)
+
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    def set_backoff(self, backoff_time):
+
+        logging.warning(f"API backoff requested. Pausing API calls for {backoff_time} seconds...")
+        with self.lock:
+            self.backoff_until = max(self.backoff_until, time.monotonic() + backoff_time)
+
+    def record_success(self):
+
+        # Additive increase: every successful call recovers 1% of the configured rate
+        if self.rate and self.rate < self.max_rate:
+            with self.lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+    def record_throttled(self):
+
+        # Multiplicative decrease, down to a floor of one call every ten seconds
+        if self.rate:
+            with self.lock:
+                self.rate = max(self.rate / 2, 0.1)
+            logging.warning(f"API throttling detected. Reducing request rate to "
+                            f"{self.rate:.1f} calls per second")
+
+    def update_quota(self, quota_remaining, quota_max=None):
+
+        if quota_remaining is None:
+            return
+
+        self.quota_remaining = quota_remaining
+        self.quota_max = quota_max
+        if quota_max and not self.quota_warned and \
+                quota_remaining < quota_max * QUOTA_WARNING_RATIO:
+            self.quota_warned = True
+            logging.warning(f"Only {quota_remaining} of {quota_max} API requests remain in the "
+                            "daily quota")
+
+    def retry_delay(self, attempt):
+
+        # Exponential backoff with full jitter, so workers that failed together don't all
+        # retry at the same moment
+        return random.uniform(0, min(2 ** attempt, 60))
+
+
+class ThrottledAdapter(HTTPAdapter):
+    def __init__(self, throttle, check_quota=False, **kwargs):
+        """
+        A transport adapter that sends every request of a session through a `Throttle`, and
+        retries transient failures: connection errors, HTTP 429 and 5xx responses, and API
+        v2.3 throttle violations. Because it works at the session level, it applies to every
+        call made by a client, including clients from other libraries (e.g. API v3).
+
+        Responses that are still failing once the retries are exhausted are returned as-is, so
+        the client can report the error.
+
+        Args:
+            throttle (Throttle): throttle shared by the clients of the same instance
+            check_quota (bool): whether the session's calls count towards the API v2.3 quota,
+                and so stop once it has been used up
+        """
+        # Retries are handled here rather than by urllib3, so that they respect the throttle
+        super().__init__(max_retries=0, **kwargs)
+        self.throttle = throttle
+        self.check_quota = check_quota
+
+    def send(self, request, **kwargs):
+
+        for attempt in range(1, self.throttle.max_retries + 2):
+            if self.check_quota:
+                self.throttle.check_quota()
+            self.throttle.wait()
+            try:
+                response = super().send(request, **kwargs)
+            except requests.exceptions.SSLError:
+                raise  # not transient; the clients handle these themselves
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt > self.throttle.max_retries:
+                    raise
+                retry_time = self.throttle.retry_delay(attempt)
+                logging.warning(f"{type(e).__name__} for {request.url}. "
+                                f"Retrying in {retry_time:.1f} seconds...")
+                time.sleep(retry_time)
+                continue
+
+            retry_time, throttled = self.get_retry_time(response, attempt)
+            if retry_time is None:
+                self.throttle.record_success()
+                return response
+            if attempt > self.throttle.max_retries or retry_time > MAX_RETRY_WAIT:
+                return response
+
+            # The response is discarded, so its connection is released back to the pool before
+            # waiting, rather than being held until the response is garbage collected
+            response.close()
+            if throttled:
+                # Throttling applies to every worker, so all of them pause and slow down
+                self.throttle.record_throttled()
+                self.throttle.set_backoff(retry_time)
+            else:
+                logging.warning(f"HTTP {response.status_code} response from {request.url}. "
+                                f"Retrying in {retry_time:.1f} seconds...")
+                time.sleep(retry_time)
+
+        return response
+
+    def get_retry_time(self, response, attempt):
+        # Returns how long to wait before retrying the response (None if it shouldn't be
+        # retried), and whether the retry is due to throttling
+
+        if response.status_code == 400:
+            # API v2.3 reports throttle violations as HTTP 400, with the wait time in the message
+            # https://api.stackexchange.com/docs/throttle
+            try:
+                error = response.json()
+            except ValueError:
+                return None, False
+            if error.get('error_name') != 'throttle_violation':
+                return None, False
+            match = re.search(r'available in (\d+) seconds', error.get('error_message', ''))
+            return (int(match.group(1)) + 1 if match else self.throttle.retry_delay(attempt),
+                    True)
+
+        if response.status_code not in RETRY_STATUS_CODES:
+            return None, False
+
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            retry_time = int(retry_after)
+        else:
+            retry_time = self.throttle.retry_delay(attempt)
+
+        return retry_time, response.status_code == 429
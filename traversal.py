@@ -0,0 +1,88 @@
+# Standard Python libraries
+import re
+
+DELETED_USER_NAME = re.compile(r'user(\d+)')  # display name of a deleted user, e.g. 'user123'
+
+
+def traverse(questions, articles, accumulators):
+    """
+    Visits every question, answer, comment, and article exactly once, passing each of them
+    (with its owner's user ID already resolved) to every accumulator. Metrics that are
+    calculated this way share a single pass over the content, no matter how many there are.
+
+    Content is visited in this order: each question, then each of its answers followed by the
+    answer's comments, then the question's comments; then each article.
+
+    Args:
+        questions (iterable): questions, with their answers and comments nested
+        articles (iterable): articles
+        accumulators (list): objects implementing the `Accumulator` methods
+    """
+    for question in questions:
+        asker_id = validate_user_id(question['owner'])
+        for accumulator in accumulators:
+            accumulator.add_question(question, asker_id)
+
+        for answer in question.get('answers', []):
+            answerer_id = validate_user_id(answer['owner'])
+            for accumulator in accumulators:
+                accumulator.add_answer(answer, answerer_id, question)
+
+            for comment in answer.get('comments', []):
+                commenter_id = validate_user_id(comment['owner'])
+                for accumulator in accumulators:
+                    accumulator.add_comment(comment, commenter_id, answer, question)
+
+        for comment in question.get('comments', []):
+            commenter_id = validate_user_id(comment['owner'])
+            for accumulator in accumulators:
+                accumulator.add_comment(comment, commenter_id, question, question)
+
+    for article in articles:
+        author_id = validate_user_id(article['owner'])
+        for accumulator in accumulators:
+            accumulator.add_article(article, author_id)
+
+
+class Accumulator(object):
+    """
+    Base class for metrics calculated by `traverse`. Subclasses override the methods for the
+    content they need; the rest are ignored. `result` is called once the traversal is done.
+    """
+
+    def add_question(self, question, asker_id):
+        pass
+
+    def add_answer(self, answer, answerer_id, question):
+        pass
+
+    def add_comment(self, comment, commenter_id, post, question):
+        # `post` is the question or answer the comment was made on
+        pass
+
+    def add_article(self, article, author_id):
+        pass
+
+    def result(self):
+        raise NotImplementedError
+
+
+def validate_user_id(user):
+    """
+    Checks to see if a user_id is present. If not, the user has been deleted. In this case, the
+    user_id can be extracted from the display_name. For example, if a deleted user's display_name
+    is 'user123', the user_id will be 123. Any other display name (e.g. 'superuser5') is used as
+    the ID as-is, so it can't be mistaken for the ID of another user."""
+
+    try:
+        user_id = user['user_id']
+    except KeyError:  # if user_id is not present, the user was deleted
+        match = DELETED_USER_NAME.fullmatch(user['display_name'])
+        if match:
+            user_id = int(match.group(1))
+        else:
+            # This shouldn't happen, but if it does, the user_id will be the display name
+            # This seems to only happen in the internal testing environment
+            user_id = user['display_name']
+
+    return user_id
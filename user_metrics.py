@@ -1,56 +1,194 @@
 # Standard Python libraries
 import time
-import statistics
 
+# Local libraries
+from quantiles import QuantileSketch
+from sme_index import create_sme_index
+from traversal import Accumulator, traverse
+
+
+def create_user_metrics(users, questions, articles, tags, sme_index=None,
+                        reputation_history=()):
+
+    user_metrics = UserMetrics(users, tags, sme_index, reputation_history)
+    traverse(questions, articles, [user_metrics])
+
+    return user_metrics.result()
+
+
+class UserMetrics(Accumulator):
+    def __init__(self, users, tags, sme_index=None, reputation_history=()):
+        """
+        Calculates user metrics from the questions, answers, comments, and articles visited by
+        `traverse`. Users that aren't in the user list (i.e. deleted users) are added as their
+        content is found. Only running totals are kept for each user, so the memory used
+        doesn't grow with the amount of content.
+
+        Args:
+            users (list): users from the API
+            tags (list): tags from the API, with their SMEs
+            sme_index (dict): SME user IDs mapped to tag names, as created by `create_sme_index`
+            reputation_history (iterable): reputation history events, aggregated once the
+                traversal is done
+        """
+        if sme_index is None:
+            sme_index = create_sme_index(tags)
+
+        self.users = [UserRecord(user) for user in users]
+        self.user_index = create_user_index(self.users)
+        self.users = process_tags(self.users, self.user_index, sme_index)
+        self.reputation_history = reputation_history
+
+    def add_question(self, question, asker_id):
+
+        user = get_user(self.users, self.user_index, asker_id, question['owner']['display_name'])
+        user.question_count += 1
+        user.question_upvotes += question['up_vote_count']
+        user.question_downvotes += question['down_vote_count']
+        if question['answer_count'] == 0:
+            user.questions_with_no_answers += 1
+
+    def add_answer(self, answer, answerer_id, question):
+
+        user = get_user(self.users, self.user_index, answerer_id,
+                        answer['owner']['display_name'])
+        user.answer_count += 1
+        user.answer_upvotes += answer['up_vote_count']
+        user.answer_downvotes += answer['down_vote_count']
+        if answer['is_accepted']:
+            user.answers_accepted += 1
+        # Answers dated at or before their question (e.g. clock skew) aren't counted. They're
+        # left out as each answer is seen, in a single pass, rather than removed afterwards.
+        answer_response_time_hours = (answer['creation_date'] - question['creation_date'])/60/60
+        if answer_response_time_hours > 0:
+            user.answer_response_times.add(answer_response_time_hours)
+
+    def add_comment(self, comment, commenter_id, post, question):
+
+        user = get_user(self.users, self.user_index, commenter_id,
+                        comment['owner']['display_name'])
+        user.comment_count += 1
 
-def create_user_metrics(users, questions, articles, tags):
+    def add_article(self, article, author_id):
 
-    users = add_new_user_fields(users)
-    users = process_tags(users, tags)
-    users = process_questions(users, questions)
-    users = process_articles(users, articles)
-    # users = process_reputation_history(users, api_data['reputation_history'])
-    users = process_users(users)
+        user = get_user(self.users, self.user_index, author_id, article['owner']['display_name'])
+        user.article_count += 1
+        user.article_upvotes += article['score']
+
+        # As of 2023.05.23, Article comments are slightly innaccurate due to a bug in the API
+        # if article.get('comments'):
+        #     for comment in article['comments']:
+        #         commenter_id = validate_user_id(comment)
+        #         tag_contributors[tag]['commenters'] = add_user_to_list(
+        #             commenter_id, tag_contributors[tag]['commenters']
+        #         )
+
+    def result(self):
+
+        users = process_reputation_history(self.users, self.user_index, self.reputation_history)
+        users = process_users(users)
+
+        return select_report_fields(users)
+
+    def reputation_over_time(self):
+        # Only available once `result` has aggregated the reputation history
+
+        return create_reputation_over_time(self.users)
+
+
+class UserRecord(object):
+    # Running totals for a user. Slots keep each record small, and the user's questions,
+    # answers, articles, and comments are counted as they're visited rather than retained.
+    __slots__ = (
+        'user', 'question_count', 'questions_with_no_answers', 'question_upvotes',
+        'question_downvotes', 'answer_count', 'answer_upvotes', 'answer_downvotes',
+        'answers_accepted', 'answer_response_times', 'answer_response_time_median',
+        'answer_response_time_p90', 'answer_response_time_p99',
+        'article_count', 'article_upvotes', 'comment_count', 'total_upvotes', 'total_downvotes',
+        'net_reputation', 'reputation_by_month', 'sme_tags', 'account_longevity_days',
+        'account_inactivity_days', 'account_status'
+    )
+
+    def __init__(self, user, account_status=None):
+
+        self.user = user  # the user's profile, as returned by the API
+        for counter in ('question_count', 'questions_with_no_answers', 'question_upvotes',
+                        'question_downvotes', 'answer_count', 'answer_upvotes',
+                        'answer_downvotes', 'answers_accepted', 'answer_response_time_median',
+                        'answer_response_time_p90', 'answer_response_time_p99', 'article_count',
+                        'article_upvotes', 'comment_count', 'total_upvotes', 'total_downvotes',
+                        'net_reputation'):
+            setattr(self, counter, 0)
+        # Distribution of the hours from question to answer, for the user's answers
+        self.answer_response_times = QuantileSketch()
+        self.reputation_by_month = {}
+        self.sme_tags = []
+
+        if account_status is not None:  # deleted users don't have account dates
+            self.account_longevity_days = ''
+            self.account_inactivity_days = ''
+            self.account_status = account_status
+            return
+
+        self.account_longevity_days = round(
+            (time.time() - user['creation_date'])/60/60/24)
+        self.account_inactivity_days = round(
+            (time.time() - user['last_access_date'])/60/60/24)
+
+        try:
+            if user['is_deactivated']:
+                self.account_status = 'Deactivated'
+            else:
+                self.account_status = 'Active'
+        except KeyError:  # Stack Overflow Business or Basic
+            self.account_status = 'Registered'
+
+
+def select_report_fields(users):
 
     # Create a list of user dictionaries, sorted by net reputation
-    sorted_users = sorted(users, key=lambda k: k['reputation'], reverse=True)
+    sorted_users = sorted(users, key=lambda k: k.user['reputation'], reverse=True)
 
     # Select fields for the user report
     user_metrics = []
-    for user in sorted_users:
+    for record in sorted_users:
+        user = record.user
         try:
             user_metric = {
                 'User ID': user['user_id'],
                 'Display Name': user['display_name'],
                 'Reputation': user['reputation'],
-                'Account Longevity (Days)': user['account_longevity_days'],
-                'Account Inactivity (Days)': user['account_inactivity_days'],
+                'Net Reputation': record.net_reputation,
+                'Account Longevity (Days)': record.account_longevity_days,
+                'Account Inactivity (Days)': record.account_inactivity_days,
 
-                'Questions': user['question_count'],
-                'Questions With No Answers': user['questions_with_no_answers'],
-                # 'Question Upvotes': user['question_upvotes'],
-                # 'Question Downvotes': user['question_downvotes'],
+                'Questions': record.question_count,
+                'Questions With No Answers': record.questions_with_no_answers,
+                # 'Question Upvotes': record.question_upvotes,
+                # 'Question Downvotes': record.question_downvotes,
 
-                'Answers': user['answer_count'],
-                # 'Answer Upvotes': user['answer_upvotes'],
-                # 'Answer Downvotes': user['answer_downvotes'],
-                'Answers Accepted': user['answers_accepted'],
-                'Median Answer Time (Hours)': user['answer_response_time_median'],
+                'Answers': record.answer_count,
+                # 'Answer Upvotes': record.answer_upvotes,
+                # 'Answer Downvotes': record.answer_downvotes,
+                'Answers Accepted': record.answers_accepted,
+                'Median Answer Time (Hours)': record.answer_response_time_median,
+                'P90 Answer Time (Hours)': record.answer_response_time_p90,
+                'P99 Answer Time (Hours)': record.answer_response_time_p99,
 
-                'Articles': user['article_count'],
-                # 'Article Upvotes': user['article_upvotes'],
+                'Articles': record.article_count,
+                # 'Article Upvotes': record.article_upvotes,
 
-                'Comments': user['comment_count'],
+                'Comments': record.comment_count,
 
-                'Total Upvotes': user['total_upvotes'],
-                'Total Downvotes': user['total_downvotes'],
+                'Total Upvotes': record.total_upvotes,
+                'Total Downvotes': record.total_downvotes,
 
                 # 'Searches': user['searches'],
                 # 'Communities': user['communities'],
-                'SME Tags': ', '.join(user['sme_tags']),
+                'SME Tags': ', '.join(record.sme_tags),
                 # 'Watched Tags': user['watched_tags'],
 
-                'Account Status': user['account_status'],
+                'Account Status': record.account_status,
                 'Moderator': user['moderator'],
 
                 'Email': user['email'],
@@ -71,216 +209,106 @@ def create_user_metrics(users, questions, articles, tags):
     return user_metrics
 
 
-def add_new_user_fields(users):
-
-    for user in users:
-        user['questions'] = []
-        user['question_count'] = 0
-        user['questions_with_no_answers'] = 0
-        user['question_upvotes'] = 0
-        user['question_downvotes'] = 0
-
-        user['answers'] = []
-        user['answer_count'] = 0
-        user['answer_upvotes'] = 0
-        user['answer_downvotes'] = 0
-        user['answers_accepted'] = 0
-        user['answer_response_times'] = []
-        user['answer_response_time_median'] = 0
-
-        user['articles'] = []
-        user['article_count'] = 0
-        user['article_upvotes'] = 0
-
-        user['comments'] = []
-        user['comment_count'] = 0
-
-        user['total_upvotes'] = 0
-        user['reputation_history'] = []
-        user['net_reputation'] = 0
-
-        user['searches'] = []
-        user['communities'] = []
-        user['sme_tags'] = []
-        user['watched_tags'] = []
-
-        user['account_longevity_days'] = round(
-            (time.time() - user['creation_date'])/60/60/24)
-        user['account_inactivity_days'] = round(
-            (time.time() - user['last_access_date'])/60/60/24)
-
-        try:
-            if user['is_deactivated']:
-                user['account_status'] = 'Deactivated'
-            else:
-                user['account_status'] = 'Active'
-        except KeyError:  # Stack Overflow Business or Basic
-            user['account_status'] = 'Registered'
-    return users
-
-
-# def process_reputation_history(users, reputation_history):
-
-#     for user in users:
-#         for event in reputation_history:
-#             if event['user_id'] == user['user_id']:
-#                     user['reputation_history'].append(event)
-
-#     return users
-
-
-def process_tags(users, tags):
+def process_reputation_history(users, user_index, reputation_history):
     '''
-    Iterate through each tag, find the SMEs, and add the tag name to a new field
-    on the user object, indicating which tags they're a SME for
-    In some situations, a user may be listed as both an individual SME and a group SME
+    Adds up the reputation changes of each user, in total and by month (UTC), in a single pass
+    over the reputation history events. Events are never held in memory, so
+    `reputation_history` can be a stream of any size.
     '''
-    for tag in tags:
-        for user in users:
-            for sme in tag['smes']['users']:
-                if user['user_id'] == sme['id']:
-                    user['sme_tags'].append(tag['name'])
-                    continue  # if user is an individual SME, skip the group SME check
-            for sme in tag['smes']['userGroups']:
-                if user['user_id'] == sme['id']:
-                    user['sme_tags'].append(tag['name'])
-
-    return users
-
-
-def process_questions(users, questions):
-
-    for question in questions:
-        asker_id = validate_user_id(question['owner'])
-        user_index = get_user_index(users, asker_id)
-
-        if user_index is None:  # if user was deleted, add them to the list
-            deleted_user = initialize_deleted_user(asker_id, question['owner']['display_name'])
-            users.append(deleted_user)
-            user_index = get_user_index(users, asker_id)
-
-        users[user_index]['questions'].append(question)
-
-        if question.get('answers'):
-            users = process_answers(users, question['answers'], question)
+    for event in reputation_history:
+        user = user_index.get(event['user_id'])
+        if user is None:  # events of users that aren't in the user list are skipped
+            continue
 
-        if question.get('comments'):
-            users = process_comments(users, question)
+        reputation_change = event['reputation_change']
+        month = time.strftime('%Y-%m', time.gmtime(event['creation_date']))
+        user.net_reputation += reputation_change
+        user.reputation_by_month[month] = user.reputation_by_month.get(month, 0) + \
+            reputation_change
 
     return users
 
 
-def process_answers(users, answers, question):
+def create_reputation_over_time(users):
+    '''
+    Creates a monthly time series of each user's reputation changes, one row per user with any
+    reputation history and one column per month, sorted by net reputation. Requires the user
+    records to have been processed by `UserMetrics.result` first.
+    '''
+    months = sorted({month for user in users for month in user.reputation_by_month})
+    sorted_users = sorted((user for user in users if user.reputation_by_month),
+                          key=lambda k: k.net_reputation, reverse=True)
 
-    for answer in answers:
-        answerer_id = validate_user_id(answer['owner'])
-        user_index = get_user_index(users, answerer_id)
+    reputation_over_time = []
+    for user in sorted_users:
+        user_reputation = {
+            'User ID': user.user['user_id'],
+            'Display Name': user.user['display_name'],
+            'Net Reputation': user.net_reputation
+        }
+        for month in months:
+            user_reputation[month] = user.reputation_by_month.get(month, 0)
+        reputation_over_time.append(user_reputation)
 
-        if user_index is None:
-            deleted_user = initialize_deleted_user(answerer_id, answer['owner']['display_name'])
-            users.append(deleted_user)
-            user_index = get_user_index(users, answerer_id)
+    return reputation_over_time
 
-        users[user_index]['answers'].append(answer)
-        answer_response_time_hours = (answer['creation_date'] - question['creation_date'])/60/60
-        users[user_index]['answer_response_times'].append(answer_response_time_hours)
 
-        if answer.get('comments'):
-            users = process_comments(users, answer)
+def process_tags(users, user_index, sme_index):
+    '''
+    Add the names of the tags each user is a SME for to the user's record.
+    `sme_index` already maps each SME (individual or group member) to their tags, so this is
+    a single pass over the SME assignments.
+    '''
+    for user_id, tag_names in sme_index.items():
+        user = user_index.get(user_id)
+        if user is not None:  # SMEs that aren't in the user list (e.g. deleted) are skipped
+            user.sme_tags += tag_names
 
     return users
 
 
-def process_comments(users, object_with_comments):
-
-    for comment in object_with_comments['comments']:
-        commenter_id = validate_user_id(comment['owner'])
-        user_index = get_user_index(users, commenter_id)
+def process_users(users):
 
-        if user_index is None:
-            deleted_user = initialize_deleted_user(commenter_id, comment['owner']['display_name'])
-            users.append(deleted_user)
-            user_index = get_user_index(users, commenter_id)
+    for user in users:
+        # Answer times of zero or less were already left out by `add_answer`
+        if user.answer_response_times:
+            p50, p90, p99 = user.answer_response_times.quantiles(0.5, 0.9, 0.99)
+            user.answer_response_time_median = round(p50, 2)
+            user.answer_response_time_p90 = round(p90, 2)
+            user.answer_response_time_p99 = round(p99, 2)
+        else:
+            user.answer_response_time_median = ''
+            user.answer_response_time_p90 = ''
+            user.answer_response_time_p99 = ''
 
-        users[user_index]['comments'].append(comment)
+        user.total_upvotes = user.question_upvotes + user.answer_upvotes + user.article_upvotes
+        user.total_downvotes = user.question_downvotes + user.answer_downvotes
 
     return users
 
 
-def process_articles(users, articles):
-
-    for article in articles:
-        author_id = validate_user_id(article['owner'])
-        user_index = get_user_index(users, author_id)
-        if user_index is None:
-            deleted_user = initialize_deleted_user(author_id, article['owner']['display_name'])
-            users.append(deleted_user)
-            user_index = get_user_index(users, author_id)
-
-        users[user_index]['articles'].append(article)
-
-        # As of 2023.05.23, Article comments are slightly innaccurate due to a bug in the API
-        # if article.get('comments'):
-        #     for comment in article['comments']:
-        #         commenter_id = validate_user_id(comment)
-        #         tag_contributors[tag]['commenters'] = add_user_to_list(
-        #             commenter_id, tag_contributors[tag]['commenters']
-        #         )
-
-    return users
-
-
-def process_users(users):
+def create_user_index(users):
+    """
+    Creates a dictionary of user_id -> user record, so users can be looked up without scanning
+    the full user list. If a user_id appears more than once, the first user with that ID is
+    used."""
 
+    user_index = {}
     for user in users:
-        for question in user['questions']:
-            user['question_count'] += 1
-            user['question_upvotes'] += question['up_vote_count']
-            user['question_downvotes'] += question['down_vote_count']
-            if question['answer_count'] == 0:
-                user['questions_with_no_answers'] += 1
-
-        for answer in user['answers']:
-            user['answer_count'] += 1
-            user['answer_upvotes'] += answer['up_vote_count']
-            user['answer_downvotes'] += answer['down_vote_count']
-            if answer['is_accepted']:
-                user['answers_accepted'] += 1
-
-        for article in user['articles']:
-            user['article_count'] += 1
-            user['article_upvotes'] += article['score']
-
-        for comment in user['comments']:
-            user['comment_count'] += 1
-
-        # for event in user['reputation_history']:
-        #     user['net_reputation'] += event['reputation_change']
-
-        for answer_response_time in user['answer_response_times']:
-            if answer_response_time <= 0:
-                user['answer_response_times'].remove(answer_response_time)
-
-        if user['answer_response_times']:
-            user['answer_response_time_median'] = round(
-                statistics.median(user['answer_response_times']), 2)
-        else:
-            user['answer_response_time_median'] = ''
+        user_index.setdefault(user.user['user_id'], user)
 
-        user['total_upvotes'] = user['question_upvotes'] + user['answer_upvotes'] + \
-            user['article_upvotes']
-        user['total_downvotes'] = user['question_downvotes'] + user['answer_downvotes']
+    return user_index
 
-    return users
 
+def get_user(users, user_index, user_id, display_name):
 
-def get_user_index(users, user_id):
+    user = user_index.get(user_id)
+    if user is None:  # if user was deleted, add them to the list (and the index)
+        user = initialize_deleted_user(user_id, display_name)
+        users.append(user)
+        user_index[user_id] = user
 
-    for index, user in enumerate(users):
-        if user['user_id'] == user_id:
-            return index
-
-    return None  # if user is not found
+    return user
 
 
 def initialize_deleted_user(user_id, display_name):
@@ -288,68 +316,16 @@ def initialize_deleted_user(user_id, display_name):
     user = {
         'user_id': user_id,
         'display_name': f"{display_name} (DELETED)",
-
-        'questions': [],
-        'question_count': 0,
-        'questions_with_no_answers': 0,
-        'question_upvotes': 0,
-        'question_downvotes': 0,
-
-        'answers': [],
-        'answer_count': 0,
-        'answer_upvotes': 0,
-        'answer_downvotes': 0,
-        'answers_accepted': 0,
-        'answer_response_times': [],
-
-        'articles': [],
-        'article_count': 0,
-        'article_upvotes': 0,
-
-        'comments': [],
-        'comment_count': 0,
-
-        'total_upvotes': 0,
         'reputation': 0,
-        'reputation_history': [],
-        'net_reputation': 0,
-
-        'searches': [],
-        'communities': [],
-        'sme_tags': [],
-        'watched_tags': [],
-
         'moderator': '',
         'email': '',
         'title': '',
         'department': '',
         'external_id': '',
-        'account_id': '',
-        'account_longevity_days': '',
-        'account_inactivity_days': '',
-        'account_status': 'Deleted'
+        'account_id': ''
     }
 
-    return user
-
-
-def validate_user_id(user):
-    """
-    Checks to see if a user_id is present. If not, the user has been deleted. In this case, the
-    user_id can be extracted from the display_name. For example, if a deleted user's display_name
-    is 'user123', the user_id will be 123."""
-
-    try:
-        user_id = user['user_id']
-    except KeyError:  # if user_id is not present, the user was deleted
-        try:
-            user_id = int(user['display_name'].split('user')[1])
-        except IndexError:
-            # This shouldn't happen, but if it does, the user_id will be the display name
-            # This seems to only happen in the internal testing environment
-            user_id = user['display_name']
-
-    return user_id
+    return UserRecord(user, account_status='Deleted')
 
 
 # def export_to_csv(data_name, data):